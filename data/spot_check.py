@@ -8,11 +8,19 @@ import src.check as c
 import pandas as pd
 import numpy as np
 import src.make_templates as mt
+import src.birds_io as bio
+import src.checkpoints as ck
 import glob
 
-# make the dataset from code
-birds = mt.make_birds()
-c.check_birds(birds)
+BIRDS_DIR = 'assets/birds' # `birds` saved by `mt.make_birds(BIRDS_DIR)`
+REBUILD = False # True builds the dataset again even if its code, assets, and source data haven't changed
+
+# make the dataset from code, unless the saved one was made from the current inputs
+fingerprint = ck._output_fingerprint({'project_source':False, 'incremental':False}) # the defaults `mt.make_birds(BIRDS_DIR)` runs with
+if REBUILD or bio._saved_fingerprint(BIRDS_DIR) != fingerprint:
+    birds = mt.make_birds(BIRDS_DIR)
+    c.check_birds(birds)
+birds = bio.read_birds(BIRDS_DIR) # each attribute is read from disk the first time it's used
 birds = c.validate_db(birds, 10, True)
 
 
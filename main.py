@@ -1,11 +1,30 @@
 """This is the main workflow for building `birds` from-source, loading to database, and validating each step"""
 
+import argparse
 import src.make_templates as mt
+import src.db_connect as dbc
+import src.backends as backends
 import src.check as c
 import src.load_tbls as loader
 
 if __name__ == '__main__':
-    birds = mt.make_birds()
+    parser = argparse.ArgumentParser(description='Build `birds` from-source, load it to the database, and validate each step.')
+    parser.add_argument('--refresh-source', action='store_true', help='re-query the Access source files instead of reading cached snapshots from `assets/cache/`')
+    parser.add_argument('--verify-schema', action='store_true', help='check the CREATE TABLE script against the SQL Server database before building `birds`')
+    parser.add_argument('--project-source', action='store_true', help='select only the source columns the code reads (see `src.build_tbls._project_sql()`); every column is read otherwise')
+    parser.add_argument('--incremental', action='store_true', help='read only the events entered or updated since the last successful run (see `src.incremental`)')
+    parser.add_argument('--verify-incremental', action='store_true', help='with --incremental, also run each merged query in full and check the merge matches it')
+    parser.add_argument('--query-log', default='', help='append per-query timing, row, and byte telemetry to this JSON-lines file (see `src.telemetry`)')
+    parser.add_argument('--backend', choices=backends.BACKEND_CHOICES, default='odbc', help="'sqlite' runs against the replicas in `assets/sqlite/` (see `src.sqlite_replica.build_replicas()`) instead of Access and SQL Server")
+    parser.add_argument('--workers', type=int, default=0, help='transform tables and generate their payloads and TSQL in this many processes (see `src.scheduler`); 0 runs one table at a time')
+    parser.add_argument('--checkpoints', action='store_true', help='save a checkpoint after each stage of `make_birds()` (see `src.checkpoints`)')
+    parser.add_argument('--resume-from', default='', choices=['', 'extract', 'exceptions', 'xwalks', 'k_load', 'payload', 'tsql', 'latest'], help="re-run `make_birds()` from this stage, starting from the checkpoint saved before it; 'latest' resumes after the latest valid checkpoint")
+    parser.add_argument('--profile', default='', help='write the wall time, CPU time, peak memory, and rows of each stage and table to this JSON file, and print the slowest (see `src.profiling`)')
+    args = parser.parse_args()
+
+    dbc._use_backend(args.backend)
+
+    birds = mt.make_birds(refresh_source=args.refresh_source, verify_schema=args.verify_schema, project_source=args.project_source, incremental=args.incremental, verify_incremental=args.verify_incremental, query_log=args.query_log, workers=args.workers, checkpoints=args.checkpoints, resume_from=args.resume_from, profile=args.profile)
     c.check_birds(birds)
     n = input('How many records would you like to unit test? (Integer required).')
     verbose = input('Do you want to print the results of the unit test to console? (True or False required).')
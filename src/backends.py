@@ -0,0 +1,142 @@
+"""Database backends behind `src.db_connect`, `src.load_tbls`, and `src.check`
+
+`BACKEND['name']` picks how connections, SQLAlchemy engines, and fully-qualified table names are made:
+-odbc: the production MS Access databases ('access', 'c') and SQL Server databases ('local', 'dev') via pyodbc
+-sqlite: SQLite replicas of the same databases (see `src.sqlite_replica`), so the pipeline can run on a machine without the Access or SQL Server drivers
+
+Switch backends with `src.db_connect._use_backend()` so that pooled connections from the old backend are closed.
+"""
+import assets.assets as assets
+import sqlalchemy as sa
+import sqlite3
+import datetime
+import decimal
+import os
+try:
+    import pyodbc
+except ImportError: # e.g., a Linux CI box without the ODBC drivers; only the 'sqlite' backend is usable
+    pyodbc = None
+
+BACKEND = {'name': 'odbc'}
+BACKEND_CHOICES = ['odbc', 'sqlite']
+DEST_DB = 'NCRN_Landbirds' # the destination database name, as used in fully-qualified table names e.g., [NCRN_Landbirds].[ncrn].[Park]
+SQLITE = {
+    'dir': 'assets/sqlite' # replicas built by `src.sqlite_replica.build_replicas()`
+}
+DEST_SCHEMAS = sorted(set(list(assets.TBL_XWALK.keys()) + list(assets.TBL_ADDITIONS.keys()))) # each destination schema is an attached SQLite database
+
+def _connect(db:str):
+    """Open a DBAPI connection to `db` with the active backend
+
+    Args:
+        db (str): one of `assets.DB_CHOICES`
+
+    Returns:
+        pyodbc.Connection or sqlite3.Connection
+    """
+    if BACKEND['name'] == 'sqlite':
+        return _sqlite_connect(db)
+    return _odbc_connect(db)
+
+def _dest_engine() -> sa.engine.Engine:
+    """SQLAlchemy engine for the destination database"""
+    if BACKEND['name'] == 'sqlite':
+        engine = sa.create_engine(f"sqlite:///{_sqlite_path('local')}", connect_args={'detect_types': sqlite3.PARSE_DECLTYPES, 'check_same_thread': False})
+        sa.event.listen(engine, 'connect', lambda con, _: _attach_schemas(con))
+        return engine
+    return sa.create_engine(assets.SACXN_STR)
+
+def _dest_connect():
+    """DBAPI connection for executing `tsql` against the destination database"""
+    if BACKEND['name'] == 'sqlite':
+        return _sqlite_connect('local')
+    return pyodbc.connect(assets.PYCXN_STR)
+
+def _qualify(schema:str, tbl:str) -> str:
+    """Fully-qualified destination table name e.g., '[NCRN_Landbirds].[ncrn].[Park]' (odbc) or '[ncrn].[Park]' (sqlite)"""
+    if BACKEND['name'] == 'sqlite':
+        return f'[{schema}].[{tbl}]'
+    return f'[{DEST_DB}].[{schema}].[{tbl}]'
+
+def _translate(sql:str) -> str:
+    """Rewrite a T-SQL statement generated by `src.make_templates._generate_tsql()` for the active backend"""
+    if BACKEND['name'] == 'sqlite':
+        return sql.replace(f'[{DEST_DB}].', '')
+    return sql
+
+def _source_file(db:str) -> str:
+    """The file behind a source database, or '' if `db` is a server"""
+    if BACKEND['name'] == 'sqlite':
+        if db in ['access', 'c']:
+            return _sqlite_path(db)
+        return ''
+    if db == 'access':
+        return assets.ACC_DB
+    if db == 'c':
+        return assets.C_DB
+    return ''
+
+def _odbc_connect(db:str):
+    if db.lower() == 'local':
+        con_str = (
+        r'driver={SQL Server};'
+        r'server=(local);'
+        f'database={assets.LOC_DB};'
+        r'trusted_connection=yes;'
+        )
+    elif db.lower() == 'dev':
+        con_str = f'DRIVER={{SQL Server}};SERVER={assets.DEV_SRV};DATABASE={assets.DEV_DB}'
+    elif db.lower() == 'access':
+        con_str = 'Driver={Microsoft Access Driver (*.mdb, *.accdb)};' + 'DBQ=' + f'{assets.ACC_DB}' + ';'
+    elif db.lower() == 'c':
+        con_str = 'Driver={Microsoft Access Driver (*.mdb, *.accdb)};' + 'DBQ=' + f'{assets.C_DB}' + ';'
+
+    return pyodbc.connect(con_str)
+
+def _sqlite_path(db:str, schema:str='') -> str:
+    """Filepath of a replica e.g., 'assets/sqlite/access.sqlite' or 'assets/sqlite/NCRN_Landbirds.ncrn.sqlite'
+
+    'local' and 'dev' both resolve to the destination replica.
+    """
+    if db.lower() in ['local', 'dev']:
+        if schema != '':
+            return os.path.join(SQLITE['dir'], f'{DEST_DB}.{schema}.sqlite')
+        return os.path.join(SQLITE['dir'], f'{DEST_DB}.sqlite')
+    return os.path.join(SQLITE['dir'], f'{db.lower()}.sqlite')
+
+def _sqlite_connect(db:str) -> sqlite3.Connection:
+    path = _sqlite_path(db)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f'`{path}` does not exist; build it with `src.sqlite_replica.build_replicas()`')
+    con = sqlite3.connect(path, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False) # connections are shared across threads by the pool in `src.db_connect`
+    if db.lower() in ['local', 'dev']:
+        _attach_schemas(con)
+
+    return con
+
+def _attach_schemas(con) -> None:
+    """Attach each destination schema's replica, so `[schema].[tbl]` resolves like it does in SQL Server"""
+    for schema in DEST_SCHEMAS:
+        con.execute(f"ATTACH DATABASE '{_sqlite_path('local', schema)}' AS [{schema}]")
+
+def _to_datetime(val:bytes):
+    text = val.decode('utf-8')
+    try:
+        return datetime.datetime.fromisoformat(text)
+    except:
+        return text # e.g., a `payload` value SQL Server would have parsed but SQLite stores as text
+
+def _to_date(val:bytes):
+    converted = _to_datetime(val)
+    if isinstance(converted, datetime.datetime):
+        return converted.date()
+    return converted
+
+# SQLite stores dates, booleans, and decimals as text/numbers; convert them back on read the way the ODBC drivers would return them
+sqlite3.register_adapter(datetime.datetime, lambda val: val.isoformat(' '))
+sqlite3.register_adapter(datetime.date, lambda val: val.isoformat())
+sqlite3.register_adapter(decimal.Decimal, float)
+sqlite3.register_converter('TIMESTAMP', _to_datetime)
+sqlite3.register_converter('DATETIME', _to_datetime)
+sqlite3.register_converter('DATE', _to_date)
+sqlite3.register_converter('BOOLEAN', lambda val: bool(int(val)))
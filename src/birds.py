@@ -0,0 +1,281 @@
+"""The `birds` containers: a `BirdsTable` per destination table, in a `Birds` registry
+
+`birds` used to be a dictionary of dictionaries of dictionaries, e.g., `birds['ncrn']['BirdDetection']['k_load']`.
+-`BirdsTable` holds one table's attributes (see `TABLE_ATTRS` and `src.make_templates`) in `__slots__`, so `table.k_load` is one attribute lookup and a misspelled attribute (e.g., `table.kload`) raises AttributeError instead of quietly making a new key
+-`BirdsTable` is also a mapping: `table['k_load']`, `table.keys()`, `table.items()`, etc. still work, and keys outside `TABLE_ATTRS` (e.g., the 'db' attribute `src.check.validate_db()` adds) go to `table.extra`
+-`Birds` is the `{schema: {tbl: BirdsTable}}` dictionary, also indexed by (schema, tbl), with a `context` dictionary for results that are computed once per run
+
+An attribute can hold a `Deferred` recipe instead of a value; it is made the first time it is read, e.g., `audit` and `tsql` (see `src.lazy_tables`) or an attribute read from disk (see `src.birds_io`).
+"""
+import pandas as pd
+
+TABLE_ATTRS = ('xwalk', 'source_name', 'original', 'source', 'destination', 'tbl_load', 'unique_vals', 'pk_fk_lookup', 'k_load', 'payload_cols', 'payload', 'audit', 'tsql')
+_TABLE_ATTRS = frozenset(TABLE_ATTRS) # for membership tests
+
+class Deferred:
+    """A recipe for an attribute: `func(*args)`; `func` is a module-level function, so a deferred attribute pickles (and crosses process boundaries) as its recipe"""
+    __slots__ = ('func', 'args')
+
+    def __init__(self, func, *args):
+        self.func = func
+        self.args = args
+
+    def make(self):
+        return self.func(*self.args)
+
+class BirdsTable:
+    """One table in `birds`
+
+    Args:
+        attrs (dict, optional): the table's attributes e.g., {'xwalk': pd.DataFrame(...), 'source_name': 'tbl_Events', ...}. Defaults to None.
+        lazy (bool, optional): the pipeline may defer `audit` and `tsql`, and make `k_load` and `payload` as shallow copies of the stage before them (see `src.make_templates.LAZY_TABLES`). Defaults to False.
+
+    Examples:
+        table = birds['ncrn']['BirdDetection'] # or birds['ncrn', 'BirdDetection']
+        table.k_load['SexID'] # same as table['k_load']['SexID']
+        table.drop('tsql', 'original', 'source') # `tsql` is made again if it's read again; `original` and `source` are emptied
+    """
+    __slots__ = TABLE_ATTRS + ('lazy', 'extra', 'deferred', 'recipes', 'dropped')
+
+    def __init__(self, attrs:dict=None, lazy:bool=False):
+        object.__setattr__(self, 'lazy', lazy)
+        object.__setattr__(self, 'extra', {}) # attributes outside `TABLE_ATTRS`
+        object.__setattr__(self, 'deferred', {}) # {attr: Deferred} for the attributes not made yet
+        object.__setattr__(self, 'recipes', {}) # {attr: Deferred} for the attributes made from a recipe, so `drop()` can defer them again
+        object.__setattr__(self, 'dropped', []) # attributes emptied by `drop()`
+        if attrs is not None:
+            for attr, value in attrs.items():
+                self[attr] = value
+
+    def __getattr__(self, attr):
+        """Only called for an attribute that isn't set: make it if it's deferred"""
+        if attr in _TABLE_ATTRS and attr in self.deferred.keys():
+            recipe = self.deferred.pop(attr)
+            value = recipe.make()
+            object.__setattr__(self, attr, value)
+            self.recipes[attr] = recipe
+            return value
+        raise AttributeError(f"'BirdsTable' has no attribute '{attr}'")
+
+    def __setattr__(self, attr, value):
+        if attr in _TABLE_ATTRS:
+            self.deferred.pop(attr, None)
+            self.recipes.pop(attr, None)
+            if isinstance(value, Deferred):
+                self._defer(attr, value)
+                return None
+        object.__setattr__(self, attr, value)
+
+    def __delattr__(self, attr):
+        if attr in _TABLE_ATTRS and attr in self.deferred.keys():
+            del self.deferred[attr]
+            return None
+        object.__delattr__(self, attr)
+
+    def _defer(self, attr:str, recipe:Deferred) -> None:
+        try:
+            object.__delattr__(self, attr)
+        except AttributeError:
+            pass
+        self.deferred[attr] = recipe
+
+    def _is_set(self, attr:str) -> bool:
+        try:
+            object.__getattribute__(self, attr)
+            return True
+        except AttributeError:
+            return attr in self.deferred.keys()
+
+    # dictionary interface, for the code that reads `birds[schema][tbl][attr]`
+    def __getitem__(self, key):
+        if key in _TABLE_ATTRS:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key)
+        value = self.extra[key]
+        if isinstance(value, Deferred):
+            self.recipes[key] = value
+            value = value.make()
+            self.extra[key] = value
+        return value
+
+    def __setitem__(self, key, value):
+        if key in _TABLE_ATTRS:
+            setattr(self, key, value)
+        else:
+            self.recipes.pop(key, None)
+            self.extra[key] = value
+
+    def __delitem__(self, key):
+        try:
+            if key in _TABLE_ATTRS:
+                delattr(self, key)
+            else:
+                del self.extra[key]
+        except AttributeError:
+            raise KeyError(key)
+
+    def __contains__(self, key) -> bool:
+        if key in _TABLE_ATTRS:
+            return self._is_set(key)
+        return key in self.extra.keys()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self) -> int:
+        return len(self.keys())
+
+    def keys(self) -> list:
+        return [attr for attr in TABLE_ATTRS if self._is_set(attr)] + list(self.extra.keys())
+
+    def items(self) -> list:
+        return [(attr, self[attr]) for attr in self.keys()]
+
+    def values(self) -> list:
+        return [self[attr] for attr in self.keys()]
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def update(self, attrs:dict=None, **kwargs) -> None:
+        attrs = {} if attrs is None else attrs
+        for attr, value in list(attrs.items()) + list(kwargs.items()):
+            self[attr] = value
+
+    def pop(self, key, *default):
+        if key not in self:
+            if len(default) > 0:
+                return default[0]
+            raise KeyError(key)
+        value = self[key]
+        del self[key]
+        return value
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def raw(self, key):
+        """An attribute's value, or its `Deferred` recipe if it hasn't been made, without making it"""
+        if key in _TABLE_ATTRS:
+            if key in self.deferred.keys():
+                return self.deferred[key]
+            try:
+                return object.__getattribute__(self, key)
+            except AttributeError:
+                raise KeyError(key)
+        return self.extra[key]
+
+    def is_deferred(self, key:str) -> bool:
+        return isinstance(self.raw(key), Deferred)
+
+    def copy(self):
+        """A shallow copy: the same attribute values (and recipes) in a new table"""
+        table = BirdsTable(lazy=self.lazy)
+        for attr in self.keys():
+            table[attr] = self.raw(attr)
+        table.recipes.update(self.recipes)
+        table.dropped.extend(self.dropped)
+        return table
+
+    def drop(self, *attrs) -> list:
+        """Free attributes: derived ones go back to their recipe, the rest are replaced by an empty value of the same type
+
+        Args:
+            *attrs (str): e.g., 'original', 'source', 'tbl_load', 'k_load', 'tsql'
+
+        Returns:
+            list: the attributes that were emptied (i.e., can't be made again)
+        """
+        emptied = []
+        for attr in attrs:
+            if attr not in self or self.is_deferred(attr):
+                continue
+            if attr in self.recipes.keys():
+                self[attr] = self.recipes[attr]
+                continue
+            value = self.raw(attr)
+            self[attr] = pd.DataFrame() if isinstance(value, pd.DataFrame) else type(value)()
+            if attr not in self.dropped:
+                self.dropped.append(attr)
+            emptied.append(attr)
+
+        return emptied
+
+    # pickle the slots as they are; the default would read every slot through `__getattr__()`, making deferred attributes
+    def __getstate__(self) -> dict:
+        state = {}
+        for attr in self.__slots__:
+            try:
+                state[attr] = object.__getattribute__(self, attr)
+            except AttributeError:
+                pass
+        return state
+
+    def __setstate__(self, state:dict) -> None:
+        for attr, value in state.items():
+            object.__setattr__(self, attr, value)
+
+    def __repr__(self) -> str:
+        return f"BirdsTable({', '.join([attr + ('(deferred)' if self.is_deferred(attr) else '') for attr in self.keys()])})"
+
+class Birds(dict):
+    """`birds`: {schema: {tbl: BirdsTable}}, also indexed by (schema, tbl)
+
+    `context` holds results computed once per run and shared between stages, e.g., a lookup both `src.tbl_xwalks._exception_ncrn_Contact()` and `_exception_ncrn_DetectionEvent()` need.
+
+    Examples:
+        birds['ncrn']['BirdDetection'] is birds['ncrn', 'BirdDetection'] # True
+        for (schema, tbl), table in birds.tables():
+            print(schema, tbl, len(table.k_load))
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.context = {}
+
+    def __getitem__(self, key):
+        if isinstance(key, tuple):
+            return dict.__getitem__(self, key[0])[key[1]]
+        return dict.__getitem__(self, key)
+
+    def __setitem__(self, key, value):
+        if isinstance(key, tuple):
+            self.setdefault(key[0], {})[key[1]] = value
+        else:
+            dict.__setitem__(self, key, value)
+
+    def __contains__(self, key) -> bool:
+        if isinstance(key, tuple):
+            return dict.__contains__(self, key[0]) and key[1] in dict.__getitem__(self, key[0])
+        return dict.__contains__(self, key)
+
+    def tables(self) -> list:
+        """[((schema, tbl), BirdsTable)] in `birds` order"""
+        return [((schema, tbl), table) for schema in self.keys() for tbl, table in dict.__getitem__(self, schema).items()]
+
+    @classmethod
+    def from_dict(cls, xwalk_dict:dict, lazy:bool=False):
+        """Make `Birds` from a `birds` of plain dictionaries, e.g., one pickled before `BirdsTable`
+
+        Examples:
+            with open('saved_dictionary.pkl', 'rb') as f:
+                birds = bd.Birds.from_dict(pickle.load(f))
+        """
+        birds = cls()
+        for schema in xwalk_dict.keys():
+            birds[schema] = {}
+            for tbl in xwalk_dict[schema].keys():
+                table = xwalk_dict[schema][tbl]
+                birds[schema][tbl] = table if isinstance(table, BirdsTable) else BirdsTable(table, lazy=lazy)
+        birds.context.update(getattr(xwalk_dict, 'context', {}))
+
+        return birds
+
+def _as_birds(xwalk_dict:dict) -> Birds:
+    """`xwalk_dict` itself if it's `Birds`, or `Birds.from_dict(xwalk_dict)`, for the public functions that take a `birds` of plain dictionaries, e.g., one pickled before `BirdsTable`"""
+    if isinstance(xwalk_dict, Birds):
+        return xwalk_dict
+    return Birds.from_dict(xwalk_dict)
@@ -0,0 +1,218 @@
+"""Save `birds` as a directory of columnar files, and open one table, attribute, or column at a time
+
+`pickle.dump(birds)` writes one file that has to be read in full to get at any table. `write_birds()` writes a directory instead:
+    <dest>/manifest.json: every table's `source_name`, `unique_vals`, and `payload_cols`, and the file, rows, and columns of every other attribute
+    <dest>/<schema>/<tbl>/<attr>.arrow: each dataframe attribute as an uncompressed Arrow IPC (Feather v2) file, e.g., `ncrn/BirdDetection/k_load.arrow`
+    <dest>/<schema>/<tbl>/tsql.sql: `tsql` as text
+An attribute Arrow can't hold (e.g., an object column of mixed types) is pickled on its own (`<attr>.pkl`), and so is every dataframe if pyarrow isn't installed.
+
+Arrow files are memory-mapped and read column by column, so `read_attribute(dest, 'ncrn', 'BirdDetection', 'k_load', columns=['ID', 'SexID'])` reads just those columns, and `read_birds()` returns `birds` with every attribute deferred until it is first accessed (see `src.birds.Deferred`).
+Object columns whose missing values were all `np.nan` get `np.nan` back; Arrow reads every other missing object value as None.
+"""
+import src.birds as bd
+import pandas as pd
+import numpy as np
+import datetime
+import pickle
+import json
+import time
+import os
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError: # every dataframe is pickled instead
+    pa = None
+    feather = None
+
+MANIFEST = 'manifest.json'
+MANIFEST_VERSION = 1
+MANIFEST_ATTRS = ['source_name', 'unique_vals', 'payload_cols'] # small attributes kept in the manifest itself
+
+def write_birds(xwalk_dict:dict, dest:str, fingerprint:str='') -> dict:
+    """Save `birds` to a directory: one file per table attribute, and a manifest
+
+    Deferred attributes (e.g., `tsql` in a lazy `src.birds.BirdsTable`) are made so they can be written.
+
+    Args:
+        xwalk_dict (dict): `birds`
+        dest (str): the directory to write to e.g., 'assets/birds'; files already in it for the same table attributes are replaced
+        fingerprint (str, optional): the hash of the inputs `birds` was made from, kept in the manifest (see `src.checkpoints._output_fingerprint()` and `_saved_fingerprint()`). Defaults to ''.
+
+    Returns:
+        dict: the manifest
+
+    Examples:
+        import src.birds_io as bio
+        bio.write_birds(birds, 'assets/birds')
+    """
+    start_time = time.time()
+    manifest = {'version':MANIFEST_VERSION, 'saved':datetime.datetime.now().isoformat(timespec='seconds'), 'fingerprint':fingerprint, 'tables':{}}
+    for schema in xwalk_dict.keys():
+        manifest['tables'][schema] = {}
+        for tbl in xwalk_dict[schema].keys():
+            entry = {'attrs':{}}
+            folder = os.path.join(dest, schema, tbl)
+            os.makedirs(folder, exist_ok=True)
+            for attr in xwalk_dict[schema][tbl].keys():
+                value = xwalk_dict[schema][tbl][attr]
+                if attr in MANIFEST_ATTRS:
+                    entry[attr] = value
+                else:
+                    entry['attrs'][attr] = _write_attribute(value, folder, attr, f'{schema}.{tbl}.{attr}')
+            manifest['tables'][schema][tbl] = entry
+    with open(os.path.join(dest, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2, default=str)
+    print(f'Output saved to `{dest}` in {round(time.time() - start_time, 2)}s')
+
+    return manifest
+
+def read_birds(src:str, tables:list=None, attrs:list=None, lazy:bool=True, memory_map:bool=True) -> dict:
+    """Open `birds` from a directory written by `write_birds()`
+
+    Args:
+        src (str): the directory e.g., 'assets/birds'
+        tables (list, optional): the (schema, tbl) pairs to open. Defaults to None, i.e., every table.
+        attrs (list, optional): the attributes to open e.g., ['k_load', 'payload']. Defaults to None, i.e., every attribute.
+        lazy (bool, optional): read each attribute the first time it is accessed, not now. Defaults to True.
+        memory_map (bool, optional): memory-map Arrow files instead of reading them into memory. Defaults to True.
+
+    Returns:
+        dict: `birds`, a `src.birds.Birds` of `src.birds.BirdsTable`s
+
+    Examples:
+        import src.birds_io as bio
+        birds = bio.read_birds('assets/birds') # milliseconds; nothing is read yet
+        k_load = birds['ncrn']['BirdDetection']['k_load'] # reads one file
+        birds = bio.read_birds('assets/birds', tables=[('ncrn', 'BirdDetection')], attrs=['k_load'], lazy=False)
+    """
+    manifest = _read_manifest(src)
+    xwalk_dict = bd.Birds()
+    for schema in manifest['tables'].keys():
+        for tbl in manifest['tables'][schema].keys():
+            if tables is not None and (schema, tbl) not in tables:
+                continue
+            entry = manifest['tables'][schema][tbl]
+            table = bd.BirdsTable()
+            for attr in MANIFEST_ATTRS:
+                if attr in entry.keys() and (attrs is None or attr in attrs):
+                    table[attr] = entry[attr]
+            for attr, meta in entry['attrs'].items():
+                if attrs is None or attr in attrs:
+                    table[attr] = bd.Deferred(_read_file, src, meta, None, memory_map)
+            if not lazy:
+                table.values() # make every deferred attribute now
+            xwalk_dict.setdefault(schema, {})[tbl] = table
+
+    return xwalk_dict
+
+def read_attribute(src:str, schema:str, tbl:str, attr:str, columns:list=None, memory_map:bool=True):
+    """Read one attribute of one table from a directory written by `write_birds()`
+
+    Args:
+        src (str): the directory e.g., 'assets/birds'
+        schema (str): e.g., 'ncrn'
+        tbl (str): e.g., 'BirdDetection'
+        attr (str): e.g., 'k_load'
+        columns (list, optional): read only these columns of a dataframe. Defaults to None, i.e., every column.
+        memory_map (bool, optional): memory-map an Arrow file instead of reading it into memory. Defaults to True.
+
+    Returns:
+        pd.DataFrame, str, or list: the attribute
+
+    Examples:
+        import src.birds_io as bio
+        df = bio.read_attribute('assets/birds', 'ncrn', 'BirdDetection', 'k_load', columns=['ID', 'DetectionEventID', 'SexID'])
+    """
+    entry = _read_manifest(src)['tables'][schema][tbl]
+    if attr in MANIFEST_ATTRS:
+        return entry[attr]
+
+    return _read_file(src, entry['attrs'][attr], columns, memory_map)
+
+def _write_attribute(value, folder:str, attr:str, name:str) -> dict:
+    """Write one attribute to `folder` and describe it for the manifest"""
+    for stale in [x for x in os.listdir(folder) if os.path.splitext(x)[0] == attr]:
+        os.remove(os.path.join(folder, stale))
+    if isinstance(value, str):
+        with open(os.path.join(folder, f'{attr}.sql'), 'w', encoding='utf-8') as f:
+            f.write(value)
+        return {'file':_relative(folder, f'{attr}.sql'), 'format':'text', 'chars':len(value)}
+    if isinstance(value, pd.DataFrame) and feather is not None:
+        try:
+            table = pa.Table.from_pandas(value, preserve_index=None)
+            feather.write_feather(table, os.path.join(folder, f'{attr}.arrow'), compression='uncompressed') # uncompressed, so it can be memory-mapped
+            return {'file':_relative(folder, f'{attr}.arrow'), 'format':'arrow', 'rows':len(value), 'columns':[str(x) for x in value.columns], 'nan_cols':_nan_cols(value)}
+        except Exception as e:
+            print(f'WARNING! `{name}` can\'t be written as Arrow ({type(e).__name__}: {e}); pickling it instead.')
+            if os.path.exists(os.path.join(folder, f'{attr}.arrow')):
+                os.remove(os.path.join(folder, f'{attr}.arrow'))
+    with open(os.path.join(folder, f'{attr}.pkl'), 'wb') as f:
+        pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+    meta = {'file':_relative(folder, f'{attr}.pkl'), 'format':'pickle'}
+    if isinstance(value, pd.DataFrame):
+        meta.update({'rows':len(value), 'columns':[str(x) for x in value.columns]})
+
+    return meta
+
+def _read_file(src:str, meta:dict, columns:list=None, memory_map:bool=True):
+    """Read one attribute file described by a manifest entry"""
+    path = os.path.join(src, meta['file'])
+    if meta['format'] == 'text':
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read()
+    if meta['format'] == 'pickle':
+        with open(path, 'rb') as f:
+            value = pickle.load(f)
+        return value[columns] if columns is not None else value
+    assert feather is not None, print(f'`{path}` is an Arrow file; reading it requires pyarrow')
+    table = feather.read_table(path, columns=_with_index(path, columns) if columns is not None else None, memory_map=memory_map)
+    df = table.to_pandas()
+    for col in meta.get('nan_cols', []):
+        if col in df.columns:
+            df[col] = df[col].where(df[col].notna(), np.nan)
+
+    return df
+
+def _with_index(path:str, columns:list) -> list:
+    """`columns` plus the columns that hold the dataframe's stored index, so a column subset keeps its index"""
+    schema = feather.read_table(path, columns=[], memory_map=True).schema
+    pandas_meta = schema.pandas_metadata or {}
+    index_cols = [x for x in pandas_meta.get('index_columns', []) if isinstance(x, str)] # a RangeIndex is stored as metadata, not a column
+
+    return list(columns) + [x for x in index_cols if x not in columns]
+
+def _nan_cols(df:pd.DataFrame) -> list:
+    """The object columns whose missing values are all `np.nan`, which Arrow would read back as None"""
+    cols = []
+    for i in range(len(df.columns)):
+        col = df.iloc[:, i]
+        if col.dtype != object:
+            continue
+        missing = col[col.isna()]
+        if len(missing) > 0 and all([isinstance(x, float) for x in missing.values]):
+            cols.append(str(df.columns[i]))
+
+    return cols
+
+def _relative(folder:str, filename:str) -> str:
+    """The path of a file under `folder` relative to the `birds` directory (i.e., '<schema>/<tbl>/<filename>'), with forward slashes"""
+    parts = os.path.normpath(folder).split(os.sep)[-2:]
+
+    return '/'.join(parts + [filename])
+
+def _saved_fingerprint(src:str) -> str:
+    """The fingerprint `write_birds()` kept in `src`'s manifest; '' if `src` has no manifest or was written without one"""
+    path = os.path.join(src, MANIFEST)
+    if not os.path.exists(path):
+        return ''
+    with open(path, 'r') as f:
+        manifest = json.load(f)
+
+    return manifest.get('fingerprint', '')
+
+def _read_manifest(src:str) -> dict:
+    with open(os.path.join(src, MANIFEST), 'r') as f:
+        manifest = json.load(f)
+    assert manifest.get('version') == MANIFEST_VERSION, print(f"`{src}` was written by a different version of `write_birds()` (manifest version {manifest.get('version')}); write it again")
+
+    return manifest
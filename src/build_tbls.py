@@ -1,64 +1,353 @@
 """build dataframes by querying databases (destination==SQL Server; source==Access)""" 
 import pandas as pd
+import concurrent.futures
+import time
 import src.db_connect as dbc
+import src.incremental as inc
+import src.tbl_xwalks as tx
+import glob
+import re
+import ast
+import os
 import assets.assets as assets
 import warnings
 warnings.simplefilter(action='ignore', category=UserWarning)
 
 TBL_XWALK = assets.TBL_XWALK
 TBL_ADDITIONS = assets.TBL_ADDITIONS
+# queries that the exception functions in `src.tbl_xwalks` need, beyond the `get_{tbl}` query for each `TBL_XWALK` source
+EXTRA_SRC_QRYS = {
+    'access': ['qry_long_event_contacts']
+    ,'c': ['get_c_tbl_Events', 'get_c_tbl_Locations', 'get_c_tbl_Field_Data']
+}
+# pandas dtype of each SQL Server field type, for the empty `destination` frames; unlisted types (e.g., VARCHAR, ROWVERSION) are 'object'
+DEST_DTYPES = {
+    'INT':'Int64'
+    ,'BIGINT':'Int64'
+    ,'SMALLINT':'Int64'
+    ,'TINYINT':'Int64'
+    ,'BIT':'boolean'
+    ,'DECIMAL':'float64'
+    ,'NUMERIC':'float64'
+    ,'FLOAT':'float64'
+    ,'REAL':'float64'
+    ,'DATE':'datetime64[ns]'
+    ,'DATETIME':'datetime64[ns]'
+    ,'DATETIME2':'datetime64[ns]'
+    ,'SMALLDATETIME':'datetime64[ns]'
+}
+# column projection for source queries; see `_project_sql()`
+PROJECTION = {
+    'enabled': False # opt-in: `original` and `source` then hold only the projected columns
+    ,'code': ['src/tbl_xwalks.py', 'src/make_templates.py', 'src/k_loads.py', 'src/check.py', 'assets/assets.py', 'data/*.py'] # the code that reads source columns, i.e., the crosswalks, the exception functions, the checks, and the scripts in data/ that call `make_birds()`; glob patterns are expanded
+}
+# queries whose every column is read, so they are never projected; e.g., `tx._exception_ncrn_Location()` folds every unmapped source column into `ncrn.Location.Notes`
+SELECT_ALL_QRYS = ['get_tbl_Locations', 'get_c_tbl_Locations']
+# the destination tables whose `source` each `EXTRA_SRC_QRYS` query feeds; a `get_{tbl}` query feeds the tables `TBL_XWALK` maps to `tbl`
+EXTRA_SRC_TBLS = {
+    'qry_long_event_contacts': ['DetectionEvent']
+    ,'get_c_tbl_Events': ['DetectionEvent']
+    ,'get_c_tbl_Locations': ['Location']
+    ,'get_c_tbl_Field_Data': ['BirdDetection']
+}
+_REFERENCED = {} # memo of `_referenced_names()`
+PROJECTED_AWAY = {} # {qry: [columns]} the columns the last projected extraction dropped from each query; see `_project_sql()`
+MAX_WORKERS = 4 # concurrent source queries; the Access ODBC driver gains little beyond a handful of readers per file
 
-def _get_dest_tbls() -> dict:
-    """Make empty dataframes with the correct column names and order for each table to be loaded
+def _get_dest_tbls(verify:bool=False) -> dict:
+    """Make empty dataframes with the correct column names, order, and dtypes for each table to be loaded
+
+    The schemas come from the CREATE TABLE script (`assets.CREATE_SQL`), so no database connection is needed.
+
+    Args:
+        verify (bool, optional): also compare the script against the 'local' SQL Server's INFORMATION_SCHEMA (see `_verify_dest_tbls()`). Defaults to False.
 
     Returns:
         dict: Dictionary of dataframes
 
     Examples:
-        import src.make_templates as bt
+        import src.build_tbls as bt
         testdict = bt._get_dest_tbls()
     """
     print('Retrieving target schemas...')
-    con = dbc._db_connect('local')
+    constraints = tx._field_sql_constraints(tx._preprocess_sql())
     template_dict = {}
     counter = 0
-    for schema in TBL_XWALK.keys():
-        for tbl in TBL_XWALK[schema].keys():
-            SQL_QUERY = f"""SELECT TOP 5 * FROM [{assets.LOC_DB}].[{schema}].[{tbl}];"""
-            template_dict[tbl] = pd.read_sql_query(SQL_QUERY,con)
+    for schema in constraints.keys():
+        for tbl in constraints[schema].keys():
+            fields = constraints[schema][tbl]['constraint_df']
+            template_dict[tbl] = pd.DataFrame({fieldname: pd.Series(dtype=_dest_dtype(fieldtype)) for fieldname, fieldtype in zip(fields['destination'], fields['fieldtype'])})
             counter += 1
-    for schema in TBL_ADDITIONS.keys():
-        for tbl in TBL_ADDITIONS[schema]:
-            SQL_QUERY = f"""SELECT TOP 5 * FROM [{assets.LOC_DB}].[{schema}].[{tbl}];"""
-            template_dict[tbl] = pd.read_sql_query(SQL_QUERY,con)
-            counter += 1
-    print(f'Retrieved {counter} target schemas.')
-    # close connection
-    con.close()
+    print(f'Retrieved {counter} target schemas from `{assets.CREATE_SQL}`.')
+    if verify:
+        _verify_dest_tbls(constraints)
 
     return template_dict
 
-def _get_src_tbls() -> dict:
-    """Make empty dataframes with the correct column names and order for each table to be loaded
+def _dest_dtype(fieldtype:str) -> str:
+    fieldtype = re.split(r'[\s(]', str(fieldtype).strip(), maxsplit=1)[0].upper()
+    if fieldtype in DEST_DTYPES.keys():
+        return DEST_DTYPES[fieldtype]
+    return 'object'
+
+def _verify_dest_tbls(constraints:dict) -> list:
+    """Compare the schemas parsed from `assets.CREATE_SQL` to the live 'local' database in a single INFORMATION_SCHEMA query
+
+    Args:
+        constraints (dict): output of `tx._field_sql_constraints()`
 
     Returns:
-        dict: Dictionary of dataframes
+        list: one message per mismatched table; empty if the script and the database agree
+    """
+    print('Verifying target schemas against the database...')
+    with dbc._pooled_connection('local') as con:
+        db_cols = dbc._exec_qry(con=con, qry='get_information_schema_columns')
+    mismatches = []
+    for schema in constraints.keys():
+        for tbl in constraints[schema].keys():
+            fields = constraints[schema][tbl]['constraint_df']
+            expected = [(fieldname, _dest_dtype(fieldtype)) for fieldname, fieldtype in zip(fields['destination'], fields['fieldtype'])]
+            actual = db_cols[(db_cols['TABLE_SCHEMA']==schema) & (db_cols['TABLE_NAME']==tbl)].sort_values('ORDINAL_POSITION')
+            actual = [(fieldname, _dest_dtype(fieldtype)) for fieldname, fieldtype in zip(actual['COLUMN_NAME'], actual['DATA_TYPE'])]
+            if expected != actual:
+                mismatches.append(f"FAIL: `{schema}.{tbl}` in `{assets.CREATE_SQL}` does not match the database's columns, order, or types")
+    for mismatch in mismatches:
+        print(mismatch)
+    if len(mismatches) == 0:
+        print('Target schemas match the database.')
+
+    return mismatches
+
+def _get_src_tbls(max_workers:int=MAX_WORKERS, project:bool=None) -> tuple:
+    """Query every source table, from both source databases, concurrently
+
+    The queries are planned up front by `_plan_src_qrys()` and run on a thread pool of at most `max_workers` threads; each thread checks out its own pooled connection.
+
+    Args:
+        max_workers (int, optional): the maximum number of queries in flight at once. Defaults to `MAX_WORKERS`.
+        project (bool, optional): select only the source columns the pipeline reads (see `_project_sql()`). Defaults to `PROJECTION['enabled']`.
+
+    Returns:
+        tuple: (dict, list)
+            dict: Dictionary of dataframes keyed by source table name (e.g., 'tbl_events') or, for the queries in `EXTRA_SRC_QRYS`, by query name (e.g., 'get_c_tbl_Events')
+            list: one dictionary per query with its `db`, `qry`, `rows`, and wall time in `seconds`, slowest first
 
     Examples:
-        import src.make_templates as bt
-        testdict = bt._get_src_tbls()
+        import src.build_tbls as bt
+        testdict, timings = bt._get_src_tbls()
     """
-    # connect to db
     print('Retrieving source data...')
-    con = dbc._db_connect('access')
+    if project is None:
+        project = PROJECTION['enabled']
+    PROJECTED_AWAY.clear()
+    plan = _plan_src_qrys()
+    results = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = {executor.submit(_timed_qry, db, qry, project): key for key, (db, qry) in plan.items()}
+        for future in concurrent.futures.as_completed(futures):
+            results[futures[future]] = future.result()
+
     tbl_dict = {}
-    counter = 0
+    timings = []
+    for key, (db, qry) in plan.items(): # assemble in plan order so the output doesn't depend on which query finished first
+        df, seconds, n_cols = results[key]
+        tbl_dict[key] = df
+        timings.append({'db':db, 'qry':qry, 'rows':len(df), 'seconds':seconds, 'columns':len(df.columns), 'source_columns':n_cols})
+    timings = sorted(timings, key=lambda x: x['seconds'], reverse=True)
+    print(f'Retrieved {len(tbl_dict)} source tables.')
+    if project:
+        kept = sum([timing['columns'] for timing in timings])
+        available = sum([timing['source_columns'] for timing in timings])
+        print(f'Projected source queries read {kept} of {available} source columns. Code that reads a dropped column raises KeyError; run with `project_source=False` to read every column.')
+        for qry, cols in PROJECTED_AWAY.items():
+            print(f'    {qry} dropped: {cols}')
+    print('Slowest source queries:')
+    for timing in timings[:5]:
+        print(f"    {timing['db']}.{timing['qry']}: {timing['rows']} rows in {round(timing['seconds'], 2)}s")
+
+    return tbl_dict, timings
+
+def _plan_src_qrys() -> dict:
+    """List every source query a `make_birds()` run needs
+
+    Returns:
+        dict: {key: (db, qry)} e.g., {'tbl_events': ('access', 'get_tbl_events'), 'get_c_tbl_Events': ('c', 'get_c_tbl_Events')}
+    """
+    plan = {}
     for schema in TBL_XWALK.keys():
         for tbl in TBL_XWALK[schema].values():
-            tbl_dict[tbl] = dbc._exec_qry(con=con, qry=f'get_{tbl}')
-            counter += 1
-    print(f'Retrieved {counter} source tables.')
-    # close connection
-    con.close()
+            plan[tbl] = ('access', f'get_{tbl}')
+    for db in EXTRA_SRC_QRYS.keys():
+        for qry in EXTRA_SRC_QRYS[db]:
+            plan[qry] = (db, qry)
+
+    return plan
+
+def _timed_qry(db:str, qry:str, project:bool=False) -> tuple:
+    start_time = time.perf_counter()
+    sql = dbc._read_sql(qry)
+    n_cols = 0
+    if project:
+        sql, n_cols = _project_sql(db, qry, sql)
+    if inc.INCREMENTAL['enabled'] and qry in inc.INCREMENTAL_QRYS.keys():
+        df = inc._read_qry(db, qry, sql) # only the events entered or updated since the last run, merged into the last run's snapshot
+    else:
+        df = dbc._read_qry(db=db, qry=qry, sql=sql) # served from the snapshot cache when the source file hasn't changed
+    if n_cols == 0:
+        n_cols = len(df.columns)
+
+    return df, time.perf_counter() - start_time, n_cols
+
+def _project_sql(db:str, qry:str, sql:str) -> tuple:
+    """Rewrite a source query to select only the columns the pipeline reads
+
+    A column is read if its name appears in the code that reads a destination table `qry` feeds (see `_qry_names()`): in that table's crosswalk (a 1:1 `source` or a calculation string), in its exception function, or in a check or script that names the table.
+    Queries that can't be analysed keep their original SQL: queries in `SELECT_ALL_QRYS`, queries whose select list can't be parsed, and queries whose columns can't be probed.
+
+    Args:
+        db (str): one of `assets.DB_CHOICES`
+        qry (str): the name of a .sql file in `src/qry/` e.g., 'get_tbl_field_data'
+        sql (str): the query's SQL
+
+    Returns:
+        tuple: (str, int)
+            str: the projected SQL e.g., 'SELECT [Event_ID], [AOU_Code], ... FROM tbl_Field_Data;', or `sql` unchanged
+            int: the number of columns the unprojected query returns; 0 if unknown
+
+    Examples:
+        import src.build_tbls as bt
+        sql, n_cols = bt._project_sql('access', 'get_tbl_field_data', dbc._read_sql('get_tbl_field_data'))
+    """
+    if qry in SELECT_ALL_QRYS:
+        return sql, 0
+    try:
+        columns = dbc._probe_columns(db, qry, sql)
+    except dbc.QUERY_ERRORS:
+        print(f'WARNING! Could not probe the columns of `{qry}`; selecting all of them.')
+        return sql, 0
+    names = _qry_names(qry)
+    lower_names = set([name.lower() for name in names])
+    if qry in inc.INCREMENTAL_QRYS.keys(): # an incremental delta filters on these and merges on the keys, whether or not the pipeline reads them
+        lower_names = lower_names | set([inc.INCREMENTAL_QRYS[qry][x].lower() for x in ['key', 'row_key']] + [x.lower() for x in inc.INCREMENTAL_QRYS[qry]['columns']])
+    keep = [col for col in columns if col in names or col.lower() in lower_names]
+    if len(keep) == 0 or len(keep) == len(columns):
+        return sql, len(columns)
+    dropped = [col for col in columns if col not in keep]
+
+    select_all = re.match(r'^\s*SELECT\s+\*\s+(FROM\s.*)$', sql, flags=re.IGNORECASE|re.DOTALL)
+    if select_all is not None:
+        projected = 'SELECT ' + ', '.join([f'[{col}]' for col in keep]) + ' ' + select_all.group(1)
+        PROJECTED_AWAY[qry] = dropped
+        return projected, len(columns)
+    select_list = re.match(r'^\s*SELECT\s+(.*?)\s+(FROM\s.*)$', sql, flags=re.IGNORECASE|re.DOTALL)
+    if select_list is None:
+        return sql, len(columns)
+    items = [x.strip() for x in select_list.group(1).split(',')]
+    kept_items = [x for x in items if _select_item_name(x).lower() in [col.lower() for col in keep]]
+    if len(items) != len(columns) or len(kept_items) != len(keep):
+        return sql, len(columns) # the select list didn't parse into one item per column
+    projected = 'SELECT \n  ' + ', \n  '.join(kept_items) + ' \n' + select_list.group(2)
+    PROJECTED_AWAY[qry] = dropped
+
+    return projected, len(columns)
+
+def _select_item_name(item:str) -> str:
+    """The output column name of one select-list item e.g., 'tbl_events.event_id' -> 'event_id', 'x AS y' -> 'y'"""
+    item = re.split(r'\s+AS\s+', item, flags=re.IGNORECASE)[-1]
+    return item.rsplit('.', 1)[-1].replace('[', '').replace(']', '').strip()
+
+def _qry_names(qry:str) -> set:
+    """Every identifier the code that reads `qry`'s destination tables could use as a source column name
+
+    Examples:
+        import src.build_tbls as bt
+        names = bt._qry_names('get_tbl_field_data') # the names read for ncrn.BirdDetection
+    """
+    tbls = [tbl for schema in TBL_XWALK.keys() for tbl, src in TBL_XWALK[schema].items() if f'get_{src}' == qry] + EXTRA_SRC_TBLS.get(qry, [])
+    referenced = _referenced_names()
+    names = set()
+    for tbl in tbls:
+        names.update(referenced.get(tbl, set()))
+
+    return names
+
+def _referenced_names() -> dict:
+    """Every identifier the pipeline's code could use as a source column name, by the destination table it's read for
+
+    Each top-level function and module-level constant in `PROJECTION['code']` (and a script's module-level code) is one unit.
+    A unit reads its string literals (and the identifiers inside string literals, e.g., crosswalk calculation strings), attribute names (e.g., `df.event_id`), and keyword names, plus everything the helpers it uses read: the functions and constants that name no destination table (e.g., `tx._recode()`), and the helpers they use.
+    It reads them for every destination table it names, e.g., `tx._ncrn_AuditLog()` and `tx._exception_ncrn_AuditLog()` read for 'AuditLog', and the latter also reads `protocol_name` for 'DetectionEvent'.
+    Over-collecting only means a column is kept that could have been dropped.
+
+    Returns:
+        dict: {destination table: set of names} e.g., {'DetectionEvent': {'event_id', 'wind_speed', ...}, ...}
+    """
+    if len(_REFERENCED) > 0:
+        return _REFERENCED
+    all_tbls = set([tbl for schema in TBL_XWALK.keys() for tbl in TBL_XWALK[schema].keys()])
+    units = {} # {unit: (names, identifiers)}
+    filenames = [filename for pattern in PROJECTION['code'] for filename in sorted(glob.glob(pattern))]
+    for filename in filenames:
+        with open(filename, 'r', encoding='utf-8') as f:
+            tree = ast.parse(f.read())
+        for node in tree.body:
+            if isinstance(node, (ast.Import, ast.ImportFrom)):
+                continue
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                unit = node.name
+            elif isinstance(node, ast.Assign) and isinstance(node.targets[0], ast.Name):
+                unit = node.targets[0].id
+            elif isinstance(node, ast.AnnAssign) and isinstance(node.target, ast.Name):
+                unit = node.target.id
+            else:
+                unit = filename # a script's module-level code
+            names, identifiers = units.get(unit, (set(), set()))
+            for child in ast.walk(node):
+                if isinstance(child, ast.Constant) and isinstance(child.value, str):
+                    names.add(child.value) # e.g., a column name with spaces
+                    names.update(re.findall(r'\w+', child.value))
+                elif isinstance(child, ast.Attribute):
+                    names.add(child.attr)
+                elif isinstance(child, ast.keyword) and child.arg is not None:
+                    names.add(child.arg)
+                elif isinstance(child, ast.Name):
+                    identifiers.add(child.id)
+            units[unit] = (names, identifiers)
+
+    referenced = {}
+    helpers = set([x for x in units.keys() if len(units[x][0] & all_tbls) == 0]) # a unit that names a table reads for that table, not for its callers; e.g., `make_templates._create_xwalks()` only dispatches
+    for unit, (names, identifiers) in units.items():
+        tbls = names & all_tbls
+        if len(tbls) == 0:
+            continue
+        read = set(names)
+        seen = set([unit])
+        todo = [x for x in (names | identifiers) if x in helpers]
+        while len(todo) > 0: # the helpers this unit uses, and the ones they use
+            used = todo.pop()
+            if used in seen:
+                continue
+            seen.add(used)
+            read.update(units[used][0])
+            todo.extend([x for x in (units[used][0] | units[used][1]) if x in helpers and x not in seen])
+        for tbl in tbls:
+            referenced.setdefault(tbl, set()).update(read)
+    _REFERENCED.update(referenced)
+
+    return _REFERENCED
+    names = set()
+    filenames = [filename for pattern in PROJECTION['code'] for filename in sorted(glob.glob(pattern))]
+    for filename in filenames:
+        with open(filename, 'r', encoding='utf-8') as f:
+            tree = ast.parse(f.read())
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Constant) and isinstance(node.value, str):
+                names.add(node.value) # e.g., a column name with spaces
+                names.update(re.findall(r'\w+', node.value))
+            elif isinstance(node, ast.Attribute):
+                names.add(node.attr)
+            elif isinstance(node, ast.keyword) and node.arg is not None:
+                names.add(node.arg)
+    _REFERENCED.update(names)
 
-    return tbl_dict
+    return _REFERENCED
@@ -4,6 +4,10 @@ import numpy as np
 import assets.assets as assets
 import re
 import src.tbl_xwalks as tx
+import src.birds as bd
+import src.birds_io as bio
+import src.profiling as prof
+import src.backends as backends
 import warnings
 warnings.simplefilter(action='ignore', category=FutureWarning)
 import time
@@ -22,6 +26,16 @@ KNOWN_EMPTY = {
 
     ]
 }
+# what `validate_db()` reads of each table when it opens a `src.birds_io` directory: {(schema, tbl): {attr: columns}}; None reads every column, e.g., where a merge of the whole frame depends on which columns overlap
+VALIDATE_DB_READS = {
+    ('ncrn', 'DetectionEvent'): {'source':None, 'pk_fk_lookup':None, 'k_load':None}
+    ,('ncrn', 'Location'): {'source':None, 'k_load':None}
+    ,('ncrn', 'Protocol'): {'source':['Protocol_ID','Protocol_Name'], 'k_load':['ID','Title']}
+    ,('ncrn', 'Contact'): {'source':['Contact_ID','Last_Name','First_Name'], 'k_load':['ID','LastName','FirstName']}
+    ,('ncrn', 'BirdSpeciesPark'): {'k_load':['ID','BirdSpeciesID']}
+    ,('ncrn', 'BirdSpecies'): {'k_load':['ID','Code']}
+    ,('ncrn', 'BirdDetection'): {'source':['Event_ID','AOU_Code'], 'k_load':['DetectionEventID','BirdSpeciesParkID']}
+}
 
 def check_birds(xwalk_dict:dict) -> None:
     """Validate a dictionary of birds data
@@ -32,36 +46,40 @@ def check_birds(xwalk_dict:dict) -> None:
     Returns:
         None: This function returns None.
     """
+    xwalk_dict = bd._as_birds(xwalk_dict)
     start_time = time.time()
+    prof._start_run('check_birds')
     print('')
     print(f'Validating dictionary against db schema...')
-    _check_schema(xwalk_dict=xwalk_dict)
+    prof._call('check_birds', _check_schema, xwalk_dict)
     print('')
     print('Checking each table for required attributes...')
     # _validate_xwalks(xwalk_dict=xwalk_dict)
-    _check_attrs(xwalk_dict=xwalk_dict)
+    prof._call('check_birds', _check_attrs, xwalk_dict)
     print('')
     print('Checking the dimensions of each table...')
-    _validate_loads(xwalk_dict=xwalk_dict)
+    prof._call('check_birds', _validate_loads, xwalk_dict)
     print('')
     print('Checking each table for unique values...')
-    _validate_unique_vals(xwalk_dict=xwalk_dict)
+    prof._call('check_birds', _validate_unique_vals, xwalk_dict)
     print('')
     print('Checking each table for nulls in non-nullable fields...')
-    _validate_nulls(xwalk_dict=xwalk_dict)
+    prof._call('check_birds', _validate_nulls, xwalk_dict)
     print('')
     print('Checking referential integrity...')
-    _validate_referential_integrity(xwalk_dict=xwalk_dict)
+    prof._call('check_birds', _validate_referential_integrity, xwalk_dict)
     print('')
     print('Checking that logical keys were replaced by INTs...')
-    _validate_foreign_keys(xwalk_dict=xwalk_dict)
-    _validate_primary_keys(xwalk_dict=xwalk_dict)
+    prof._call('check_birds', _validate_foreign_keys, xwalk_dict)
+    prof._call('check_birds', _validate_primary_keys, xwalk_dict)
     print('')
     end_time = time.time()
     elapsed_time = end_time - start_time
     elapsed_time = str(dt.timedelta(seconds=elapsed_time))
     elapsed_time = elapsed_time.split('.')[0]
     print(f'`check()` succeeded in: {elapsed_time}')
+    if prof.PROFILING['enabled']:
+        prof._report(run='check_birds')
 
     return None
 
@@ -138,8 +156,8 @@ def _validate_primary_keys(xwalk_dict:dict) -> None:
 
 def _check_schema(xwalk_dict:dict) -> None:
     """Check the dictionary's table schema against the db's schema"""
-    mydf = pd.read_csv(r'assets\db\db_schema.csv')
-    # 'assets\db\db_schema.csv' is the result of running the below query against NCRN_Landbirds
+    mydf = pd.read_csv(r'assets/db/db_schema.csv')
+    # 'assets/db/db_schema.csv' is the result of running the below query against NCRN_Landbirds
     # USE [db_name_here]
     # GO 
     # SELECT *
@@ -476,7 +494,7 @@ def _traverse(myd:dict, EXCLUSIONS:list) -> list:
     """Recursively check levels of input dictionary until we get the right depth; allows for schema addition"""
     mykeys = []
     def __traverse(myd):
-        if isinstance(myd, dict):
+        if isinstance(myd, (dict, bd.BirdsTable)):
             if 'source' in myd.keys():
                 for k in list(myd.keys()):
                     if k not in mykeys:
@@ -616,21 +634,23 @@ def unit_test(xwalk_dict:dict, n:int=None, verbose:bool=False) -> None:
     - counts of records per observer, recorder
     - pivot, compare counts of records (like in summary sent to collaborator)
     """
+    xwalk_dict = bd._as_birds(xwalk_dict)
     start_time = time.time()
+    prof._start_run('unit_test')
     outcomes = []
     print('')
     print('Unit testing `ncrn` schema...')
 
     print('')
     print(f'Unit testing `ncrn.DetectionEvent.k_load`...')
-    outcomes.extend(_unit_test_ncrn_DetectionEvent(xwalk_dict))
+    outcomes.extend(prof._call('unit_test', _unit_test_ncrn_DetectionEvent, xwalk_dict))
     print('')
     print(f'Unit testing `ncrn.BirdDetection.k_load`...')
-    outcomes.extend(_unit_test_ncrn_BirdDetection(xwalk_dict))
+    outcomes.extend(prof._call('unit_test', _unit_test_ncrn_BirdDetection, xwalk_dict))
     if n:
         print('')
         print(f'Comparing a random sample of {n} site visits for accuracy...')
-        outcomes.extend(_compare_pivot_tables(xwalk_dict, n, verbose))
+        outcomes.extend(prof._call('unit_test', _compare_pivot_tables, xwalk_dict, n, verbose))
     
     if all(outcomes):
         print('')
@@ -642,6 +662,8 @@ def unit_test(xwalk_dict:dict, n:int=None, verbose:bool=False) -> None:
     elapsed_time = elapsed_time.split('.')[0]
     print('')
     print(f'`unit_test()` succeeded in: {elapsed_time}')
+    if prof.PROFILING['enabled']:
+        prof._report(run='unit_test')
     return None
 
 def _unit_test_ncrn_DetectionEvent(xwalk_dict:dict) -> list:
@@ -1104,6 +1126,24 @@ def make_views(xwalk_dict:dict) -> dict:
     return views
 
 def validate_db(xwalk_dict:dict, n:int, verbose:bool=False) -> dict:
+    """Compare `n` sampled site visits across `source`, `k_load`, and the loaded database (`db`)
+
+    Args:
+        xwalk_dict (dict): `birds`, or a directory written by `src.birds_io.write_birds()`, from which only the attributes and columns in `VALIDATE_DB_READS` are read (see `_open_for_validation()`)
+        n (int): the number of site visits to compare
+        verbose (bool, optional): print each mismatch. Defaults to False.
+
+    Returns:
+        dict: `birds`, with a 'db' attribute for each table
+
+    Examples:
+        import src.check as c
+        birds = c.validate_db('assets/birds', 10, True) # e.g., after `mt.make_birds('assets/birds')`
+    """
+    if isinstance(xwalk_dict, str):
+        xwalk_dict = _open_for_validation(xwalk_dict)
+    else:
+        xwalk_dict = bd._as_birds(xwalk_dict)
     print('')
     start_time = time.time()
     print(f"Querying db...")
@@ -1131,6 +1171,17 @@ def validate_db(xwalk_dict:dict, n:int, verbose:bool=False) -> dict:
     print(f'`validate_db()` succeeded in: {elapsed_time}')
     return xwalk_dict
 
+def _open_for_validation(src:str) -> dict:
+    """`birds` with only the tables `validate_db()` compares, each attribute deferred to `src.birds_io.read_attribute()` of the columns in `VALIDATE_DB_READS`"""
+    xwalk_dict = bd.Birds()
+    for (schema, tbl), reads in VALIDATE_DB_READS.items():
+        table = bd.BirdsTable()
+        for attr, columns in reads.items():
+            table[attr] = bd.Deferred(bio.read_attribute, src, schema, tbl, attr, columns)
+        xwalk_dict[schema, tbl] = table
+
+    return xwalk_dict
+
 def _validate_db(xwalk_dict:dict, n:int, verbose:bool) -> None:
 
     outcomes = []
@@ -1188,11 +1239,11 @@ def _validate_db(xwalk_dict:dict, n:int, verbose:bool) -> None:
 
 def _query_db(xwalk_dict:dict) -> dict:
 
-    engine = sa.create_engine(assets.SACXN_STR)
+    engine = backends._dest_engine()
     for schema in xwalk_dict.keys():
         for tbl in xwalk_dict[schema].keys():
             xwalk_dict[schema][tbl]['db'] = pd.DataFrame()
-            query = f"""SELECT * FROM [NCRN_Landbirds].[{schema}].[{tbl}];"""
+            query = f"""SELECT * FROM {backends._qualify(schema, tbl)};"""
             # query = """SELECT * FROM [NCRN_Landbirds_local].[ncrn].[BirdSpecies];"""
             try:
                 xwalk_dict[schema][tbl]['db'] = pd.read_sql_query(query, engine)
@@ -0,0 +1,273 @@
+"""Stage checkpoints for `make_birds()`, so a run can resume after the last stage whose inputs haven't changed
+
+`make_birds()` runs in six stages, and with checkpoints on, it pickles its state after each one to `CHECKPOINTS['dir']`:
+-extract: `source_dict` and `dest_dict` (the Access queries and the CREATE TABLE script)
+-exceptions: `birds` after `make_templates._create_xwalks()` and `make_templates._execute_xwalk_exceptions()`
+-xwalks: `birds` after `make_templates._execute_xwalks()`, row ids, SQL constraints, and `pk_fk_lookup`
+-k_load, payload, tsql: `birds` after `make_templates._generate_k_load()`, `_generate_payload()`, and `_generate_tsql()`
+
+Each checkpoint is saved with a fingerprint: a hash of the stage's code and asset inputs (`STAGE_INPUTS`, plus the files under assets/ that code reads by literal path), chained to the fingerprint of the stage before it, so a change to any earlier stage's inputs invalidates every later checkpoint.
+The extract fingerprint also covers the run's parameters, the mtime and size of the source-database files (like `src.db_connect._cache_path()`), and, for projected queries, the names `src.build_tbls._referenced_names()` collects.
+`make_birds(resume_from='payload')` loads the `k_load` checkpoint and re-runs `payload` and `tsql`; if that checkpoint's fingerprint no longer matches, it resumes after the latest earlier checkpoint that does.
+
+With `make_birds(workers=...)` and checkpoints on, the scheduler runs xwalks through tsql one stage at a time across every table, and saves each stage's checkpoint (see `src.scheduler._run_tables()`).
+"""
+import assets.assets as assets
+import src.backends as backends
+import src.db_connect as dbc
+import pandas as pd
+import importlib
+import datetime
+import fnmatch
+import inspect
+import textwrap
+import ast
+import hashlib
+import pickle
+import json
+import time
+import os
+
+CHECKPOINTS = {
+    'enabled': False
+    ,'dir': 'assets/cache/checkpoints' # one pickle per stage and `checkpoints.json`
+}
+STAGES = ['extract', 'exceptions', 'xwalks', 'k_load', 'payload', 'tsql']
+# what each stage's output depends on, besides the stages before it
+# -code: a `src` module or folder (its whole file(s)), or 'module.name' (a function's source, or a constant's value); 'name' can be a pattern e.g., '_cast_*'
+# -assets: `assets` attributes; a path to a file is hashed by its contents
+# the files the stage's code reads by literal path (e.g., r'assets/db/update_sexes.csv' in `src.tbl_xwalks`) are hashed too; see `_asset_literals()`
+STAGE_INPUTS = {
+    'extract': {
+        'code': ['build_tbls', 'db_connect', 'backends', 'incremental', 'sqlite_replica', 'qry', 'ddl', 'tbl_xwalks._preprocess_sql', 'tbl_xwalks._field_sql_constraints', 'tbl_xwalks._maxlen']
+        ,'assets': ['TBL_XWALK', 'CREATE_SQL']
+    }
+    ,'exceptions': {
+        'code': ['tbl_xwalks', 'birds', 'lazy_tables', 'make_templates._build_xwalk_dict', 'make_templates._create_xwalks', 'make_templates._execute_xwalk_exceptions', 'make_templates.LAZY_TABLES']
+        ,'assets': ['TBL_XWALK', 'TBL_ADDITIONS', 'DELETES', 'EMAIL_LOOKUP', 'PRECIPTYPE', 'BIRDS_RESEARCH', 'DBO_USER', 'C_L', 'C_G']
+    }
+    ,'xwalks': {
+        'code': ['xwalk_expr', 'scheduler', 'make_templates._execute_xwalks', 'make_templates._exec_xwalk_code', 'make_templates._compile_xwalk_code', 'make_templates.XWALK_EXPRESSIONS']
+        ,'assets': ['CREATE_SQL']
+    }
+    ,'k_load': {
+        'code': ['k_loads', 'make_templates._generate_k_load']
+        ,'assets': []
+    }
+    ,'payload': {
+        'code': ['make_templates._generate_payload', 'make_templates._payload_plan', 'make_templates._plain', 'make_templates._cast_*', 'make_templates.PAYLOAD_CASTERS', 'make_templates.PAYLOAD_NONSENSE', 'make_templates.PAYLOAD_DONT_ROUND']
+        ,'assets': []
+    }
+    ,'tsql': {
+        'code': ['make_templates._generate_tsql', 'make_templates._tsql_*', 'make_templates._format_tsql_column', 'make_templates.TSQL_*', 'make_templates.NUMPY_REPR_IS_STR']
+        ,'assets': []
+    }
+}
+SRC_DIR = os.path.dirname(os.path.realpath(__file__))
+_RUN = {'fingerprints': {}, 'resumed': ''} # this run's fingerprints, and the stage it resumed after; set by `_configure()`
+
+def _configure(enabled:bool=False, params:dict=None) -> None:
+    """Turn checkpoints on or off for the next run, and fingerprint every stage
+
+    Args:
+        enabled (bool, optional): save a checkpoint after each stage. Defaults to False.
+        params (dict, optional): the `make_birds()` arguments that change what extraction returns e.g., {'project_source': True, 'incremental': False}. Defaults to None, i.e., {}.
+    """
+    CHECKPOINTS['enabled'] = enabled
+    _RUN['resumed'] = ''
+    _RUN['fingerprints'] = _fingerprints(params) if enabled else {}
+
+def _fingerprints(params:dict=None) -> dict:
+    """Hash each stage's inputs, chained to the stage before it
+
+    Returns:
+        dict: {stage: sha256 hexdigest} e.g., {'extract': '3f1c...', 'exceptions': '9a0b...', ...}
+    """
+    if params is None:
+        params = {}
+    fingerprints = {}
+    previous = json.dumps(params, sort_keys=True, default=str)
+    for stage in STAGES:
+        digest = hashlib.sha256(previous.encode('utf-8'))
+        if stage == 'extract':
+            digest.update(_source_stamps().encode('utf-8'))
+            if params.get('project_source', False):
+                import src.build_tbls as bt
+                digest.update(repr(sorted([(tbl, sorted(names)) for tbl, names in bt._referenced_names().items()])).encode('utf-8'))
+        for name in STAGE_INPUTS[stage]['code']:
+            digest.update(name.encode('utf-8'))
+            digest.update(_code_input(name))
+        for name in STAGE_INPUTS[stage]['assets']:
+            digest.update(name.encode('utf-8'))
+            digest.update(_describe(getattr(assets, name, None)).encode('utf-8'))
+        for path in _asset_literals(STAGE_INPUTS[stage]['code']):
+            digest.update(_describe(path).encode('utf-8')) # the file's contents; its path if it doesn't exist
+        previous = digest.hexdigest()
+        fingerprints[stage] = previous
+
+    return fingerprints
+
+def _resume(resume_from:str) -> tuple:
+    """Load the checkpoint to resume from
+
+    Args:
+        resume_from (str): the first stage to re-run, one of `STAGES`; 'latest' resumes after the latest valid checkpoint
+
+    Returns:
+        tuple: (str, object)
+            str: the stage the run resumes after; '' to run every stage
+            object: that stage's checkpoint; None if ''
+    """
+    if resume_from == '':
+        return '', None
+    last = len(STAGES) if resume_from == 'latest' else STAGES.index(resume_from)
+    manifest = _load_manifest()
+    for stage in reversed(STAGES[:last]):
+        entry = manifest.get(stage)
+        path = _checkpoint_path(stage)
+        if entry is None or not os.path.exists(path):
+            continue
+        if entry['fingerprint'] != _RUN['fingerprints'][stage]:
+            print(f"Checkpoints: the `{stage}` checkpoint from {entry['saved']} is out of date; its code or asset inputs have changed.")
+            continue
+        try:
+            with open(path, 'rb') as f:
+                state = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError): # e.g., a truncated file, or a class that was renamed since
+            print(f'WARNING! Could not read the `{stage}` checkpoint `{path}`.')
+            continue
+        print(f"Checkpoints: resuming after `{stage}` (saved {entry['saved']}).")
+        _RUN['resumed'] = stage
+        return stage, state
+    if resume_from != STAGES[0]:
+        print(f'WARNING! No valid checkpoint to resume from before `{resume_from}`; running every stage.')
+
+    return '', None
+
+def _todo(stage:str) -> bool:
+    """True if `stage` has to run, i.e., the run didn't resume after it"""
+    if _RUN['resumed'] == '':
+        return True
+    return STAGES.index(stage) > STAGES.index(_RUN['resumed'])
+
+def _save(stage:str, state) -> None:
+    """Pickle a stage's state, if checkpoints are on; a failure is reported, not raised, because the run itself succeeded"""
+    if not CHECKPOINTS['enabled']:
+        return None
+    start = time.perf_counter()
+    path = _checkpoint_path(stage)
+    try:
+        os.makedirs(CHECKPOINTS['dir'], exist_ok=True)
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path) # never leave a half-written checkpoint behind a valid fingerprint
+        manifest = _load_manifest()
+        manifest[stage] = {'fingerprint': _RUN['fingerprints'][stage], 'saved': datetime.datetime.now().isoformat(timespec='seconds'), 'bytes': os.path.getsize(path)}
+        with open(_manifest_path(), 'w') as f:
+            json.dump(manifest, f, indent=2)
+    except (OSError, pickle.PicklingError, TypeError, AttributeError): # e.g., a full disk, or an attribute that can't be pickled
+        print(f'WARNING! Could not save the `{stage}` checkpoint to `{path}`.')
+        return None
+    print(f'Checkpoints: saved `{stage}` in {round(time.perf_counter() - start, 2)}s.')
+
+    return None
+
+def _checkpoint_path(stage:str) -> str:
+    return os.path.join(CHECKPOINTS['dir'], f'{stage}.pkl')
+
+def _manifest_path() -> str:
+    return os.path.join(CHECKPOINTS['dir'], 'checkpoints.json')
+
+def _load_manifest() -> dict:
+    if not os.path.exists(_manifest_path()):
+        return {}
+    try:
+        with open(_manifest_path(), 'r') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError): # `json.JSONDecodeError` is a ValueError
+        print(f'WARNING! Could not read `{_manifest_path()}`; every checkpoint is out of date.')
+        manifest = {}
+
+    return manifest
+
+def _source_stamps() -> str:
+    """The backend and the mtime and size of each source-database file"""
+    stamps = [backends.BACKEND['name']]
+    for db in dbc.SOURCE_DBS:
+        try:
+            stat = os.stat(backends._source_file(db))
+            stamps.append(f'{db}:{stat.st_mtime_ns}:{stat.st_size}')
+        except OSError:
+            stamps.append(f'{db}:missing')
+
+    return '|'.join(stamps)
+
+def _code_input(name:str) -> bytes:
+    """The bytes that stand for one `STAGE_INPUTS` code entry"""
+    module, _, attr = name.partition('.')
+    if attr == '':
+        path = os.path.join(SRC_DIR, module)
+        paths = sorted([os.path.join(root, x) for root, _, files in os.walk(path) for x in files]) if os.path.isdir(path) else [path + '.py']
+        contents = b''
+        for path in paths:
+            with open(path, 'rb') as f:
+                contents += f.read()
+        return contents
+    mod = importlib.import_module(f'src.{module}')
+    names = sorted([x for x in vars(mod).keys() if fnmatch.fnmatchcase(x, attr)])
+
+    return '\n'.join([x + '=' + _describe(getattr(mod, x)) for x in names]).encode('utf-8')
+
+def _asset_literals(names:list) -> list:
+    """The files under assets/ that the code in `names` (`STAGE_INPUTS` code entries) names in a string literal, e.g., 'assets/db/update_sexes.csv'; assets/cache/ is left out, since the pipeline writes it"""
+    sources = []
+    for name in names:
+        module, _, attr = name.partition('.')
+        if attr == '':
+            path = os.path.join(SRC_DIR, module)
+            paths = sorted([os.path.join(root, x) for root, _, files in os.walk(path) for x in files]) if os.path.isdir(path) else [path + '.py']
+            for path in [x for x in paths if x.endswith('.py')]:
+                with open(path, 'r', encoding='utf-8') as f:
+                    sources.append(f.read())
+            continue
+        mod = importlib.import_module(f'src.{module}')
+        for x in sorted([x for x in vars(mod).keys() if fnmatch.fnmatchcase(x, attr)]):
+            if inspect.isfunction(getattr(mod, x)):
+                sources.append(textwrap.dedent(inspect.getsource(getattr(mod, x))))
+    paths = set()
+    for source in sources:
+        for node in ast.walk(ast.parse(source)):
+            if isinstance(node, ast.Constant) and isinstance(node.value, str) and node.value.replace('\\', '/').startswith('assets/') and not node.value.replace('\\', '/').startswith('assets/cache/'):
+                paths.add(node.value)
+
+    return sorted(paths)
+
+def _output_fingerprint(params:dict=None) -> str:
+    """The fingerprint of a whole `make_birds()` run: the last stage's, which is chained to every stage before it
+
+    Examples:
+        import src.checkpoints as ck
+        fingerprint = ck._output_fingerprint({'project_source': False, 'incremental': False})
+    """
+    return _fingerprints(params)[STAGES[-1]]
+
+def _describe(value) -> str:
+    """A description of a value that is the same in every run: source code for functions, contents for files and dataframes, sorted items for sets"""
+    if inspect.isfunction(value) or inspect.isclass(value):
+        try:
+            return inspect.getsource(value)
+        except (OSError, TypeError): # e.g., a builtin type such as `int`
+            return repr(value)
+    if isinstance(value, pd.DataFrame):
+        return repr(list(value.columns)) + str(pd.util.hash_pandas_object(value, index=True).sum())
+    if isinstance(value, dict):
+        return '{' + ','.join(sorted([_describe(k) + ':' + _describe(v) for k, v in value.items()])) + '}'
+    if isinstance(value, (list, tuple)):
+        return '[' + ','.join([_describe(x) for x in value]) + ']'
+    if isinstance(value, (set, frozenset)):
+        return '{' + ','.join(sorted([_describe(x) for x in value])) + '}'
+    if isinstance(value, str) and os.path.isfile(value):
+        with open(value, 'rb') as f:
+            return value + ':' + hashlib.sha256(f.read()).hexdigest()
+
+    return repr(value)
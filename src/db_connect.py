@@ -1,32 +1,379 @@
 """Connect to databases"""
 import assets.assets as assets
-import pyodbc
+import src.backends as backends
+import src.telemetry as telemetry
 import pandas as pd
+from pandas.api.types import union_categoricals
+import threading
+import hashlib
+import glob
+import os
+import tracemalloc
+import time
+import warnings
+from contextlib import contextmanager
 
-def _db_connect(db:str) -> None:
+# idle connections available for reuse, keyed by `assets.DB_CHOICES` name (e.g., {'access': [<pyodbc.Connection>]})
+POOL = {}
+# per-database counters of new connections vs. reused connections since the last `_close_pool()`
+POOL_STATS = {}
+_POOL_LOCK = threading.Lock()
+
+# on-disk snapshot cache for `_exec_qry()` results; see `_cache_path()`
+CACHE = {
+    'enabled': True
+    ,'refresh': False # re-query the source and overwrite its cached snapshot (i.e., `python main.py --refresh-source`)
+    ,'dir': 'assets/cache/qry'
+}
+# cacheable `db`s; their source-database file comes from `backends._source_file()`, and live servers (e.g., 'local', 'dev') are never cached
+SOURCE_DBS = ['access', 'c']
+_REFRESHED = set() # snapshots already re-queried during this run when `CACHE['refresh']` is True
+# what a failed query raises: the driver's own error, pandas' wrapper of it (an OSError), or the pool's ConnectionError
+QUERY_ERRORS = tuple([x for x in [backends.sqlite3.Error, getattr(backends.pyodbc, 'Error', None), pd.io.sql.DatabaseError, ConnectionError] if x is not None])
+
+# queries that are read in chunks of `CHUNKSIZE` rows, with these dtypes pinned on each chunk to keep peak memory down; see `_stream_qry()`
+FIELD_DATA_DTYPES = {
+    'AOU_Code':'category'
+    ,'ID_Method_Code':'category'
+    ,'Unit_Code':'category'
+    ,'Distance_id':'Int8' # pinned only now that `tx._recode()` and the blank-fill in `tx._exception_ncrn_BirdDetection()` handle <NA>
+    ,'Sex_ID':'Int8'
+    ,'Interval':'Int8'
+}
+SOURCE_DTYPES = {
+    'get_tbl_field_data': FIELD_DATA_DTYPES
+    ,'get_c_tbl_Field_Data': FIELD_DATA_DTYPES
+}
+CHUNKSIZE = 50000
+# `_run_qry()` hands pandas a `telemetry._TimedConnection`, which pandas reads like any DBAPI connection (e.g., pyodbc) but warns about
+warnings.filterwarnings('ignore', message='pandas only supports SQLAlchemy', category=UserWarning)
+
+def _db_connect(db:str):
+    """Open a connection to `db` with the active backend (see `src.backends`)
+
+    A failure is recorded in the query telemetry, explained, and re-raised, so extraction stops at the connection error.
+    """
     assert db in assets.DB_CHOICES, print(f'You entered `{db}`; `db` must be in {assets.DB_CHOICES}')
 
-    if db.lower() == 'local':
-        con_str = (
-        r'driver={SQL Server};'
-        r'server=(local);'
-        f'database={assets.LOC_DB};'
-        r'trusted_connection=yes;'
-        )
-    elif db.lower() == 'dev':
-        con_str = f'DRIVER={{SQL Server}};SERVER={assets.DEV_SRV};DATABASE={assets.DEV_DB}'
-    elif db.lower() == 'access':
-        con_str = 'Driver={Microsoft Access Driver (*.mdb, *.accdb)};' + 'DBQ=' + f'{assets.ACC_DB}' + ';'
-    elif db.lower() == 'c':
-        con_str = 'Driver={Microsoft Access Driver (*.mdb, *.accdb)};' + 'DBQ=' + f'{assets.C_DB}' + ';'
     try:
-        con = pyodbc.connect(con_str)
+        con = backends._connect(db)
         return con
+    except Exception as e:
+        telemetry._record_connect_failure(db, e)
+        print(f'Connection to `{db}` failed. If connecting to "dev", you must be on-network. If using the sqlite backend, build the replicas with `src.sqlite_replica.build_replicas()`.')
+        raise
+
+def _use_backend(name:str) -> None:
+    """Switch the database backend, closing connections pooled by the old backend
+
+    Args:
+        name (str): one of `backends.BACKEND_CHOICES` e.g., 'sqlite'
+
+    Examples:
+        import src.db_connect as dbc
+        dbc._use_backend('sqlite')
+    """
+    assert name in backends.BACKEND_CHOICES, print(f'You entered `{name}`; `name` must be in {backends.BACKEND_CHOICES}')
+    if name != backends.BACKEND['name']:
+        _close_pool(verbose=False)
+        backends.BACKEND['name'] = name
+
+@contextmanager
+def _pooled_connection(db:str):
+    """Check out a connection to `db` from the pool; a new connection is opened only when no idle connection exists
+
+    The connection is returned to the pool (not closed) when the `with` block exits, so every caller in a `make_birds()` run shares one session per database.
+    Call `_close_pool()` at the end of the run to close the pooled connections.
+    Raises ConnectionError if no connection can be opened, so None is never yielded or pooled.
+
+    Args:
+        db (str): the database to connect to; must be in `assets.DB_CHOICES`
+
+    Examples:
+        import src.db_connect as dbc
+        with dbc._pooled_connection('access') as con:
+            df = dbc._exec_qry(con=con, qry='get_tbl_Sites')
+    """
+    con = None
+    start = time.perf_counter()
+    with _POOL_LOCK:
+        stats = POOL_STATS.setdefault(db, {'connects':0, 'reuses':0})
+        idle = POOL.setdefault(db, [])
+        if len(idle) > 0:
+            con = idle.pop()
+            stats['reuses'] += 1
+    if con is None:
+        con = _db_connect(db)
+        if con is None: # fail here, not as an AttributeError in each query that would have used it
+            raise ConnectionError(f'Could not open a connection to `{db}`')
+        with _POOL_LOCK:
+            stats['connects'] += 1
+    telemetry._set_acquire(time.perf_counter() - start)
+    try:
+        yield con
     except:
-        print('Connection to `{db}` failed. If connecting to "dev", you must be on-network.')
+        # don't hand a connection in an unknown state to the next caller
+        con.close()
+        raise
+    with _POOL_LOCK:
+        POOL[db].append(con)
+
+def _close_pool(verbose:bool=True) -> dict:
+    """Close every pooled connection and reset the pool counters
+
+    Args:
+        verbose (bool, optional): print the connects vs. reuses for each database. Defaults to True.
+
+    Returns:
+        dict: the counters for the run that just ended, e.g., {'access': {'connects': 1, 'reuses': 2}}
+    """
+    with _POOL_LOCK:
+        for db in POOL.keys():
+            for con in POOL[db]:
+                try:
+                    con.close()
+                except:
+                    pass
+        POOL.clear()
+        stats = {db: dict(counts) for db, counts in POOL_STATS.items()}
+        POOL_STATS.clear()
+    if verbose and len(stats) > 0:
+        print('Database connections (connects/reuses):')
+        for db, counts in stats.items():
+            print(f"    {db}: {counts['connects']}/{counts['reuses']}")
+
+    return stats
+
+def _exec_qry(con, qry:str, db:str='') -> pd.DataFrame:
+    """Execute `src/qry/{qry}.sql` against `con`
+
+    If `db` is in `SOURCE_DBS`, the result is served from, or saved to, the snapshot cache (see `_cache_path()`).
+
+    Args:
+        con: open DBAPI connection to `db`
+        qry (str): the name of a .sql file in `src/qry/` e.g., 'get_tbl_events'
+        db (str, optional): the `assets.DB_CHOICES` name of `con`; enables the snapshot cache. Defaults to ''.
+
+    Returns:
+        pd.DataFrame: query result
+    """
+    sql = _read_sql(qry)
+    path = _cache_path(db, qry, sql)
+    df = _read_cache(path, db, qry)
+    if df is None:
+        df = _run_qry(sql, con, qry, db)
+        _write_cache(df, path)
+    return df
+
+def _read_qry(db:str, qry:str, sql:str='') -> pd.DataFrame:
+    """Execute `src/qry/{qry}.sql` against `db`, connecting (via the pool) only if the snapshot cache can't serve the result
+
+    Args:
+        db (str): one of `assets.DB_CHOICES`
+        qry (str): the name of a .sql file in `src/qry/` e.g., 'get_tbl_events'
+        sql (str, optional): run this instead of the file's SQL, e.g., a column-projected rewrite from `src.build_tbls._project_sql()`. Defaults to ''.
+
+    Examples:
+        import src.db_connect as dbc
+        df = dbc._read_qry(db='c', qry='get_c_tbl_Events')
+    """
+    if sql == '':
+        sql = _read_sql(qry)
+    path = _cache_path(db, qry, sql)
+    df = _read_cache(path, db, qry)
+    if df is None:
+        with _pooled_connection(db) as con:
+            df = _run_qry(sql, con, qry, db)
+        _write_cache(df, path)
+    return df
+
+def _probe_columns(db:str, qry:str, sql:str='') -> list:
+    """List the columns `qry` returns, without fetching any rows
+
+    The zero-row probe is cached like any other snapshot, so repeat runs don't connect to learn the columns.
+
+    Examples:
+        import src.db_connect as dbc
+        cols = dbc._probe_columns(db='access', qry='get_tbl_field_data')
+    """
+    if sql == '':
+        sql = _read_sql(qry)
+    probe = f"SELECT * FROM ({sql.strip().rstrip(';')}) AS probe WHERE 1=0"
+    path = _cache_path(db, f'{qry}.columns', probe)
+    df = _read_cache(path, db, f'{qry}.columns')
+    if df is None:
+        with _pooled_connection(db) as con:
+            df = _run_qry(probe, con, f'{qry}.columns', db)
+        _write_cache(df, path)
+
+    return list(df.columns)
+
+def _get_extract(source_dict:dict, db:str, qry:str) -> pd.DataFrame:
+    """Return the result of `qry` from `src.build_tbls._get_src_tbls()` output, or query it now if it wasn't extracted up front
+
+    Examples:
+        df = dbc._get_extract(source_dict, 'c', 'get_c_tbl_Events')
+    """
+    if source_dict is not None and qry in source_dict.keys():
+        return source_dict[qry]
+    return _read_qry(db=db, qry=qry)
 
-def _exec_qry(con:pyodbc.connect, qry:str) -> pd.DataFrame:
+def _run_qry(sql:str, con, qry:str, db:str='', params:list=None) -> pd.DataFrame:
+    """Run `sql` on `con`, recording its acquire/execute/fetch times and result size in `telemetry.QUERY_LOG`"""
+    timings = telemetry._start()
+    timed_con = telemetry._TimedConnection(con, timings)
+    try:
+        if qry in SOURCE_DTYPES.keys():
+            df = _stream_qry(sql, timed_con, SOURCE_DTYPES[qry], params=params)
+        else:
+            df = pd.read_sql_query(sql, timed_con, params=params)
+    except Exception as e:
+        telemetry._record_query(db, qry, timings, error=e)
+        raise
+    telemetry._record_query(db, qry, timings, df=df)
+
+    return df
+
+def _stream_qry(sql:str, con, dtypes:dict, chunksize:int=CHUNKSIZE, params:list=None) -> pd.DataFrame:
+    """Read a query result `chunksize` rows at a time, casting each chunk to `dtypes` before the next chunk is fetched
+
+    Only one chunk of raw driver rows is held in memory at a time, and the pinned categoricals/small ints are far smaller than the default object/float64 columns.
+
+    Args:
+        sql (str): the query
+        con: open DBAPI connection
+        dtypes (dict): {column: dtype} e.g., {'AOU_Code':'category', 'Interval':'Int8'}; columns absent from the result are ignored
+        chunksize (int, optional): rows per chunk. Defaults to `CHUNKSIZE`.
+        params (list, optional): query parameters, for `?` placeholders. Defaults to None.
+
+    Returns:
+        pd.DataFrame: query result
+    """
+    chunks = []
+    for chunk in pd.read_sql_query(sql, con, chunksize=chunksize, params=params):
+        for col, dtype in dtypes.items():
+            if col in chunk.columns:
+                try:
+                    chunk[col] = chunk[col].astype(dtype)
+                except:
+                    print(f'WARNING! Could not cast `{col}` to `{dtype}` while streaming; leaving its inferred dtype.')
+        chunks.append(chunk)
+
+    return _concat_chunks(chunks)
+
+def _concat_chunks(chunks:list) -> pd.DataFrame:
+    """Concatenate streamed chunks without losing their categoricals
+
+    `pd.concat()` falls back to object dtype when chunks hold different categories, so first give every chunk the union of the categories.
+    """
+    if len(chunks) == 1:
+        return chunks[0]
+    for col in chunks[0].columns:
+        if all(isinstance(chunk[col].dtype, pd.CategoricalDtype) for chunk in chunks):
+            categories = union_categoricals([chunk[col] for chunk in chunks]).categories
+            for chunk in chunks:
+                chunk[col] = chunk[col].cat.set_categories(categories)
+    df = pd.concat(chunks, ignore_index=True)
+
+    return df
+
+def _compare_read_modes(db:str, qry:str) -> dict:
+    """Report peak memory for reading `qry` in one piece vs. streaming it with `SOURCE_DTYPES` pinned
+
+    Examples:
+        import src.db_connect as dbc
+        dbc._compare_read_modes('access', 'get_tbl_field_data')
+    """
+    sql = _read_sql(qry)
+    modes = {
+        'read_sql_query': lambda con: pd.read_sql_query(sql,con)
+        ,'streaming': lambda con: _stream_qry(sql, con, SOURCE_DTYPES.get(qry, {}))
+    }
+    report = {}
+    with _pooled_connection(db) as con:
+        for mode, read in modes.items():
+            tracemalloc.start()
+            df = read(con)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            report[mode] = {'peak_mb': round(peak/2**20, 1), 'frame_mb': round(df.memory_usage(deep=True).sum()/2**20, 1), 'rows': len(df)}
+            del df
+    print(f'Peak memory reading `{qry}` from `{db}`:')
+    for mode, stats in report.items():
+        print(f"    {mode}: peak {stats['peak_mb']} MB, final frame {stats['frame_mb']} MB, {stats['rows']} rows")
+
+    return report
+
+def _read_sql(qry:str) -> str:
     with open(f'src/qry/{qry}.sql', 'r') as query:
-        df = pd.read_sql_query(query.read(),con)
+        sql = query.read()
+    return sql
+
+def _configure_cache(refresh:bool=False, enabled:bool=True) -> None:
+    """Set the snapshot-cache behavior for the next run
+
+    Args:
+        refresh (bool, optional): re-query every source and overwrite its snapshot. Defaults to False.
+        enabled (bool, optional): read and write snapshots at all. Defaults to True.
+    """
+    CACHE['refresh'] = refresh
+    CACHE['enabled'] = enabled
+    _REFRESHED.clear()
+
+def _cache_path(db:str, qry:str, sql:str) -> str:
+    """Make the content-addressed snapshot filepath for a query
+
+    The key hashes the SQL text together with the mtime and size of the source-database file, so editing either the query or the source file misses the cache.
+    The filename also carries a hash of the SQL alone, so `_write_cache()` prunes only the snapshots of the same SQL (e.g., a projected and an unprojected read of one query are kept apart).
+
+    Returns:
+        str: e.g., 'assets/cache/qry/access/get_tbl_events-9a0b...-3f1c...parquet'; '' if `db` can't be cached
+    """
+    if not CACHE['enabled'] or db not in SOURCE_DBS:
+        return ''
+    try:
+        stat = os.stat(backends._source_file(db))
+    except:
+        return ''
+    key = hashlib.sha256('|'.join([sql, str(stat.st_mtime_ns), str(stat.st_size)]).encode('utf-8')).hexdigest()
+    sql_key = hashlib.sha256(sql.encode('utf-8')).hexdigest()
+    folder = db if backends.BACKEND['name'] == 'odbc' else f"{db}-{backends.BACKEND['name']}" # keep each backend's snapshots apart, since `_write_cache()` prunes a query's other snapshots
+    path = os.path.join(CACHE['dir'], folder, f'{qry}-{sql_key[:12]}-{key[:20]}.parquet')
+
+    return path
+
+def _read_cache(path:str, db:str='', qry:str='') -> pd.DataFrame:
+    if path == '' or not os.path.exists(path):
+        return None
+    if CACHE['refresh'] and path not in _REFRESHED:
+        return None
+    timings = telemetry._start(after_checkout=False)
+    try:
+        df = pd.read_parquet(path)
+        telemetry._record_query(db, qry, timings, df=df, event='cache_hit')
+    except:
+        print(f'WARNING! Could not read cached snapshot `{path}`; re-querying the source.')
+        df = None
+
     return df
 
+def _write_cache(df:pd.DataFrame, path:str) -> None:
+    """Write a snapshot and drop the older snapshots of the same query and SQL; a failed write raises (e.g., without pyarrow), so a cache that never persists doesn't go unnoticed"""
+    if path == '':
+        return None
+    sql_prefix = os.path.basename(path).rsplit('-', 1)[0] # '{qry}-{sql hash}'
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        df.to_parquet(path, index=False)
+        _REFRESHED.add(path)
+    except Exception:
+        print(f'FAIL: could not cache `{sql_prefix}` to `{path}`; `to_parquet()` requires pyarrow (see requirements.txt), or turn the cache off with `CACHE[\'enabled\'] = False`.')
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    # drop stale snapshots of the same SQL, e.g., from before the source file changed
+    for stale in glob.glob(os.path.join(os.path.dirname(path), f'{sql_prefix}-*.parquet')):
+        if os.path.normpath(stale) != os.path.normpath(path):
+            os.remove(stale)
+
+    return None
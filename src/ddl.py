@@ -0,0 +1,344 @@
+"""Parse the CREATE TABLE script (`assets.CREATE_SQL`) into a typed constraint catalog, cached next to the script
+
+`load_catalog()` tokenizes the script once (comments, [bracketed] and "quoted" identifiers, 'strings', numbers, words, and punctuation) and parses every CREATE TABLE into:
+    {'version': 1, 'sha256': <the script's hash>, 'ddl': <its path>, 'tables': {schema: {tbl: {
+        'columns': [{'name', 'type', 'params', 'nullable', 'identity', 'default'}]
+        ,'primary_key': {'name', 'columns'} or None
+        ,'foreign_keys': [{'name', 'columns', 'references': {'schema', 'table', 'columns'}}]
+        ,'unique': [{'name', 'columns'}]
+        ,'checks': [{'name', 'column', 'expression'}]
+    }}}}
+e.g., a column `[Latitude] DECIMAL (9, 6) NULL` is {'name': 'Latitude', 'type': 'DECIMAL', 'params': '9, 6', 'nullable': True, 'identity': False, 'default': None}; `default` and `expression` are the SQL text as written.
+Column-level and table-level constraints land in the same lists, and a reference without a schema (e.g., `REFERENCES [Role] ([ID])`) is in 'dbo', SQL Server's default schema.
+
+The catalog is written to `<script>.catalog.json` (see `catalog_path()`) with the script's sha256, so a later run whose script hasn't changed reads the JSON instead of parsing; within a run it's memoized by the script's path, mtime, and size.
+`src.tbl_xwalks._preprocess_sql()`, `_field_sql_constraints()`, and `_table_sql_constraints()` turn a table's catalog entry into its `constraint_df` and `unique_vals`.
+"""
+import assets.assets as assets
+import hashlib
+import json
+import re
+import os
+
+CATALOG = {
+    'cache': True # read and write `<script>.catalog.json`; False to parse the script every time
+    ,'suffix': '.catalog.json'
+}
+CATALOG_VERSION = 1 # bump when the catalog's layout changes, so cached catalogs are parsed again
+_CATALOGS = {} # {(path, mtime_ns, size): catalog} for this process
+# one token per match: whitespace and comments are skipped; `kind` is the name of the group that matched
+_TOKEN = re.compile(r"""
+    (?P<space>\s+)
+    |(?P<comment>--[^\n]*|/\*.*?\*/)
+    |(?P<ident>\[(?:[^\]]|\]\])*\]|"(?:[^"]|"")*")
+    |(?P<string>N?'(?:[^']|'')*')
+    |(?P<number>\d+(?:\.\d+)?)
+    |(?P<word>[A-Za-z_@#][\w@$#]*)
+    |(?P<punct>[(),.;])
+    |(?P<op>[^\s\w()\[\],.;'"]+)
+""", re.VERBOSE | re.DOTALL)
+# words that end a column's DEFAULT expression
+_COLUMN_OPTIONS = {'NOT', 'NULL', 'CONSTRAINT', 'PRIMARY', 'UNIQUE', 'REFERENCES', 'FOREIGN', 'CHECK', 'IDENTITY', 'COLLATE', 'ROWGUIDCOL', 'SPARSE', 'DEFAULT'}
+_TABLE_CONSTRAINTS = {'CONSTRAINT', 'PRIMARY', 'FOREIGN', 'UNIQUE', 'CHECK', 'INDEX'}
+
+def load_catalog(path:str=None) -> dict:
+    """The constraint catalog of a CREATE TABLE script: memoized, else read from `catalog_path(path)` if the script's hash matches, else parsed (and cached)
+
+    Args:
+        path (str, optional): the script. Defaults to None, i.e., `assets.CREATE_SQL`.
+
+    Returns:
+        dict: the catalog; don't modify it, it's shared by every caller in the run
+
+    Examples:
+        import src.ddl as ddl
+        catalog = ddl.load_catalog()
+        catalog['tables']['ncrn']['BirdDetection']['foreign_keys']
+    """
+    path = assets.CREATE_SQL if path is None else path
+    stat = os.stat(path)
+    stamp = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    if stamp in _CATALOGS.keys():
+        return _CATALOGS[stamp]
+    with open(path, 'rb') as f:
+        raw = f.read()
+    digest = hashlib.sha256(raw).hexdigest()
+    catalog = _read_catalog(path, digest) if CATALOG['cache'] else None
+    if catalog is None:
+        catalog = {'version':CATALOG_VERSION, 'sha256':digest, 'ddl':path, 'tables':parse_ddl(_decode(raw))}
+        if CATALOG['cache']:
+            _write_catalog(path, catalog)
+    _CATALOGS[stamp] = catalog
+
+    return catalog
+
+def catalog_path(path:str) -> str:
+    """Where a script's catalog is cached e.g., 'assets/db/NCRN_Landbirds.sql' -> 'assets/db/NCRN_Landbirds.catalog.json'"""
+    return os.path.splitext(path)[0] + CATALOG['suffix']
+
+def parse_ddl(sql:str) -> dict:
+    """Parse every CREATE TABLE statement in a script; other statements are skipped
+
+    Returns:
+        dict: {schema: {tbl: table}}; see the module docstring for a table's layout
+    """
+    tokens = tokenize(sql)
+    tables = {}
+    i = 0
+    while i < len(tokens) - 1:
+        if _is_word(tokens[i], 'CREATE') and _is_word(tokens[i+1], 'TABLE'):
+            i, schema, tbl, table = _parse_create_table(sql, tokens, i+2)
+            if tbl is not None:
+                tables.setdefault(schema, {})[tbl] = table
+        else:
+            i += 1
+
+    return tables
+
+def tokenize(sql:str) -> list:
+    """Split SQL into (kind, value, start, end) tuples; `kind` is 'ident', 'string', 'number', 'word', 'punct', or 'op', and a bracketed or quoted identifier's value is its name"""
+    tokens = []
+    for match in _TOKEN.finditer(sql):
+        kind = match.lastgroup
+        if kind in ['space', 'comment']:
+            continue
+        value = match.group(0)
+        if kind == 'ident':
+            value = value[1:-1].replace(']]', ']') if value.startswith('[') else value[1:-1].replace('""', '"')
+        tokens.append((kind, value, match.start(), match.end()))
+
+    return tokens
+
+def _parse_create_table(sql:str, tokens:list, i:int) -> tuple:
+    """Parse `[schema].[tbl] ( element, ... )` starting at `tokens[i]`
+
+    Returns:
+        tuple: (the index after the statement, schema, tbl, table); tbl is None if the statement couldn't be read
+    """
+    names, i = _qualified_name(tokens, i)
+    if len(names) == 0 or i >= len(tokens) or tokens[i][1] != '(':
+        return i, None, None, None
+    schema, tbl = (['dbo'] + names)[-2:]
+    table = {'columns':[], 'primary_key':None, 'foreign_keys':[], 'unique':[], 'checks':[]}
+    end = _closing(tokens, i)
+    for element in _split_commas(tokens[i+1:end]):
+        if len(element) == 0:
+            continue
+        if element[0][0] == 'word' and element[0][1].upper() in _TABLE_CONSTRAINTS:
+            _parse_table_constraint(sql, element, table)
+        else:
+            _parse_column(sql, element, table)
+
+    return end + 1, schema, tbl, table
+
+def _parse_column(sql:str, element:list, table:dict) -> None:
+    """Parse one column definition e.g., `[Code] VARCHAR (10) NOT NULL CONSTRAINT [DF_x] DEFAULT ('A')`"""
+    column = {'name':element[0][1], 'type':None, 'params':None, 'nullable':True, 'identity':False, 'default':None}
+    table['columns'].append(column)
+    i = 1
+    if i < len(element) and _is_word(element[i], 'AS'): # a computed column has no type
+        return None
+    if i < len(element) and element[i][0] in ['word', 'ident']:
+        column['type'] = element[i][1].upper()
+        i += 1
+    if i < len(element) and element[i][1] == '(':
+        end = _closing(element, i)
+        column['params'] = _text(sql, element, i+1, end)
+        i = end + 1
+    name = None
+    while i < len(element):
+        word = element[i][1].upper() if element[i][0] == 'word' else ''
+        if word == 'NOT' and i+1 < len(element) and _is_word(element[i+1], 'NULL'):
+            column['nullable'] = False
+            i += 2
+        elif word == 'NULL':
+            column['nullable'] = True
+            i += 1
+        elif word == 'IDENTITY':
+            column['identity'] = True
+            i += 1
+            if i < len(element) and element[i][1] == '(':
+                i = _closing(element, i) + 1
+        elif word == 'CONSTRAINT':
+            name = element[i+1][1] if i+1 < len(element) else None
+            i += 2
+            continue
+        elif word == 'DEFAULT':
+            start = i + 1
+            i = _expression_end(element, start)
+            if i == start and i < len(element) and _is_word(element[i], 'NULL'): # `DEFAULT NULL`
+                i += 1
+            column['default'] = _text(sql, element, start, i)
+        elif word == 'PRIMARY':
+            i = _skip_words(element, i+1, ['KEY', 'CLUSTERED', 'NONCLUSTERED'])
+            if table['primary_key'] is None:
+                table['primary_key'] = {'name':name, 'columns':[column['name']]}
+        elif word == 'UNIQUE':
+            i = _skip_words(element, i+1, ['CLUSTERED', 'NONCLUSTERED'])
+            table['unique'].append({'name':name, 'columns':[column['name']]})
+        elif word in ['FOREIGN', 'REFERENCES']:
+            i = _skip_words(element, i, ['FOREIGN', 'KEY', 'REFERENCES'])
+            references, i = _references(element, i)
+            table['foreign_keys'].append({'name':name, 'columns':[column['name']], 'references':references})
+        elif word == 'CHECK':
+            i = _skip_words(element, i+1, ['NOT', 'FOR', 'REPLICATION'])
+            end = _closing(element, i) if i < len(element) and element[i][1] == '(' else i
+            table['checks'].append({'name':name, 'column':column['name'], 'expression':_text(sql, element, i+1, end)})
+            i = end + 1
+        elif word == 'COLLATE':
+            i += 2
+        else:
+            i += 1
+        name = None
+
+    return None
+
+def _parse_table_constraint(sql:str, element:list, table:dict) -> None:
+    """Parse one table constraint e.g., `CONSTRAINT [PK_x] PRIMARY KEY CLUSTERED ([ID] ASC)`"""
+    name = None
+    i = 0
+    if _is_word(element[i], 'CONSTRAINT'):
+        name = element[i+1][1] if i+1 < len(element) else None
+        i += 2
+    if i >= len(element):
+        return None
+    word = element[i][1].upper()
+    if word == 'PRIMARY':
+        i = _skip_words(element, i+1, ['KEY', 'CLUSTERED', 'NONCLUSTERED'])
+        table['primary_key'] = {'name':name, 'columns':_column_list(element, i)[0]}
+    elif word == 'UNIQUE':
+        i = _skip_words(element, i+1, ['CLUSTERED', 'NONCLUSTERED'])
+        table['unique'].append({'name':name, 'columns':_column_list(element, i)[0]})
+    elif word == 'FOREIGN':
+        i = _skip_words(element, i+1, ['KEY'])
+        columns, i = _column_list(element, i)
+        i = _skip_words(element, i, ['REFERENCES'])
+        references, i = _references(element, i)
+        table['foreign_keys'].append({'name':name, 'columns':columns, 'references':references})
+    elif word == 'CHECK':
+        i = _skip_words(element, i+1, ['NOT', 'FOR', 'REPLICATION'])
+        end = _closing(element, i) if i < len(element) and element[i][1] == '(' else i
+        table['checks'].append({'name':name, 'column':None, 'expression':_text(sql, element, i+1, end)})
+
+    return None
+
+def _references(tokens:list, i:int) -> tuple:
+    """`[schema].[tbl] ([col], ...)` starting at `tokens[i]`, as ({'schema', 'table', 'columns'}, the index after it)"""
+    names, i = _qualified_name(tokens, i)
+    columns, i = _column_list(tokens, i)
+    schema, tbl = (['dbo'] + names)[-2:] if len(names) > 0 else (None, None)
+
+    return {'schema':schema, 'table':tbl, 'columns':columns}, i
+
+def _qualified_name(tokens:list, i:int) -> tuple:
+    """The parts of a dotted name e.g., `[NCRN_Landbirds].[ncrn].[Park]` -> ['NCRN_Landbirds', 'ncrn', 'Park'], and the index after it"""
+    names = []
+    while i < len(tokens) and tokens[i][0] in ['ident', 'word']:
+        names.append(tokens[i][1])
+        i += 1
+        if i < len(tokens) and tokens[i][1] == '.':
+            i += 1
+        else:
+            break
+
+    return names, i
+
+def _column_list(tokens:list, i:int) -> tuple:
+    """The column names in `([a] ASC, [b] DESC)` starting at `tokens[i]`, and the index after it; ([], i) if `tokens[i]` isn't '('"""
+    if i >= len(tokens) or tokens[i][1] != '(':
+        return [], i
+    end = _closing(tokens, i)
+    columns = [x[0][1] for x in _split_commas(tokens[i+1:end]) if len(x) > 0]
+
+    return columns, end + 1
+
+def _split_commas(tokens:list) -> list:
+    """Split tokens on the commas that aren't inside parentheses"""
+    parts = [[]]
+    depth = 0
+    for token in tokens:
+        if token[1] == '(':
+            depth += 1
+        elif token[1] == ')':
+            depth -= 1
+        if token[0] == 'punct' and token[1] == ',' and depth == 0:
+            parts.append([])
+        else:
+            parts[-1].append(token)
+
+    return parts
+
+def _closing(tokens:list, i:int) -> int:
+    """The index of the ')' that closes the '(' at `tokens[i]`; the last index if it isn't closed"""
+    depth = 0
+    for j in range(i, len(tokens)):
+        if tokens[j][0] == 'punct' and tokens[j][1] == '(':
+            depth += 1
+        elif tokens[j][0] == 'punct' and tokens[j][1] == ')':
+            depth -= 1
+            if depth == 0:
+                return j
+
+    return len(tokens) - 1
+
+def _expression_end(tokens:list, i:int) -> int:
+    """The index after an expression (e.g., a DEFAULT) starting at `tokens[i]`: the next column option outside parentheses"""
+    depth = 0
+    while i < len(tokens):
+        if tokens[i][1] == '(':
+            depth += 1
+        elif tokens[i][1] == ')':
+            depth -= 1
+        elif depth == 0 and tokens[i][0] == 'word' and tokens[i][1].upper() in _COLUMN_OPTIONS:
+            break
+        i += 1
+
+    return i
+
+def _skip_words(tokens:list, i:int, words:list) -> int:
+    while i < len(tokens) and tokens[i][0] == 'word' and tokens[i][1].upper() in words:
+        i += 1
+
+    return i
+
+def _is_word(token:tuple, word:str) -> bool:
+    return token[0] == 'word' and token[1].upper() == word
+
+def _text(sql:str, tokens:list, start:int, end:int) -> str:
+    """The SQL text of `tokens[start:end]` as written; None if it's empty"""
+    if end <= start or start >= len(tokens):
+        return None
+
+    return sql[tokens[start][2]:tokens[min(end, len(tokens))-1][3]]
+
+def _decode(raw:bytes) -> str:
+    """The script's text: UTF-16 if it has a UTF-16 byte-order mark (as SSMS can save it), else UTF-8, else Latin-1"""
+    if raw.startswith(b'\xff\xfe') or raw.startswith(b'\xfe\xff'):
+        return raw.decode('utf-16')
+    try:
+        return raw.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        return raw.decode('latin-1')
+
+def _read_catalog(path:str, digest:str):
+    """The cached catalog if it was made from a script with this hash by this version of the parser; else None"""
+    try:
+        with open(catalog_path(path), 'r') as f:
+            catalog = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if catalog.get('sha256') != digest or catalog.get('version') != CATALOG_VERSION:
+        return None
+
+    return catalog
+
+def _write_catalog(path:str, catalog:dict) -> None:
+    """Cache a catalog next to its script; a failure is reported, not raised, because the catalog itself is fine"""
+    try:
+        with open(catalog_path(path) + '.tmp', 'w') as f:
+            json.dump(catalog, f, indent=1)
+        os.replace(catalog_path(path) + '.tmp', catalog_path(path))
+    except OSError:
+        print(f'WARNING! Could not cache the constraint catalog to `{catalog_path(path)}`.')
+
+    return None
@@ -0,0 +1,248 @@
+"""Incremental extraction of the event tables, using `Entered_Date`/`Updated_Date` high-water marks
+
+A full extraction re-reads every event and bird detection back to 2007. In incremental mode, each query in `INCREMENTAL_QRYS` reads only the events entered or updated since its high-water mark (plus those events' `tbl_Field_Data` rows) and merges them into its previous snapshot.
+The delta is widened with the records `tbl_History` logs a change to since the high-water mark, so an edit made directly in `tbl_Field_Data` is picked up, and a logged record that no longer exists is deleted from the snapshot.
+Snapshots and high-water marks are only saved by `_commit()`, after `make_birds()` succeeds, so a failed run is retried from the last good state.
+
+Limitations: deletes and edits that `tbl_History` doesn't log and that don't touch `tbl_Events.Updated_Date` are only picked up by a full extraction (`python main.py --refresh-source`).
+"""
+import src.db_connect as dbc
+import src.backends as backends
+import pandas as pd
+import numpy as np
+import threading
+import hashlib
+import json
+import os
+
+INCREMENTAL = {
+    'enabled': False
+    ,'dir': 'assets/cache/incremental' # snapshots and `watermarks.json`
+    ,'verify': False # also run each merged query in full and check the merge matches it; see `_verify_merge()`
+}
+# how to find each database's high-water mark; it is read before the deltas, so rows entered during the run are re-read next run rather than missed
+WATERMARK_SQL = "SELECT MAX(Entered_Date) AS entered_date, MAX(Updated_Date) AS updated_date FROM tbl_Events;"
+# the records changed since the high-water mark, by table; `?` is the high-water mark
+HISTORY_SQL = "SELECT Table_Name, Record_ID FROM tbl_History WHERE Change_Date >= ?;"
+# the queries that can be extracted incrementally
+# -key: the column on which changed rows replace the previous snapshot's rows
+# -row_key: the column that identifies one row, so a changed row keeps its position; the same as `key` for the event queries
+# -where: the delta predicate on the query's own columns (`delta` is the query, wrapped as a subquery); every `?` is the high-water mark. `>=` because `Entered_Date` has no time part, so a later entry on the same day would be missed by `>`
+# -columns: the query's columns that `where` reads, so `src.build_tbls._project_sql()` keeps them
+# -history: the `tbl_History.Table_Name`s whose `Record_ID` is a `key` or a `row_key`; a logged record that's missing from the delta was deleted
+_EVENTS_WHERE = "delta.entered_date >= ? OR delta.updated_date >= ? OR delta.event_id IN (SELECT Record_ID FROM tbl_History WHERE Table_Name = 'tbl_Events' AND Change_Date >= ?)"
+_FIELD_DATA_WHERE = "delta.Event_ID IN (SELECT Event_ID FROM tbl_Events WHERE Entered_Date >= ? OR Updated_Date >= ?) OR delta.Event_ID IN (SELECT Record_ID FROM tbl_History WHERE Table_Name = 'tbl_Events' AND Change_Date >= ?) OR delta.Event_ID IN (SELECT Event_ID FROM tbl_Field_Data WHERE Data_ID IN (SELECT Record_ID FROM tbl_History WHERE Table_Name = 'tbl_Field_Data' AND Change_Date >= ?))"
+INCREMENTAL_QRYS = {
+    'get_tbl_events': {
+        'key': 'event_id'
+        ,'row_key': 'event_id'
+        ,'where': _EVENTS_WHERE
+        ,'columns': ['entered_date', 'updated_date']
+        ,'history': {'key': ['tbl_Events'], 'row_key': []}
+    }
+    ,'get_tbl_field_data': {
+        'key': 'Event_ID'
+        ,'row_key': 'Data_ID'
+        ,'where': _FIELD_DATA_WHERE
+        ,'columns': []
+        ,'history': {'key': ['tbl_Events'], 'row_key': ['tbl_Field_Data']}
+    }
+    ,'get_c_tbl_Events': {
+        'key': 'event_id'
+        ,'row_key': 'event_id'
+        ,'where': _EVENTS_WHERE
+        ,'columns': ['entered_date', 'updated_date']
+        ,'history': {'key': ['tbl_Events'], 'row_key': []}
+    }
+    ,'get_c_tbl_Field_Data': {
+        'key': 'Event_ID'
+        ,'row_key': 'Data_ID'
+        ,'where': _FIELD_DATA_WHERE
+        ,'columns': []
+        ,'history': {'key': ['tbl_Events'], 'row_key': ['tbl_Field_Data']}
+    }
+}
+_PENDING = {} # {state key: (df, snapshot path, sql hash, watermark)}; saved by `_commit()`
+_WATERMARKS = {} # this run's high-water mark for each `db`
+_HISTORY = {} # {(db, watermark): the `HISTORY_SQL` result}, read once per run
+_LOCK = threading.Lock()
+
+def _configure(enabled:bool=False, verify:bool=False) -> None:
+    """Turn incremental extraction on or off for the next run, and forget anything pending from an earlier run"""
+    INCREMENTAL['enabled'] = enabled
+    INCREMENTAL['verify'] = verify
+    with _LOCK:
+        _PENDING.clear()
+        _WATERMARKS.clear()
+        _HISTORY.clear()
+
+def _read_qry(db:str, qry:str, sql:str) -> pd.DataFrame:
+    """Read `qry` incrementally if it has a usable previous snapshot, otherwise in full
+
+    Args:
+        db (str): one of `assets.DB_CHOICES`
+        qry (str): a key of `INCREMENTAL_QRYS` e.g., 'get_tbl_events'
+        sql (str): the query's SQL, possibly column-projected; a snapshot taken with different SQL is not reused
+
+    Returns:
+        pd.DataFrame: query result
+
+    Examples:
+        import src.incremental as inc
+        inc._configure(enabled=True)
+        df = inc._read_qry('access', 'get_tbl_events', dbc._read_sql('get_tbl_events'))
+    """
+    cached = dbc._read_cache(dbc._cache_path(db, qry, sql), db, qry)
+    if cached is not None: # the source file hasn't changed since the snapshot cache was written
+        return cached
+
+    state_key = _state_key(db, qry)
+    sql_hash = hashlib.sha256(sql.encode('utf-8')).hexdigest()
+    record = _load_state()['snapshots'].get(state_key)
+    watermark = _run_watermark(db)
+    path = os.path.join(INCREMENTAL['dir'], f'{state_key}.parquet')
+    full = record is None or record['sql'] != sql_hash or record['watermark'] is None or not os.path.exists(path) or dbc.CACHE['refresh']
+    if full:
+        df = dbc._read_qry(db=db, qry=qry, sql=sql)
+    else:
+        history = _read_history(db, record['watermark'])
+        logged = {x: set(history.loc[history['Table_Name'].isin(INCREMENTAL_QRYS[qry]['history'][x]), 'Record_ID'].astype(str)) for x in ['key', 'row_key']}
+        df = _merge(pd.read_parquet(path), _read_delta(db, qry, sql, record['watermark']), INCREMENTAL_QRYS[qry]['key'], INCREMENTAL_QRYS[qry]['row_key'], logged['key'], logged['row_key'])
+        if INCREMENTAL['verify']:
+            _verify_merge(db, qry, sql, df)
+    with _LOCK:
+        _PENDING[state_key] = (df, path, sql_hash, watermark)
+
+    return df
+
+def _read_delta(db:str, qry:str, sql:str, watermark:str) -> pd.DataFrame:
+    """Read the rows of `qry` entered, updated, or logged in `tbl_History` since `watermark`
+
+    `qry` is wrapped as a subquery, so the predicate applies to its result whether or not its SQL already has a WHERE, GROUP BY, or join.
+    """
+    where = INCREMENTAL_QRYS[qry]['where']
+    delta_sql = f"SELECT * FROM ({sql.strip().rstrip(';')}) AS delta WHERE {where};"
+    since = pd.Timestamp(watermark).to_pydatetime()
+    with dbc._pooled_connection(db) as con:
+        delta = dbc._run_qry(delta_sql, con, qry, db, params=[since]*where.count('?')) # streamed with `dbc.SOURCE_DTYPES` pinned, like the full query
+    print(f'Incremental: {len(delta)} new or changed rows from `{db}.{qry}` since {watermark}')
+
+    return delta
+
+def _merge(previous:pd.DataFrame, delta:pd.DataFrame, key:str, row_key:str, logged_keys:set=None, logged_rows:set=None) -> pd.DataFrame:
+    """Replace the previous snapshot's rows for every `key` in `delta`, and delete the logged records that aren't in `delta`
+
+    A row still in `delta` (by `row_key`) keeps its previous position, a row of a changed `key` that isn't in `delta` was deleted, and a new row is appended in `delta` order.
+    Rows are never moved, so this is the order a full extraction returns, e.g., previous Data_ID 1, 2, 3, 4 for events A, A, B, B plus a delta of 1, 2, 5 for event A is 1, 2, 3, 4, 5.
+    A `key` in `logged_keys` or a `row_key` in `logged_rows` (the `Record_ID`s `tbl_History` logged, see `_read_history()`) is replaced the same way, so one that's missing from `delta` is deleted, e.g., with `logged_rows={'4'}`, the example above is 1, 2, 3, 5.
+    """
+    logged_keys = set() if logged_keys is None else logged_keys
+    logged_rows = set() if logged_rows is None else logged_rows
+    replaced = previous[key].isin(delta[key]) | previous[row_key].isin(delta[row_key])
+    if len(logged_keys) > 0:
+        replaced = replaced | previous[key].astype(str).isin(logged_keys)
+    if len(logged_rows) > 0:
+        replaced = replaced | previous[row_key].astype(str).isin(logged_rows)
+    kept = previous[replaced==False]
+    position = pd.Series(range(len(previous)), index=previous[row_key].values)
+    position = position[~position.index.duplicated(keep='first')]
+    delta_position = delta[row_key].map(position).to_numpy(dtype=float, na_value=np.nan, copy=True)
+    new_rows = pd.isna(delta_position)
+    delta_position[new_rows] = len(previous) + np.arange(new_rows.sum())
+    df = dbc._concat_chunks([kept.copy(), delta])
+    order = np.concatenate([np.flatnonzero(replaced.to_numpy()==False), delta_position])
+    df = df.iloc[order.argsort(kind='stable')].reset_index(drop=True)
+
+    return df
+
+def _verify_merge(db:str, qry:str, sql:str, merged:pd.DataFrame) -> bool:
+    """Check a merged query against the same query run in full; a mismatch means the next run should be a full extraction (`python main.py --refresh-source`)
+
+    Returns:
+        bool: True if the merged and full extractions are equal, row for row
+    """
+    full = dbc._read_qry(db=db, qry=qry, sql=sql)
+    try:
+        pd.testing.assert_frame_equal(merged, full, check_dtype=False, check_categorical=False)
+        print(f'Incremental: `{db}.{qry}` merged extract matches a full extract ({len(full)} rows).')
+        return True
+    except AssertionError as e:
+        print(f'FAIL: `{db}.{qry}` merged extract does not match a full extract: {str(e).splitlines()[0] if str(e) != "" else ""}')
+        return False
+
+def _read_history(db:str, watermark:str) -> pd.DataFrame:
+    """The `Table_Name` and `Record_ID` of every change `tbl_History` logged in `db` since `watermark`, read once per run"""
+    with _LOCK:
+        if (db, watermark) in _HISTORY.keys():
+            return _HISTORY[(db, watermark)]
+    since = pd.Timestamp(watermark).to_pydatetime()
+    with dbc._pooled_connection(db) as con:
+        history = dbc._run_qry(HISTORY_SQL, con, 'history', db, params=[since])
+    print(f'Incremental: {len(history)} changes logged in `{db}.tbl_History` since {watermark}')
+    with _LOCK:
+        _HISTORY[(db, watermark)] = history
+
+    return history
+
+def _run_watermark(db:str) -> str:
+    """This run's high-water mark for `db`: the latest `Entered_Date` or `Updated_Date` in `tbl_Events`, read once per run"""
+    with _LOCK:
+        if db in _WATERMARKS.keys():
+            return _WATERMARKS[db]
+    try:
+        with dbc._pooled_connection(db) as con:
+            df = dbc._run_qry(WATERMARK_SQL, con, 'watermark', db)
+        marks = [pd.Timestamp(x) for x in df.iloc[0].values if not pd.isna(x)]
+        watermark = max(marks).isoformat() if len(marks) > 0 else None
+    except:
+        print(f'WARNING! Could not read the high-water mark of `{db}`; its next run will be a full extraction.')
+        watermark = None
+    with _LOCK:
+        _WATERMARKS[db] = watermark
+
+    return watermark
+
+def _commit() -> list:
+    """Save this run's merged snapshots and high-water marks; call only after a successful run
+
+    Returns:
+        list: the state keys that were saved e.g., ['access/get_tbl_events', 'access/get_tbl_field_data']
+    """
+    with _LOCK:
+        pending = dict(_PENDING)
+        _PENDING.clear()
+    if len(pending) == 0:
+        return []
+    state = _load_state()
+    for state_key, (df, path, sql_hash, watermark) in pending.items():
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            df.to_parquet(path, index=False)
+            state['snapshots'][state_key] = {'sql': sql_hash, 'watermark': watermark, 'rows': len(df)}
+        except:
+            print(f'WARNING! Could not save the incremental snapshot `{path}`; its next run will be a full extraction.')
+            state['snapshots'].pop(state_key, None)
+    with open(_state_path(), 'w') as f:
+        json.dump(state, f, indent=2)
+    print(f'Incremental: saved high-water marks for {len(pending)} source queries.')
+
+    return list(pending.keys())
+
+def _state_key(db:str, qry:str) -> str:
+    folder = db if backends.BACKEND['name'] == 'odbc' else f"{db}-{backends.BACKEND['name']}"
+    return f'{folder}/{qry}'
+
+def _state_path() -> str:
+    return os.path.join(INCREMENTAL['dir'], 'watermarks.json')
+
+def _load_state() -> dict:
+    if not os.path.exists(_state_path()):
+        return {'snapshots': {}}
+    try:
+        with open(_state_path(), 'r') as f:
+            state = json.load(f)
+    except:
+        print(f'WARNING! Could not read `{_state_path()}`; every incremental query will be a full extraction.')
+        state = {'snapshots': {}}
+
+    return state
@@ -0,0 +1,107 @@
+"""Lazy, copy-on-write tables for `birds`
+
+Each table in `birds` holds every stage of the pipeline at once (`original`, `source`, `tbl_load`, `k_load`, `payload`, `audit`, `tsql`). In a lazy `src.birds.BirdsTable` (`BirdsTable.lazy`, see `src.make_templates.LAZY_TABLES`):
+-derived attributes are stored as a `src.birds.Deferred` recipe and made on first access: `audit` (from `payload` plus the few columns `payload` leaves out) and `tsql` (from `payload`)
+-`k_load` and `payload` start as shallow copies of the stage before them, so the columns a stage doesn't change share one buffer; every stage replaces whole columns (`df[col] = ...`, merges), which never writes into a shared buffer
+-`BirdsTable.drop()` frees intermediate stages on demand; derived attributes go back to their recipe, others are emptied
+
+`_memory_report()` sizes every attribute, counting each shared buffer once.
+"""
+import src.birds as bd
+import pandas as pd
+import numpy as np
+
+def _drop_stages(xwalk_dict:dict, attrs:list=None) -> dict:
+    """Free intermediate stages in every `BirdsTable`, e.g., after `check_birds()` and before loading
+
+    Args:
+        xwalk_dict (dict): `birds`
+        attrs (list, optional): the attributes to free. Defaults to None, i.e., every stage `load_tbls` doesn't read except `tsql`, which is made again on demand.
+
+    Returns:
+        dict: `xwalk_dict`
+    """
+    if attrs is None:
+        attrs = ['original', 'source', 'tbl_load', 'k_load', 'audit', 'tsql']
+    for schema in xwalk_dict.keys():
+        for tbl in xwalk_dict[schema].keys():
+            if isinstance(xwalk_dict[schema][tbl], bd.BirdsTable):
+                xwalk_dict[schema][tbl].drop(*attrs)
+
+    return xwalk_dict
+
+def _audit_frame(payload:pd.DataFrame, excluded:pd.DataFrame, columns:list) -> pd.DataFrame:
+    """Rebuild `audit` (every cast `k_load` column) from `payload` and the columns `payload` leaves out"""
+    return pd.concat([payload, excluded], axis=1)[columns]
+
+def _memory_report(xwalk_dict:dict, verbose:bool=True) -> pd.DataFrame:
+    """Size every attribute of every table, without making deferred attributes
+
+    `bytes` is what the attribute would take on its own; `unique_bytes` counts each column buffer (or string) the first time it is seen, so buffers shared between stages (or between tables) are counted once.
+
+    Args:
+        xwalk_dict (dict): `birds`
+        verbose (bool, optional): print totals by attribute. Defaults to True.
+
+    Returns:
+        pd.DataFrame: one row per table and attribute
+
+    Examples:
+        import src.make_templates as mt
+        import src.lazy_tables as lt
+        mt.LAZY_TABLES = False
+        before = lt._memory_report(mt.make_birds())
+        mt.LAZY_TABLES = True
+        after = lt._memory_report(mt.make_birds())
+    """
+    seen = set()
+    rows = []
+    for schema in xwalk_dict.keys():
+        for tbl in xwalk_dict[schema].keys():
+            table = xwalk_dict[schema][tbl]
+            for attr in table.keys():
+                value = table.raw(attr) if isinstance(table, bd.BirdsTable) else table[attr]
+                deferred = isinstance(value, bd.Deferred)
+                size, unique = (0, 0) if deferred else _sizeof(value, seen)
+                rows.append({'schema':schema, 'tbl':tbl, 'attr':attr, 'deferred':deferred, 'bytes':size, 'unique_bytes':unique})
+    report = pd.DataFrame(rows)
+    if verbose and len(report) > 0:
+        totals = report.groupby('attr', sort=False)[['bytes', 'unique_bytes', 'deferred']].sum()
+        print(f"`birds` memory: {round(report['bytes'].sum()/2**20, 1)} MB counting every attribute on its own, {round(report['unique_bytes'].sum()/2**20, 1)} MB counting shared buffers once; {int(report['deferred'].sum())} attributes deferred")
+        for attr, row in totals[(totals['bytes'] > 0) | (totals['deferred'] > 0)].iterrows():
+            print(f"    {attr}: {round(row['bytes']/2**20, 1)} MB ({round(row['unique_bytes']/2**20, 1)} MB unique), {int(row['deferred'])} deferred")
+
+    return report
+
+def _sizeof(value, seen:set) -> tuple:
+    """(bytes, bytes not already in `seen`) of an attribute value; adds its buffers to `seen`"""
+    if isinstance(value, pd.DataFrame):
+        size = 0
+        unique = 0
+        for i in range(len(value.columns)):
+            col = value.iloc[:, i]
+            nbytes = int(col.memory_usage(deep=True, index=False))
+            size += nbytes
+            key = _buffer_key(col)
+            if key not in seen:
+                seen.add(key)
+                unique += nbytes
+        return size, unique
+    if isinstance(value, str):
+        key = ('str', id(value))
+        nbytes = len(value.encode('utf-8'))
+        if key in seen:
+            return nbytes, 0
+        seen.add(key)
+        return nbytes, nbytes
+    return 0, 0
+
+def _buffer_key(col:pd.Series) -> tuple:
+    """The address and length of a column's values; equal for the same column in two shallow copies"""
+    values = col.array
+    data = getattr(values, '_data', getattr(values, '_ndarray', None)) # e.g., Int64 and object/datetime columns
+    if not isinstance(data, np.ndarray):
+        data = col.values if isinstance(col.values, np.ndarray) else None
+    if data is None:
+        return ('id', id(values))
+    return (data.__array_interface__['data'][0], data.nbytes, str(data.dtype))
@@ -3,7 +3,8 @@ import pandas as pd
 import numpy as np
 import sqlalchemy as sa
 import assets.assets as assets
-import pyodbc
+import src.backends as backends
+import src.profiling as prof
 import time
 import datetime as dt
 
@@ -13,10 +14,11 @@ def load_birds(xwalk_dict:dict) -> list:
     print('')
     print('')
     start_time = time.time()
+    prof._start_run('load_birds')
     
     # connections
-    engine = sa.create_engine(assets.SACXN_STR)
-    cnxn = pyodbc.connect(assets.PYCXN_STR)
+    engine = backends._dest_engine()
+    cnxn = backends._dest_connect()
     cursor = cnxn.cursor()
     fails = []
     successes = []
@@ -33,7 +35,8 @@ def load_birds(xwalk_dict:dict) -> list:
             target = f"birds['{schema}']['{tbl}']"
             payload = xwalk_dict[schema][tbl]['payload']
             try:
-                payload.to_sql(tbl,engine,index=False,if_exists="append",schema=schema)
+                with prof._span('load_birds', 'to_sql', schema, tbl):
+                    payload.to_sql(tbl,engine,index=False,if_exists="append",schema=schema)
                 successes.append(target)
             except:
                 fails.append(target)
@@ -48,7 +51,8 @@ def load_birds(xwalk_dict:dict) -> list:
             target = f"birds['{schema}']['{tbl}']"
             payload = xwalk_dict[schema][tbl]['payload']
             try:
-                payload.to_sql(tbl,engine,index=False,if_exists="append",schema=schema)
+                with prof._span('load_birds', 'to_sql', schema, tbl):
+                    payload.to_sql(tbl,engine,index=False,if_exists="append",schema=schema)
                 successes.append(target)
             except:
                 fails.append(target)
@@ -58,8 +62,9 @@ def load_birds(xwalk_dict:dict) -> list:
         for tbl in independent_tables_odbc:
             target = f"birds['{schema}']['{tbl}']"
             try:
-                for line in xwalk_dict[schema][tbl]['tsql'].split('\n'):
-                    cursor.execute(line)
+                with prof._span('load_birds', 'execute_tsql', schema, tbl):
+                    for line in xwalk_dict[schema][tbl]['tsql'].split('\n'):
+                        cursor.execute(backends._translate(line))
                 successes.append(target)
             except:
                 fails.append(target)
@@ -82,7 +87,8 @@ def load_birds(xwalk_dict:dict) -> list:
             target = f"birds['{schema}']['{tbl}']"
             payload = xwalk_dict[schema][tbl]['payload']
             try:
-                payload.to_sql(tbl,engine,index=False,if_exists="append",schema=schema)
+                with prof._span('load_birds', 'to_sql', schema, tbl):
+                    payload.to_sql(tbl,engine,index=False,if_exists="append",schema=schema)
                 successes.append(target)
             except:
                 fails.append(target)
@@ -97,7 +103,8 @@ def load_birds(xwalk_dict:dict) -> list:
             target = f"birds['{schema}']['{tbl}']"
             payload = xwalk_dict[schema][tbl]['payload']
             try:
-                payload.to_sql(tbl,engine,index=False,if_exists="append",schema=schema)
+                with prof._span('load_birds', 'to_sql', schema, tbl):
+                    payload.to_sql(tbl,engine,index=False,if_exists="append",schema=schema)
                 successes.append(target)
             except:
                 fails.append(target)
@@ -110,8 +117,9 @@ def load_birds(xwalk_dict:dict) -> list:
         for tbl in covered_above:
             target = f"birds['{schema}']['{tbl}']"
             try:
-                for line in xwalk_dict[schema][tbl]['tsql'].split('\n'):
-                    cursor.execute(line)
+                with prof._span('load_birds', 'execute_tsql', schema, tbl):
+                    for line in xwalk_dict[schema][tbl]['tsql'].split('\n'):
+                        cursor.execute(backends._translate(line))
                 successes.append(target)
             except:
                 fails.append(target)
@@ -127,7 +135,8 @@ def load_birds(xwalk_dict:dict) -> list:
             target = f"birds['{schema}']['{tbl}']"
             payload = xwalk_dict[schema][tbl]['payload']
             try:
-                payload.to_sql(tbl,engine,index=False,if_exists="append",schema=schema)
+                with prof._span('load_birds', 'to_sql', schema, tbl):
+                    payload.to_sql(tbl,engine,index=False,if_exists="append",schema=schema)
                 successes.append(target)
             except:
                 fails.append(target)
@@ -142,7 +151,8 @@ def load_birds(xwalk_dict:dict) -> list:
             target = f"birds['{schema}']['{tbl}']"
             payload = xwalk_dict[schema][tbl]['payload']
             try:
-                payload.to_sql(tbl,engine,index=False,if_exists="append",schema=schema)
+                with prof._span('load_birds', 'to_sql', schema, tbl):
+                    payload.to_sql(tbl,engine,index=False,if_exists="append",schema=schema)
                 successes.append(target)
             except:
                 fails.append(target)
@@ -154,8 +164,9 @@ def load_birds(xwalk_dict:dict) -> list:
         for tbl in independent_tables:
             target = f"birds['{schema}']['{tbl}']"
             try:
-                for line in xwalk_dict[schema][tbl]['tsql'].split('\n'):
-                    cursor.execute(line)
+                with prof._span('load_birds', 'execute_tsql', schema, tbl):
+                    for line in xwalk_dict[schema][tbl]['tsql'].split('\n'):
+                        cursor.execute(backends._translate(line))
                 successes.append(target)
             except:
                 fails.append(target)
@@ -171,7 +182,8 @@ def load_birds(xwalk_dict:dict) -> list:
             target = f"birds['{schema}']['{tbl}']"
             payload = xwalk_dict[schema][tbl]['payload']
             try:
-                payload.to_sql(tbl,engine,index=False,if_exists="append",schema=schema)
+                with prof._span('load_birds', 'to_sql', schema, tbl):
+                    payload.to_sql(tbl,engine,index=False,if_exists="append",schema=schema)
                 successes.append(target)
             except:
                 fails.append(target)
@@ -184,8 +196,9 @@ def load_birds(xwalk_dict:dict) -> list:
         for tbl in covered_above_dbo:
             target = f"birds['{schema}']['{tbl}']"
             try:
-                for line in xwalk_dict[schema][tbl]['tsql'].split('\n'):
-                    cursor.execute(line)
+                with prof._span('load_birds', 'execute_tsql', schema, tbl):
+                    for line in xwalk_dict[schema][tbl]['tsql'].split('\n'):
+                        cursor.execute(backends._translate(line))
                 successes.append(target)
             except:
                 fails.append(target)
@@ -200,8 +213,9 @@ def load_birds(xwalk_dict:dict) -> list:
         for tbl in covered_above:
             target = f"birds['{schema}']['{tbl}']"
             try:
-                for line in xwalk_dict[schema][tbl]['tsql'].split('\n'):
-                    cursor.execute(line)
+                with prof._span('load_birds', 'execute_tsql', schema, tbl):
+                    for line in xwalk_dict[schema][tbl]['tsql'].split('\n'):
+                        cursor.execute(backends._translate(line))
                 successes.append(target)
             except:
                 fails.append(target)
@@ -216,8 +230,9 @@ def load_birds(xwalk_dict:dict) -> list:
         for tbl in covered_above:
             target = f"birds['{schema}']['{tbl}']"
             try:
-                for line in xwalk_dict[schema][tbl]['tsql'].split('\n'):
-                    cursor.execute(line)
+                with prof._span('load_birds', 'execute_tsql', schema, tbl):
+                    for line in xwalk_dict[schema][tbl]['tsql'].split('\n'):
+                        cursor.execute(backends._translate(line))
                 successes.append(target)
             except:
                 fails.append(target)
@@ -253,5 +268,7 @@ def load_birds(xwalk_dict:dict) -> list:
     elapsed_time = elapsed_time.split('.')[0]
     print('')
     print(f'`load_birds()` succeeded in: {elapsed_time}')
+    if prof.PROFILING['enabled']:
+        prof._report(run='load_birds')
 
     return None
@@ -11,27 +11,93 @@ main data structure, attributes, attribute type, attribute description
 -payload_cols: list, a subset of `k_load` columns that should be included in `payload`
 -payload: pd.DataFrame, `k_load` tranformed to the sql server table-input format (exclude auto-generated fields, like IDs, rowversion, etc.)
 -tsql: str, Transact SQL INSERT statements for loading `payload` to the db
+
+Each table is a `src.birds.BirdsTable`, so its attributes can be read as `birds['ncrn']['Park']['k_load']` or `birds['ncrn']['Park'].k_load`.
 """
 import assets.assets as assets
 import pandas as pd
 import pickle
 import src.build_tbls as bt
+import src.db_connect as dbc
+import src.incremental as inc
+import src.scheduler as scheduler
+import src.birds as bd
+import src.lazy_tables as lt
+import src.checkpoints as ck
+import src.birds_io as bio
+import src.telemetry as telemetry
+import src.profiling as prof
 import src.tbl_xwalks as tx
 import src.k_loads as kl
+import src.xwalk_expr as xe
 import src.check as c
+import src.ddl as ddl
 import numpy as np
 import datetime as dt
 import time
 import re
+import hashlib
+import json
+import os
 
 TBL_XWALK = assets.TBL_XWALK
 TBL_ADDITIONS = assets.TBL_ADDITIONS
-
-def make_birds(dest:str='') -> dict:
+# compiled code objects for the calculated crosswalk fields, keyed by (schema, tbl), then by (dest_col, hash of the code string); see `_compile_xwalk_code()`
+XWALK_CODE = {}
+XWALK_EXPRESSIONS = True # evaluate calculated fields with `src.xwalk_expr` (one batch per table); False runs every line as compiled Python
+LAZY_TABLES = False # opt-in until `src.lazy_tables._memory_report()` has been compared on the full dataset; True builds each table as a lazy `src.birds.BirdsTable`: `audit` and `tsql` are made on first access, and `k_load`/`payload` share unchanged columns with the stage before them (see `src.lazy_tables`)
+# `payload` column plans, cached across runs and keyed by the CREATE TABLE script's hash in its constraint catalog (see `src.ddl.load_catalog()`), so an edited script rebuilds them; see `_payload_plan()`. Bump 'version' when the plan rules change
+PAYLOAD_PLANS = {
+    'enabled': True
+    ,'path': 'assets/cache/payload_plans.json'
+    ,'version': 2
+}
+# applied in order to VARCHAR `payload` columns that contain any of them
+PAYLOAD_NONSENSE = {
+    '\\r\\n':''
+    ,"'NULL'":'NULL'
+    ,"'nan'":'NULL'
+    ,"'":"''"
+    ,'"':"''"
+}
+PAYLOAD_DONT_ROUND = ['X_Coord_DD_NAD83', 'Y_Coord_DD_NAD83', 'ValidMinimumValue', 'ValidMaximumValue'] # FLOAT columns kept at full precision
+# applied in order to every INSERT statement in `tsql`
+TSQL_NONSENSE = {
+    "'NULL'":'NULL'
+    ,"'nan'":'NULL'
+    ,", nan":', NULL'
+    ,"<NA>":'NULL'
+    ,'"':"'"
+}
+# how `_tsql_text()` formats each xwalk `fieldtype`; DATE and DATETIME `payload`s are already strings
+TSQL_FORMATS = {
+    'VARCHAR':'text'
+    ,'DATE':'text'
+    ,'DATETIME':'text'
+    ,'DATETIME2':'text'
+    ,'INT':'number'
+    ,'BIT':'number'
+    ,'DECIMAL':'number'
+    ,'FLOAT':'number'
+}
+TSQL_STR_IS_REPR = {int, float, bool, type(None), type(pd.NA), type(pd.NaT)} # `str(x) == repr(x)`, so `astype(str)` formats them
+NUMPY_REPR_IS_STR = repr(np.int64(1)) == '1' # numpy>=2 writes `np.int64(1)`
+
+def make_birds(dest:str='', refresh_source:bool=False, verify_schema:bool=False, project_source:bool=False, incremental:bool=False, verify_incremental:bool=False, query_log:str='', workers:int=0, checkpoints:bool=False, resume_from:str='', profile:str='') -> dict:
     """Create a dictionary of crosswalks for each table in the source (Access) and destination (SQL Server) databases
 
     Args:
-        dest (str, optional): Relative or absolute filepath to which a pickle of the output should be saved. Must end in '.pkl'. Defaults to ''.
+        dest (str, optional): Relative or absolute path to which the output should be saved: a filepath ending in '.pkl' for one pickle, or a directory for one Arrow file per table attribute (see `src.birds_io.write_birds()`). Defaults to ''.
+        refresh_source (bool, optional): Re-query the Access source files instead of reading their cached snapshots (see `src.db_connect._cache_path()`). Defaults to False.
+        verify_schema (bool, optional): Check the destination schemas parsed from `assets.CREATE_SQL` against the SQL Server database. Defaults to False.
+        project_source (bool, optional): Select only the source columns the crosswalks and exceptions read (see `src.build_tbls._project_sql()`); `original` and `source` then lack every other column, and the dropped columns are printed. Defaults to False.
+        incremental (bool, optional): Read only the events entered or updated since the last successful run, merged into that run's snapshot (see `src.incremental`). Defaults to False.
+        verify_incremental (bool, optional): Also run each merged incremental query in full and print FAIL if the merge doesn't match it (see `src.incremental._verify_merge()`). Defaults to False.
+        query_log (str, optional): Filepath to which per-query telemetry is appended as JSON lines (see `src.telemetry`). Defaults to ''.
+        workers (int, optional): Transform tables and generate their payloads and TSQL in this many processes, in dependency order (see `src.scheduler`). Defaults to 0, i.e., one table at a time in this process.
+        checkpoints (bool, optional): Save a checkpoint after each stage (extract, exceptions, xwalks, k_load, payload, tsql), fingerprinted by the stage's code and asset inputs (see `src.checkpoints`). Defaults to False.
+        resume_from (str, optional): Re-run from this stage (one of `src.checkpoints.STAGES`, or 'latest'), starting from the checkpoint saved before it if its fingerprint still matches; implies `checkpoints`. Defaults to '', i.e., run every stage.
+        profile (str, optional): Filepath to which the wall time, CPU time, peak memory, and rows of each stage and table are written as JSON; the slowest are also printed (see `src.profiling`). Defaults to '', i.e., don't profile.
 
     Returns:
         dict: a containing destination dataframes and the source componenets from which they were generated 
@@ -39,6 +105,9 @@ def make_birds(dest:str='') -> dict:
     Examples:
         import src.make_templates as mt
         testdict = mt.make_birds('saved_dictionary.pkl')
+        testdict = mt.make_birds('assets/birds') # then e.g., `src.birds_io.read_attribute('assets/birds', 'ncrn', 'BirdDetection', 'k_load')`
+        testdict = mt.make_birds(resume_from='payload') # e.g., after editing `_generate_payload()`
+        testdict = mt.make_birds(profile='assets/profile.json') # e.g., to find the slowest exception functions
         with open('saved_dictionary.pkl', 'rb') as f:
             loaded_dict = pickle.load(f) 
     """
@@ -48,21 +117,124 @@ def make_birds(dest:str='') -> dict:
     print('')
     start_time = time.time()
     if dest !='':
-        assert dest.endswith('.pkl'), print(f'You entered `{dest}`. If you want to save the output of `make_xwalks()`, `dest` must end in ".pkl"')
+        assert dest.endswith('.pkl') or os.path.splitext(dest)[1] == '', print(f'You entered `{dest}`. If you want to save the output of `make_xwalks()`, `dest` must end in ".pkl" or be a directory')
+    if resume_from != '':
+        assert resume_from in ck.STAGES + ['latest'], print(f'You entered `{resume_from}`. `resume_from` must be one of {ck.STAGES + ["latest"]}')
+
+    dbc._configure_cache(refresh=refresh_source)
+    inc._configure(enabled=incremental, verify=verify_incremental)
+    telemetry._configure(jsonl=query_log)
+    prof._configure(enabled=profile != '', json_path=profile)
+    params = {'project_source':project_source, 'incremental':incremental} # the arguments that change what extraction returns
+    ck._configure(enabled=checkpoints or resume_from != '', params=params)
+    resumed, state = ck._resume('' if refresh_source else resume_from) # `refresh_source` re-queries the source, so there's nothing to resume from
+    if resumed == 'extract':
+        source_dict, dest_dict = state
+    elif resumed != '':
+        xwalk_dict = state
+
+    if ck._todo('extract'):
+        with prof._span('extract', '_get_src_tbls') as record:
+            source_dict, src_timings = bt._get_src_tbls(project=project_source) # query the source data (i.e., the Access table(s)), concurrently
+            record['rows'] = sum([len(x) for x in source_dict.values()])
+        with prof._span('extract', '_get_dest_tbls'):
+            dest_dict = bt._get_dest_tbls(verify=verify_schema) # parse the destination schemas (i.e., the SQL Server tables; an empty dataframe with the correct columns) from the CREATE TABLE script
+        ck._save('extract', (source_dict, dest_dict))
+
+    if ck._todo('exceptions'):
+        # main object to hold data
+        with prof._span('create_xwalks', '_build_xwalk_dict'):
+            xwalk_dict = _build_xwalk_dict(source_dict, dest_dict)
+
+        # create xwalk for each destination table
+        xwalk_dict = _create_xwalks(xwalk_dict)
+
+        # execute exception-handling
+        xwalk_dict = _execute_xwalk_exceptions(xwalk_dict, source_dict)
+        ck._save('exceptions', xwalk_dict)
+    dbc._close_pool() # every database query happens before this point; close the pooled connections and report their reuse
+    telemetry._report()
+
+    if workers > 0 and ck._todo('xwalks'):
+        print('')
+        print(f'Transforming source data to destination target schemas and generating payloads and TSQL in {workers} processes...')
+        print('')
+        xwalk_dict = scheduler._run_tables(xwalk_dict, workers, checkpoint=ck._save if ck.CHECKPOINTS['enabled'] else None) # with checkpoints, saved after each stage like the sequential path
+    else:
+        if ck._todo('xwalks'):
+            # execute xwalk to generate load
+            print('')
+            print('Transforming source data to destination target schemas...')
+            print('')
+            xwalk_dict = _execute_xwalks(xwalk_dict)
+
+            # add t-sql constraints to xwalks
+            xwalk_dict = prof._call('constraints', tx._add_row_id, xwalk_dict)
+            xwalk_dict = prof._call('constraints', tx._add_sql_constraints, xwalk_dict)
+            xwalk_dict = prof._call('constraints', tx._make_pk_fk_lookup, xwalk_dict)
+            ck._save('xwalks', xwalk_dict)
+
+        if ck._todo('k_load'):
+            # generate k_load
+            print('Enforcing congruency for primary-key/foreign-key relationships...')
+            print('')
+            xwalk_dict = _generate_k_load(xwalk_dict)
+            ck._save('k_load', xwalk_dict)
+
+        if ck._todo('payload'):
+            # generate payload
+            xwalk_dict = _generate_payload(xwalk_dict)
+            ck._save('payload', xwalk_dict)
+
+        if ck._todo('tsql'):
+            # generate t-sql
+            print('')
+            print('Generating TSQL for payloads...')
+            print('')
+            xwalk_dict = _generate_tsql(xwalk_dict)
+            ck._save('tsql', xwalk_dict)
+
+    inc._commit() # the run succeeded, so its merged snapshots become the base for the next incremental run
 
-    source_dict = bt._get_src_tbls() # query the source data (i.e., the Access table(s))
-    dest_dict = bt._get_dest_tbls() # query the destination data (i.e., the SQL Server table; usually an empty dataframe with the correct columns)
+    # save output
+    if dest.endswith('.pkl'):
+        with prof._span('save', 'pickle.dump'):
+            with open(dest, 'wb') as f:
+                pickle.dump(xwalk_dict, f)
+        print(f'Output saved to `{dest}`')
+    elif dest !='':
+        with prof._span('save', 'write_birds'):
+            bio.write_birds(xwalk_dict, dest, fingerprint=ck._output_fingerprint(params)) # so a reader can tell whether it was made from the current code, assets, and source data
+    end_time = time.time()
+    elapsed_time = end_time - start_time
+    elapsed_time = str(dt.timedelta(seconds=elapsed_time))
+    elapsed_time = elapsed_time.split('.')[0]
+    print('')
+    print(f'`make_birds()` succeeded in: {elapsed_time}')
+    if profile != '':
+        prof._report(run='make_birds')
 
-    # main object to hold data
-    xwalk_dict = {}
+    return xwalk_dict
+
+def _build_xwalk_dict(source_dict:dict, dest_dict:dict) -> dict:
+    """Make `birds`: one dictionary of attributes per destination table, with its `source` and `destination` routed in
+
+    Args:
+        source_dict (dict): output of `src.build_tbls._get_src_tbls()`
+        dest_dict (dict): output of `src.build_tbls._get_dest_tbls()`
+
+    Returns:
+        dict: `birds` before any crosswalk, a `src.birds.Birds` of `src.birds.BirdsTable`s
+    """
+    xwalk_dict = bd.Birds()
     # add the tables for which we have a source and assign their attributes
     for schema in TBL_XWALK.keys():
         xwalk_dict[schema] = {}
         for tbl in TBL_XWALK[schema].keys():
-            xwalk_dict[schema][tbl] = {
+            xwalk_dict[schema][tbl] = bd.BirdsTable({
                 'xwalk': pd.DataFrame(columns=['destination', 'source', 'calculation', 'note']) # the crosswalk to translate from `source` to `tbl_load`
                 ,'source_name': assets.TBL_XWALK[schema][tbl] # name of source table
-                ,'original': pd.DataFrame() # immutable copy of source data
+                ,'original': pd.DataFrame() # immutable copy of source data; only the projected columns with `make_birds(project_source=True)`
                 ,'source': pd.DataFrame() # mutable source data for generating `tbl_oad`
                 ,'destination': dest_dict[tbl] # destination data (mostly just for its column names and order)
                 ,'tbl_load': pd.DataFrame() # `source` data crosswalked to the destination schema
@@ -73,7 +245,7 @@ def make_birds(dest:str='') -> dict:
                 ,'payload': pd.DataFrame() # `tbl_load` transformed for loading to destination database
                 ,'audit': pd.DataFrame() # `tbl_load` transformed for loading to destination database
                 ,'tsql': '' # the t-sql to load the `payload` to the destination table
-            }
+            }, lazy=LAZY_TABLES)
             xwalk_dict[schema][tbl]['original'] = source_dict[xwalk_dict[schema][tbl]['source_name']] # route the source data to its placeholder
             xwalk_dict[schema][tbl]['source'] = source_dict[xwalk_dict[schema][tbl]['source_name']] # route the source data to its placeholder
 
@@ -82,7 +254,7 @@ def make_birds(dest:str='') -> dict:
         if schema not in xwalk_dict.keys():
             xwalk_dict[schema] = {}
         for tbl in TBL_ADDITIONS[schema]:
-            xwalk_dict[schema][tbl] = {
+            xwalk_dict[schema][tbl] = bd.BirdsTable({
                 'xwalk': pd.DataFrame(columns=['destination', 'source', 'calculation', 'note']) # the crosswalk to translate from `source` to `tbl_load`
                 ,'source_name': 'NCRN_Landbirds.'+schema+'.'+tbl # name of source table
                 ,'original': pd.DataFrame() # immutable copy of source data; empty here because there is no NCRN equivalent for `TBL_ADDITIONS`
@@ -96,7 +268,7 @@ def make_birds(dest:str='') -> dict:
                 ,'payload': pd.DataFrame() # `tbl_load` transformed for loading to destination database
                 ,'audit': pd.DataFrame() # `tbl_load` transformed for loading to destination database
                 ,'tsql': '' # the t-sql to load the `payload` to the destination table
-            }
+            }, lazy=LAZY_TABLES)
     
     # distribute and assign attributes from query results (`bt.get_src_tbls()` and `bt._get_dest_tbls()`)
     for schema in xwalk_dict.keys():
@@ -106,177 +278,181 @@ def make_birds(dest:str='') -> dict:
             exclude_cols = ['ID', 'Rowversion', 'UserCode'] # list of columns that SQL Server should calculate upon data loading; these cols should not be part of the payload
             xwalk_dict[schema][tbl]['payload_cols'] = [x for x in xwalk_dict[schema][tbl]['destination'].columns if x not in exclude_cols] # the columns to extract from `tbl_load` and load into `payload`
 
-    # create xwalk for each destination table
-    xwalk_dict = _create_xwalks(xwalk_dict)
-
-    # execute exception-handling
-    xwalk_dict = _execute_xwalk_exceptions(xwalk_dict)
-
-    # execute xwalk to generate load
-    print('')
-    print('Transforming source data to destination target schemas...')
-    print('')
-    xwalk_dict = _execute_xwalks(xwalk_dict)
-
-    # add t-sql constraints to xwalks
-    xwalk_dict = tx._add_row_id(xwalk_dict)
-    xwalk_dict = tx._add_sql_constraints(xwalk_dict)
-    xwalk_dict = tx._make_pk_fk_lookup(xwalk_dict)
-
-    # generate k_load
-    print('Enforcing congruency for primary-key/foreign-key relationships...')
-    print('')
-    xwalk_dict = _generate_k_load(xwalk_dict)
-
-    # generate payload
-    xwalk_dict = _generate_payload(xwalk_dict)
-
-    # generate t-sql
-    print('')
-    print('Generating TSQL for payloads...')
-    print('')
-    xwalk_dict = _generate_tsql(xwalk_dict)
-
-    # save output
-    if dest !='':
-        with open(dest, 'wb') as f:
-            pickle.dump(xwalk_dict, f)
-        print(f'Output saved to `{dest}`')
-    end_time = time.time()
-    elapsed_time = end_time - start_time
-    elapsed_time = str(dt.timedelta(seconds=elapsed_time))
-    elapsed_time = elapsed_time.split('.')[0]
-    print('')
-    print(f'`make_birds()` succeeded in: {elapsed_time}')
-
     return xwalk_dict
 
 def _create_xwalks(xwalk_dict:dict) -> dict:
 
-    xwalk_dict = tx._ncrn_DetectionEvent(xwalk_dict)
-    xwalk_dict = tx._ncrn_BirdDetection(xwalk_dict)
-    xwalk_dict = tx._ncrn_Protocol(xwalk_dict)
-    xwalk_dict = tx._ncrn_Site(xwalk_dict)
-    xwalk_dict = tx._ncrn_Location(xwalk_dict)
-    xwalk_dict = tx._ncrn_Park(xwalk_dict)
-    xwalk_dict = tx._lu_TimeInterval(xwalk_dict)
-    xwalk_dict = tx._lu_WindCode(xwalk_dict)
-    xwalk_dict = tx._lu_DataProcessingLevel(xwalk_dict)
-    xwalk_dict = tx._lu_DetectionType(xwalk_dict)
-    xwalk_dict = tx._lu_DistanceClass(xwalk_dict)
-    xwalk_dict = tx._lu_GeodeticDatum(xwalk_dict)
-    xwalk_dict = tx._lu_Sex(xwalk_dict)
-    xwalk_dict = tx._ncrn_Contact(xwalk_dict)
-    xwalk_dict = tx._lu_PrecipitationType(xwalk_dict)
-    xwalk_dict = tx._ncrn_BirdSpeciesPark(xwalk_dict)
-    xwalk_dict = tx._ncrn_BirdGroups(xwalk_dict)
-    xwalk_dict = tx._lu_NoiseLevel(xwalk_dict)
-    xwalk_dict = tx._ncrn_AuditLog(xwalk_dict)
-    xwalk_dict = tx._ncrn_AuditLogDetail(xwalk_dict)
-    xwalk_dict = tx._lu_SamplingMethod(xwalk_dict)
-    xwalk_dict = tx._lu_Habitat(xwalk_dict)
-    xwalk_dict = tx._ncrn_BirdSpecies(xwalk_dict)
-    xwalk_dict = tx._ncrn_ScannedFile(xwalk_dict)
-    xwalk_dict = tx._lu_TemperatureUnit(xwalk_dict)
-    xwalk_dict = tx._lu_ExperienceLevel(xwalk_dict)
-    xwalk_dict = tx._lu_ProtectedStatus(xwalk_dict)
-    xwalk_dict = tx._dbo_Role(xwalk_dict)
-    xwalk_dict = tx._dbo_ParkUser(xwalk_dict)
-    xwalk_dict = tx._ncrn_ProtocolWindCode(xwalk_dict)
-    xwalk_dict = tx._ncrn_ProtocolPrecipitationType(xwalk_dict)
-    xwalk_dict = tx._ncrn_ProtocolNoiseLevel(xwalk_dict)
-    xwalk_dict = tx._ncrn_ProtocolTimeInterval(xwalk_dict)
-    xwalk_dict = tx._ncrn_ProtocolDetectionType(xwalk_dict)
-    xwalk_dict = tx._ncrn_ProtocolDistanceClass(xwalk_dict)
-    xwalk_dict = tx._dbo_User(xwalk_dict)
-    xwalk_dict = tx._dbo_UserRole(xwalk_dict)
-    xwalk_dict = tx._ncrn_BirdSpeciesGroups(xwalk_dict)
+    xwalk_dict = prof._call('create_xwalks', tx._ncrn_DetectionEvent, xwalk_dict)
+    xwalk_dict = prof._call('create_xwalks', tx._ncrn_BirdDetection, xwalk_dict)
+    xwalk_dict = prof._call('create_xwalks', tx._ncrn_Protocol, xwalk_dict)
+    xwalk_dict = prof._call('create_xwalks', tx._ncrn_Site, xwalk_dict)
+    xwalk_dict = prof._call('create_xwalks', tx._ncrn_Location, xwalk_dict)
+    xwalk_dict = prof._call('create_xwalks', tx._ncrn_Park, xwalk_dict)
+    xwalk_dict = prof._call('create_xwalks', tx._lu_TimeInterval, xwalk_dict)
+    xwalk_dict = prof._call('create_xwalks', tx._lu_WindCode, xwalk_dict)
+    xwalk_dict = prof._call('create_xwalks', tx._lu_DataProcessingLevel, xwalk_dict)
+    xwalk_dict = prof._call('create_xwalks', tx._lu_DetectionType, xwalk_dict)
+    xwalk_dict = prof._call('create_xwalks', tx._lu_DistanceClass, xwalk_dict)
+    xwalk_dict = prof._call('create_xwalks', tx._lu_GeodeticDatum, xwalk_dict)
+    xwalk_dict = prof._call('create_xwalks', tx._lu_Sex, xwalk_dict)
+    xwalk_dict = prof._call('create_xwalks', tx._ncrn_Contact, xwalk_dict)
+    xwalk_dict = prof._call('create_xwalks', tx._lu_PrecipitationType, xwalk_dict)
+    xwalk_dict = prof._call('create_xwalks', tx._ncrn_BirdSpeciesPark, xwalk_dict)
+    xwalk_dict = prof._call('create_xwalks', tx._ncrn_BirdGroups, xwalk_dict)
+    xwalk_dict = prof._call('create_xwalks', tx._lu_NoiseLevel, xwalk_dict)
+    xwalk_dict = prof._call('create_xwalks', tx._ncrn_AuditLog, xwalk_dict)
+    xwalk_dict = prof._call('create_xwalks', tx._ncrn_AuditLogDetail, xwalk_dict)
+    xwalk_dict = prof._call('create_xwalks', tx._lu_SamplingMethod, xwalk_dict)
+    xwalk_dict = prof._call('create_xwalks', tx._lu_Habitat, xwalk_dict)
+    xwalk_dict = prof._call('create_xwalks', tx._ncrn_BirdSpecies, xwalk_dict)
+    xwalk_dict = prof._call('create_xwalks', tx._ncrn_ScannedFile, xwalk_dict)
+    xwalk_dict = prof._call('create_xwalks', tx._lu_TemperatureUnit, xwalk_dict)
+    xwalk_dict = prof._call('create_xwalks', tx._lu_ExperienceLevel, xwalk_dict)
+    xwalk_dict = prof._call('create_xwalks', tx._lu_ProtectedStatus, xwalk_dict)
+    xwalk_dict = prof._call('create_xwalks', tx._dbo_Role, xwalk_dict)
+    xwalk_dict = prof._call('create_xwalks', tx._dbo_ParkUser, xwalk_dict)
+    xwalk_dict = prof._call('create_xwalks', tx._ncrn_ProtocolWindCode, xwalk_dict)
+    xwalk_dict = prof._call('create_xwalks', tx._ncrn_ProtocolPrecipitationType, xwalk_dict)
+    xwalk_dict = prof._call('create_xwalks', tx._ncrn_ProtocolNoiseLevel, xwalk_dict)
+    xwalk_dict = prof._call('create_xwalks', tx._ncrn_ProtocolTimeInterval, xwalk_dict)
+    xwalk_dict = prof._call('create_xwalks', tx._ncrn_ProtocolDetectionType, xwalk_dict)
+    xwalk_dict = prof._call('create_xwalks', tx._ncrn_ProtocolDistanceClass, xwalk_dict)
+    xwalk_dict = prof._call('create_xwalks', tx._dbo_User, xwalk_dict)
+    xwalk_dict = prof._call('create_xwalks', tx._dbo_UserRole, xwalk_dict)
+    xwalk_dict = prof._call('create_xwalks', tx._ncrn_BirdSpeciesGroups, xwalk_dict)
 
     return xwalk_dict
 
-def _execute_xwalk_exceptions(xwalk_dict:dict) -> dict:
+def _execute_xwalk_exceptions(xwalk_dict:dict, source_dict:dict=None) -> dict:
+    tx.RECODE_AUDIT.clear()
     # tables that require the creation of one-or-more temp tables (e.g., CTE, execution of additional queries, or generation of lookups)
-    deletes = tx._concat_deletes(xwalk_dict)
-    xwalk_dict = tx._exception_ncrn_DetectionEvent(xwalk_dict, deletes)
-    xwalk_dict = tx._exception_ncrn_BirdDetection(xwalk_dict, deletes)
-    xwalk_dict = tx._exception_ncrn_BirdSpecies(xwalk_dict)
-    xwalk_dict = tx._exception_ncrn_AuditLogDetail(xwalk_dict)
-    xwalk_dict = tx._exception_ncrn_AuditLog(xwalk_dict)
-    xwalk_dict = tx._exception_lu_Habitat(xwalk_dict)
-    xwalk_dict = tx._exception_ncrn_Contact(xwalk_dict)
-    xwalk_dict = tx._exception_ncrn_Location(xwalk_dict)
-    xwalk_dict = tx._exception_ncrn_Site(xwalk_dict)
-    xwalk_dict = tx._exception_lu_PrecipitationType(xwalk_dict)
-    xwalk_dict = tx._exception_lu_Sex(xwalk_dict)
+    deletes = prof._call('exceptions', tx._concat_deletes, xwalk_dict)
+    xwalk_dict = prof._call('exceptions', tx._exception_ncrn_DetectionEvent, xwalk_dict, deletes, source_dict)
+    xwalk_dict = prof._call('exceptions', tx._exception_ncrn_BirdDetection, xwalk_dict, deletes, source_dict)
+    xwalk_dict = prof._call('exceptions', tx._exception_ncrn_BirdSpecies, xwalk_dict)
+    xwalk_dict = prof._call('exceptions', tx._exception_ncrn_AuditLogDetail, xwalk_dict)
+    xwalk_dict = prof._call('exceptions', tx._exception_ncrn_AuditLog, xwalk_dict)
+    xwalk_dict = prof._call('exceptions', tx._exception_lu_Habitat, xwalk_dict)
+    xwalk_dict = prof._call('exceptions', tx._exception_ncrn_Contact, xwalk_dict)
+    xwalk_dict = prof._call('exceptions', tx._exception_ncrn_Location, xwalk_dict, source_dict)
+    xwalk_dict = prof._call('exceptions', tx._exception_ncrn_Site, xwalk_dict)
+    xwalk_dict = prof._call('exceptions', tx._exception_lu_PrecipitationType, xwalk_dict)
+    xwalk_dict = prof._call('exceptions', tx._exception_lu_Sex, xwalk_dict)
 
     # tables that have no equivalent in NCRN's db and require creation
-    xwalk_dict = tx._exception_ncrn_BirdSpeciesGroups(xwalk_dict)
-    xwalk_dict = tx._exception_ncrn_BirdSpeciesPark(xwalk_dict)
-    xwalk_dict = tx._exception_lu_ExperienceLevel(xwalk_dict)
-    xwalk_dict = tx._exception_ncrn_ScannedFile(xwalk_dict)
-    xwalk_dict = tx._exception_lu_TemperatureUnit(xwalk_dict)
-    xwalk_dict = tx._exception_lu_ProtectedStatus(xwalk_dict)
-    xwalk_dict = tx._exception_lu_SamplingMethod(xwalk_dict)
-    xwalk_dict = tx._exception_dbo_Role(xwalk_dict)
-    xwalk_dict = tx._exception_dbo_ParkUser(xwalk_dict)
-    xwalk_dict = tx._exception_ncrn_Protocol(xwalk_dict)
-    xwalk_dict = tx._exception_ncrn_ProtocolWindCode(xwalk_dict)
-    xwalk_dict = tx._exception_ncrn_ProtocolPrecipitationType(xwalk_dict)
-    xwalk_dict = tx._exception_ncrn_ProtocolNoiseLevel(xwalk_dict)
-    xwalk_dict = tx._exception_ncrn_ProtocolTimeInterval(xwalk_dict)
-    xwalk_dict = tx._exception_ncrn_ProtocolDetectionType(xwalk_dict)
-    xwalk_dict = tx._exception_ncrn_ProtocolDistanceClass(xwalk_dict)
-    xwalk_dict = tx._exception_dbo_User(xwalk_dict)
-    xwalk_dict = tx._exception_dbo_UserRole(xwalk_dict)
-    xwalk_dict = tx._exception_lu_DistanceClass(xwalk_dict)
+    xwalk_dict = prof._call('exceptions', tx._exception_ncrn_BirdSpeciesGroups, xwalk_dict)
+    xwalk_dict = prof._call('exceptions', tx._exception_ncrn_BirdSpeciesPark, xwalk_dict)
+    xwalk_dict = prof._call('exceptions', tx._exception_lu_ExperienceLevel, xwalk_dict)
+    xwalk_dict = prof._call('exceptions', tx._exception_ncrn_ScannedFile, xwalk_dict)
+    xwalk_dict = prof._call('exceptions', tx._exception_lu_TemperatureUnit, xwalk_dict)
+    xwalk_dict = prof._call('exceptions', tx._exception_lu_ProtectedStatus, xwalk_dict)
+    xwalk_dict = prof._call('exceptions', tx._exception_lu_SamplingMethod, xwalk_dict)
+    xwalk_dict = prof._call('exceptions', tx._exception_dbo_Role, xwalk_dict)
+    xwalk_dict = prof._call('exceptions', tx._exception_dbo_ParkUser, xwalk_dict)
+    xwalk_dict = prof._call('exceptions', tx._exception_ncrn_Protocol, xwalk_dict)
+    xwalk_dict = prof._call('exceptions', tx._exception_ncrn_ProtocolWindCode, xwalk_dict)
+    xwalk_dict = prof._call('exceptions', tx._exception_ncrn_ProtocolPrecipitationType, xwalk_dict)
+    xwalk_dict = prof._call('exceptions', tx._exception_ncrn_ProtocolNoiseLevel, xwalk_dict)
+    xwalk_dict = prof._call('exceptions', tx._exception_ncrn_ProtocolTimeInterval, xwalk_dict)
+    xwalk_dict = prof._call('exceptions', tx._exception_ncrn_ProtocolDetectionType, xwalk_dict)
+    xwalk_dict = prof._call('exceptions', tx._exception_ncrn_ProtocolDistanceClass, xwalk_dict)
+    xwalk_dict = prof._call('exceptions', tx._exception_dbo_User, xwalk_dict)
+    xwalk_dict = prof._call('exceptions', tx._exception_dbo_UserRole, xwalk_dict)
+    xwalk_dict = prof._call('exceptions', tx._exception_lu_DistanceClass, xwalk_dict)
+    if isinstance(xwalk_dict, bd.Birds):
+        xwalk_dict.context['recodes'] = pd.DataFrame(tx.RECODE_AUDIT, columns=['name', 'col', 'rule', 'from', 'to', 'rows']) # how many rows each `tx._recode()` rule changed
 
     return xwalk_dict
 
-def _execute_xwalks(xwalk_dict:dict) -> dict:
+def _execute_xwalks(xwalk_dict:dict, tbls:list=None) -> dict:
+    """Crosswalk each table's `source` to its `tbl_load`
 
+    Args:
+        xwalk_dict (dict): `birds`
+        tbls (list, optional): the (schema, tbl) pairs to crosswalk. Defaults to None, i.e., every table.
+    """
     for schema in xwalk_dict.keys():
         for tbl in xwalk_dict[schema].keys():
-            xwalk = xwalk_dict[schema][tbl]['xwalk']
+            if tbls is not None and (schema, tbl) not in tbls:
+                continue
+            with prof._span('xwalks', '_execute_xwalks', schema, tbl) as record:
+                table = xwalk_dict[schema][tbl]
+                xwalk = table.xwalk
             
-            # if destination column has a one-to-one source field, execute assignments
-            one_to_ones = list(xwalk[xwalk['calculation']=='map_source_to_destination_1_to_1'].destination.values)
-            for dest_col in one_to_ones:
-                src_col = xwalk[xwalk['destination']==dest_col].source.values[0]
-                try:
-                    xwalk_dict[schema][tbl]['tbl_load'][dest_col] = xwalk_dict[schema][tbl]['source'][src_col]
-                except:
-                    print(f"WARNING! 1:1 destination column `dict['{schema}']['{tbl}']['tbl_load']['{dest_col}']` failed because its source column `dict['{schema}']['{tbl}']['source']['{src_col}']` did not resolve correctly. Debug `dict['{schema}']['{tbl}']['xwalk']` in src.tbl_xwalks._{schema}_{tbl}()")
-
-            # if destination column requires calculations, calculate
-            mask = (xwalk['calculation']=='calculate_dest_field_from_source_field') & (xwalk['source']!='placeholder') # TODO: DELETE THIS LINE, FOR TESTING ONLY
-            # mask = (xwalk['calculation']=='calculate_dest_field_from_source_field') # TODO: KEEP: for production
-            calculates = list(xwalk[mask].destination.values)
-            for dest_col in calculates:
-                src_col = xwalk[xwalk['destination']==dest_col].source.values[0]
-                # code_lines = xwalk[xwalk['destination']==dest_col].source.values[0].astype(str).split('$splithere$')
-                code_lines = xwalk[xwalk['destination']==dest_col].source.values[0]
-                code_lines = code_lines.split('$splithere$')
-                for line in code_lines:
-                    if line != 'placeholder':
-                        # line = line.replace('xwalk_dict', 'testdict') # for debugging
-                        try:
-                            exec(line)
-                        except:
-                            print(f"WARNING! Calculated column `dict['{schema}']['{tbl}']['tbl_load']['{dest_col}']`, code line `{line}` failed. Debug `dict['{schema}']['{tbl}']['xwalk']` in src.tbl_xwalks._{schema}_{tbl}()")
+                # if destination column has a one-to-one source field, execute assignments
+                one_to_ones = list(xwalk[xwalk['calculation']=='map_source_to_destination_1_to_1'].destination.values)
+                for dest_col in one_to_ones:
+                    src_col = xwalk[xwalk['destination']==dest_col].source.values[0]
+                    try:
+                        table.tbl_load[dest_col] = table.source[src_col]
+                    except:
+                        print(f"WARNING! 1:1 destination column `dict['{schema}']['{tbl}']['tbl_load']['{dest_col}']` failed because its source column `dict['{schema}']['{tbl}']['source']['{src_col}']` did not resolve correctly. Debug `dict['{schema}']['{tbl}']['xwalk']` in src.tbl_xwalks._{schema}_{tbl}()")
+
+                # if destination column requires calculations, calculate
+                mask = (xwalk['calculation']=='calculate_dest_field_from_source_field') # a 'placeholder' line is skipped by `_compile_xwalk_code()` and `xe._translate_field()`
+                calculates = list(xwalk[mask].destination.values)
+                namespace = {'xwalk_dict':xwalk_dict, 'np':np, 'pd':pd, 'dt':dt, 're':re, 'assets':assets} # the names the calculation strings use
+                calculations = [(dest_col, xwalk[xwalk['destination']==dest_col].source.values[0]) for dest_col in calculates]
+                if XWALK_EXPRESSIONS:
+                    xwalk_dict = xe._execute_calculations(xwalk_dict, schema, tbl, calculations, fallback=lambda dest_col, code: _exec_xwalk_code(namespace, schema, tbl, dest_col, code))
+                else:
+                    for dest_col, code in calculations:
+                        _exec_xwalk_code(namespace, schema, tbl, dest_col, code)
             
-            # if destination column is blank field, assign blank
-            blanks = list(xwalk[xwalk['calculation']=='blank_field'].destination.values)
-            for dest_col in blanks:
-                src_col = xwalk[xwalk['destination']==dest_col].source.values[0]
-                xwalk_dict[schema][tbl]['tbl_load'][dest_col] = np.NaN
+                # if destination column is blank field, assign blank
+                blanks = list(xwalk[xwalk['calculation']=='blank_field'].destination.values)
+                for dest_col in blanks:
+                    src_col = xwalk[xwalk['destination']==dest_col].source.values[0]
+                    table.tbl_load[dest_col] = np.NaN
+                record['rows'] = len(table.tbl_load)
 
     for schema in xwalk_dict.keys():
         for tbl in xwalk_dict[schema].keys():
-            xwalk_dict[schema][tbl]['source'].reset_index(inplace=True, drop=True)
+            if tbls is not None and (schema, tbl) not in tbls:
+                continue
+            xwalk_dict[schema][tbl].source.reset_index(inplace=True, drop=True)
 
     return xwalk_dict
 
-def _generate_k_load(xwalk_dict:dict) -> dict:
+def _exec_xwalk_code(namespace:dict, schema:str, tbl:str, dest_col:str, code:str) -> None:
+    """Run a calculated field's code string as compiled Python, one line at a time"""
+    for line, compiled in _compile_xwalk_code(schema, tbl, dest_col, code):
+        try:
+            exec(compiled, namespace)
+        except Exception as e:
+            print(f"WARNING! Calculated column `dict['{schema}']['{tbl}']['tbl_load']['{dest_col}']`, code line `{line}` failed ({type(e).__name__}: {e}). Debug `dict['{schema}']['{tbl}']['xwalk']` in src.tbl_xwalks._{schema}_{tbl}()")
+
+def _compile_xwalk_code(schema:str, tbl:str, dest_col:str, code:str) -> list:
+    """Compile a calculated field's code string once, and reuse the code objects while the string is unchanged
+
+    Each '$splithere$'-separated line is compiled on its own, so a failing line is reported and skipped without skipping the rest.
+    The code objects are named e.g., `<xwalk ncrn.DetectionEvent.ExcludeEvent>`, so profilers and tracebacks attribute time and errors to the table and column.
+
+    Args:
+        schema (str): e.g., 'ncrn'
+        tbl (str): e.g., 'DetectionEvent'
+        dest_col (str): e.g., 'ExcludeEvent'
+        code (str): the crosswalk's `source` string for `dest_col`
+
+    Returns:
+        list: [(line, code object)]; lines that are 'placeholder' or don't compile are left out
+    """
+    key = (dest_col, hashlib.sha1(code.encode('utf-8')).hexdigest())
+    cache = XWALK_CODE.setdefault((schema, tbl), {})
+    if key not in cache.keys():
+        compiled = []
+        for line in code.split('$splithere$'):
+            if line == 'placeholder':
+                continue
+            try:
+                compiled.append((line, compile(line, f'<xwalk {schema}.{tbl}.{dest_col}>', 'exec')))
+            except SyntaxError as e:
+                print(f"WARNING! Calculated column `dict['{schema}']['{tbl}']['tbl_load']['{dest_col}']`, code line `{line}` does not compile ({e.msg}). Debug `dict['{schema}']['{tbl}']['xwalk']` in src.tbl_xwalks._{schema}_{tbl}()")
+        cache[key] = compiled
+
+    return cache[key]
+
+def _generate_k_load(xwalk_dict:dict, tbls:list=None) -> dict:
     """Update the primary key/foreign key relationships from guids or whatever the source used to INT keys to match destination format
 
     The `source` attribute for each table has one of three types of key-field conventions:
@@ -286,123 +462,315 @@ def _generate_k_load(xwalk_dict:dict) -> dict:
 
     SQL server will auto-generate INT keys for all tables.
     `k_load` will replace all instances of non-INT keys with INT keys, so we can back-check referential integrity
-    """
-    for schema in xwalk_dict.keys():
-        for tbl in xwalk_dict[schema].keys():
-            xwalk_dict[schema][tbl]['k_load'] = xwalk_dict[schema][tbl]['tbl_load'].copy()
-            del xwalk_dict[schema][tbl]['k_load']['rowid']
 
-    kl._update_primary_keys(xwalk_dict)
-    kl._update_foreign_keys(xwalk_dict)
+    Args:
+        xwalk_dict (dict): `birds`
+        tbls (list, optional): the (schema, tbl) pairs to update; the tables they reference only need a `pk_fk_lookup`. Defaults to None, i.e., every table.
+    """
+    todo = [(schema, tbl) for schema in xwalk_dict.keys() for tbl in xwalk_dict[schema].keys() if tbls is None or (schema, tbl) in tbls]
+    for schema, tbl in todo:
+        with prof._span('k_load', '_generate_k_load', schema, tbl) as record:
+            table = xwalk_dict[schema][tbl]
+            table.k_load = table.tbl_load.copy(deep=not table.lazy) # a lazy table shares the columns whose keys don't change
+            del table.k_load['rowid']
+            record['rows'] = len(table.k_load)
+
+    # one table at a time, so each table's time is profiled on its own; every primary key is still updated before any foreign key
+    for update in [kl._update_primary_keys, kl._update_foreign_keys]:
+        for schema, tbl in todo:
+            with prof._span('k_load', update.__name__, schema, tbl) as record:
+                update(xwalk_dict, [(schema, tbl)])
+                record['rows'] = len(xwalk_dict[schema][tbl].k_load)
 
     return xwalk_dict
 
-def _generate_payload(xwalk_dict:dict) -> dict:
+def _generate_payload(xwalk_dict:dict, tbls:list=None, plans:dict=None) -> dict:
     """Make `payload` from `k_load`
     
     The `payload` is the exact dataframe to be INSERTed into the destination table
 
     The idea is that, if you write `payload`s to file, you have CSVs to seed the db from scratch
+
+    Each table's columns are cast by its column plan (see `_payload_plan()`), which is built once from the xwalk and cached across runs in `PAYLOAD_PLANS['path']`.
+
+    Args:
+        xwalk_dict (dict): `birds`
+        tbls (list, optional): the (schema, tbl) pairs to update. Defaults to None, i.e., every table.
+        plans (dict, optional): cached plans, updated in place; the caller saves them. Defaults to None, i.e., load and save `PAYLOAD_PLANS['path']`.
     """
-    nonsense = {
-        '\\r\\n':''
-        ,"'NULL'":'NULL'
-        ,"'nan'":'NULL'
-        ,"'":"''"
-        ,'"':"''"
-    }
     # e.g., `tbl_load` is allowed to hold NCRN's GUIDs but `payload` should either replace the GUIDs with INTs or leave out that column altogether
+    save = plans is None
+    if save:
+        plans = _load_payload_plans()
     for schema in xwalk_dict.keys():
         for tbl in xwalk_dict[schema].keys():
-            payload = xwalk_dict[schema][tbl]['k_load'].copy()
-            xwalk = xwalk_dict[schema][tbl]['xwalk'].copy()
-            for col in payload.columns:
-                if xwalk[xwalk['destination']==col].fieldtype.values[0]=='DATE':
-                    try:
-                        mask = (payload[col].isna())
-                        payload[col] = np.where(mask, 'NULL', payload[col].astype(str).str.replace('-',''))
-                        # payload[col] = payload[col].dt.date.astype(str).str.replace('-','')
-                    except:
-                        pass
-                elif xwalk[xwalk['destination']==col].fieldtype.values[0]=='DATETIME' or xwalk[xwalk['destination']==col].fieldtype.values[0]=='DATETIME2':
-                    try:
-                        mask = (payload[col].isna())
-                        payload[col] = np.where(mask, 'NULL', payload[col].astype(str).str.replace('-',''))
-                        # payload[col] = payload[col].astype(str).str.replace('-','')
-                    except:
-                        pass
-                elif xwalk[xwalk['destination']==col].fieldtype.values[0]=='VARCHAR':
-                    if xwalk[xwalk['destination']==col].maxlen.values[0] > 0:
-                        maxlength = int(xwalk[xwalk['destination']==col].maxlen.values[0])
-                        try:
-                            payload[col] = payload[col].str[:maxlength]
-                        except:
-                            pass
-                    try:
-                        mask = (payload[col].isna())
-                        payload[col] = np.where(mask, 'NULL', payload[col])
-                        if any(payload[col].str.contains('|'.join(nonsense.keys()), regex=True)):
-                            for k,v in nonsense.items():
-                                payload[col] = payload[col].str.replace(k,v)
-                    except:
-                        print(f"FAIL: partial string replace in birds['{schema}']['{tbl}']['payload']['{col}']")
-                elif xwalk[xwalk['destination']==col].fieldtype.values[0]=='INT' or xwalk[xwalk['destination']==col].fieldtype.values[0]=='BIT':
-                    try:
-                        payload[col] = payload[col].astype('Int64')
-                    except:
-                        print(f"FAIL: cast to int in birds['{schema}']['{tbl}']['payload']['{col}']")
-                elif xwalk[xwalk['destination']==col].fieldtype.values[0]=='DECIMAL':
-                    nums = xwalk[xwalk['destination']==col].maxlen.values[0].replace('(','').replace(')','').split(',')
-                    num_left = int(nums[0])
-                    num_right = int(nums[1])
-                    if any(payload[col]>int('9'*num_right)):
-                        try:
-                            payload[col] = payload[col].round(num_left)
-                        except:
-                            print(f"FAIL: cast to decimal in birds['{schema}']['{tbl}']['payload']['{col}']")
-                elif xwalk[xwalk['destination']==col].fieldtype.values[0]=='FLOAT':
-                    dont_round = ['X_Coord_DD_NAD83', 'Y_Coord_DD_NAD83', 'ValidMinimumValue', 'ValidMaximumValue']
-                    if col not in dont_round:
-                        try:
-                            payload[col] = payload[col].round(1)
-                        except:
-                            print(f"FAIL: cast to FLOAT in birds['{schema}']['{tbl}']['payload']['{col}']")
-            payload_cols = list(payload.columns)
-            payload_cols = [x for x in payload_cols if x!='ID' and x!='rowid' and x != 'Rowversion']
-            xwalk_dict[schema][tbl]['payload'] = payload[payload_cols]
-            xwalk_dict[schema][tbl]['audit'] = payload
+            if tbls is not None and (schema, tbl) not in tbls:
+                continue
+            with prof._span('payload', '_generate_payload', schema, tbl) as record:
+                table = xwalk_dict[schema][tbl]
+                payload = table.k_load.copy(deep=not table.lazy) # every caster replaces whole columns, so a shallow copy leaves `k_load` as it was
+                plan = _payload_plan(table.xwalk, list(payload.columns), plans, f'{schema}.{tbl}')
+                for step in plan:
+                    PAYLOAD_CASTERS[step['caster']](payload, step, schema, tbl)
+                payload_cols = list(payload.columns)
+                payload_cols = [x for x in payload_cols if x!='ID' and x!='rowid' and x != 'Rowversion']
+                if table.lazy: # keep only the columns `payload` leaves out, and rebuild `audit` if it's read
+                    audit_cols = list(payload.columns)
+                    excluded = payload[[x for x in audit_cols if x not in payload_cols]]
+                    for col in excluded.columns:
+                        del payload[col] # unlike `payload[payload_cols]`, leaves the other columns' buffers shared
+                    table.payload = payload
+                    table.audit = bd.Deferred(lt._audit_frame, payload, excluded, audit_cols)
+                else:
+                    table.payload = payload[payload_cols]
+                    table.audit = payload
+                record['rows'] = len(table.payload)
+    if save:
+        _save_payload_plans(plans)
 
     return xwalk_dict
 
-def _generate_tsql(xwalk_dict:dict) -> dict:
+def _payload_plan(xwalk:pd.DataFrame, cols:list, plans:dict=None, name:str='') -> list:
+    """Compile the casts `_generate_payload()` applies to each `k_load` column
+
+    The plan is keyed by a hash of the xwalk attributes it depends on, so editing a table's CREATE TABLE (i.e., its fieldtype or maxlen) rebuilds only that table's plan.
+
+    Args:
+        xwalk (pd.DataFrame): the table's `xwalk`, after `tx._add_sql_constraints()`
+        cols (list): the `k_load` columns, in order
+        plans (dict, optional): cached plans, from `_load_payload_plans()`; updated in place. Defaults to None, i.e., build the plan without caching it.
+        name (str, optional): the table's key in `plans` e.g., 'ncrn.BirdDetection'. Defaults to ''.
+
+    Returns:
+        list: one step per column, e.g., {'col':'Temperature', 'caster':'decimal', 'maxlen':None, 'precision':[5, 2]}
+    """
+    if plans is None:
+        plans = {}
+    attrs = [x for x in ['fieldtype', 'maxlen'] if x in xwalk.columns] # the casters read nothing else; nullability is checked by `src.check`
+    lookup = xwalk.drop_duplicates('destination', keep='first').set_index('destination')[attrs] # the first match, like `xwalk[xwalk['destination']==col].fieldtype.values[0]`
+    fields = []
+    for col in cols:
+        if col in lookup.index:
+            fields.append([col] + [_plain(lookup.at[col, attr]) for attr in attrs])
+        else:
+            fields.append([col])
+    key = hashlib.sha256(json.dumps([PAYLOAD_PLANS['version'], attrs, fields, PAYLOAD_DONT_ROUND], default=str).encode('utf-8')).hexdigest()
+    if name in plans.keys() and plans[name]['key'] == key:
+        return plans[name]['plan']
+
+    plan = []
+    for field in fields:
+        attr = dict(zip(attrs, field[1:]))
+        step = {'col':field[0], 'caster':'none', 'maxlen':None, 'precision':None}
+        fieldtype = attr.get('fieldtype')
+        if fieldtype in ['DATE', 'DATETIME', 'DATETIME2']:
+            step['caster'] = 'datetime'
+        elif fieldtype == 'VARCHAR':
+            step['caster'] = 'varchar'
+            if isinstance(attr.get('maxlen'), (int, float)) and attr.get('maxlen') > 0:
+                step['maxlen'] = int(attr.get('maxlen'))
+        elif fieldtype in ['INT', 'BIT']:
+            step['caster'] = 'int'
+        elif fieldtype == 'DECIMAL':
+            step['caster'] = 'decimal'
+            step['precision'] = [int(x) for x in str(attr.get('maxlen')).replace('(','').replace(')','').split(',')]
+        elif fieldtype == 'FLOAT' and field[0] not in PAYLOAD_DONT_ROUND:
+            step['caster'] = 'float'
+        plan.append(step)
+    plans[name] = {'key':key, 'plan':plan}
+
+    return plan
+
+def _plain(val):
+    """A JSON-friendly copy of an xwalk attribute: NaN becomes None and numpy scalars become Python scalars"""
+    if isinstance(val, str):
+        return val
+    if pd.isna(val):
+        return None
+    if isinstance(val, np.generic):
+        return val.item()
+    return val
+
+def _load_payload_plans() -> dict:
+    """The cached payload plans, if they were saved against the current constraint catalog; {} otherwise"""
+    if not PAYLOAD_PLANS['enabled'] or not os.path.exists(PAYLOAD_PLANS['path']):
+        return {}
+    try:
+        with open(PAYLOAD_PLANS['path'], 'r') as f:
+            saved = json.load(f)
+        plans = saved['plans'] if saved.get('catalog') == _catalog_hash() else {} # the CREATE TABLE script changed since
+    except:
+        print(f"WARNING! Could not read `{PAYLOAD_PLANS['path']}`; payload plans will be rebuilt.")
+        plans = {}
+
+    return plans
+
+def _save_payload_plans(plans:dict) -> None:
+    if not PAYLOAD_PLANS['enabled']:
+        return
+    try:
+        os.makedirs(os.path.dirname(PAYLOAD_PLANS['path']), exist_ok=True)
+        with open(PAYLOAD_PLANS['path'], 'w') as f:
+            json.dump({'catalog':_catalog_hash(), 'plans':plans}, f, indent=2)
+    except:
+        print(f"WARNING! Could not save payload plans to `{PAYLOAD_PLANS['path']}`.")
+
+def _catalog_hash() -> str:
+    """The sha256 of the CREATE TABLE script, from its constraint catalog; '' if the script can't be read"""
+    try:
+        return ddl.load_catalog()['sha256']
+    except:
+        return ''
+
+def _cast_none(payload:pd.DataFrame, step:dict, schema:str, tbl:str) -> None:
+    pass
+
+def _cast_datetime(payload:pd.DataFrame, step:dict, schema:str, tbl:str) -> None:
+    col = step['col']
+    try:
+        mask = (payload[col].isna())
+        payload[col] = np.where(mask, 'NULL', payload[col].astype(str).str.replace('-',''))
+    except:
+        pass
+
+def _cast_varchar(payload:pd.DataFrame, step:dict, schema:str, tbl:str) -> None:
+    col = step['col']
+    if step['maxlen'] is not None:
+        try:
+            payload[col] = payload[col].str[:step['maxlen']]
+        except:
+            pass
+    try:
+        mask = (payload[col].isna())
+        payload[col] = np.where(mask, 'NULL', payload[col])
+        if any(payload[col].str.contains('|'.join(PAYLOAD_NONSENSE.keys()), regex=True)):
+            for k,v in PAYLOAD_NONSENSE.items():
+                payload[col] = payload[col].str.replace(k,v)
+    except:
+        print(f"FAIL: partial string replace in birds['{schema}']['{tbl}']['payload']['{col}']")
+
+def _cast_int(payload:pd.DataFrame, step:dict, schema:str, tbl:str) -> None:
+    col = step['col']
+    try:
+        payload[col] = payload[col].astype('Int64')
+    except:
+        print(f"FAIL: cast to int in birds['{schema}']['{tbl}']['payload']['{col}']")
+
+def _cast_decimal(payload:pd.DataFrame, step:dict, schema:str, tbl:str) -> None:
+    col = step['col']
+    num_left, num_right = step['precision']
+    if any(payload[col]>int('9'*num_right)):
+        try:
+            payload[col] = payload[col].round(num_left)
+        except:
+            print(f"FAIL: cast to decimal in birds['{schema}']['{tbl}']['payload']['{col}']")
+
+def _cast_float(payload:pd.DataFrame, step:dict, schema:str, tbl:str) -> None:
+    col = step['col']
+    try:
+        payload[col] = payload[col].round(1)
+    except:
+        print(f"FAIL: cast to FLOAT in birds['{schema}']['{tbl}']['payload']['{col}']")
+
+# `_generate_payload()` casts each column with the caster its plan step names
+PAYLOAD_CASTERS = {
+    'none': _cast_none
+    ,'datetime': _cast_datetime
+    ,'varchar': _cast_varchar
+    ,'int': _cast_int
+    ,'decimal': _cast_decimal
+    ,'float': _cast_float
+}
+
+def _generate_tsql(xwalk_dict:dict, tbls:list=None) -> dict:
     """Make `tsql` from `payload`
     
     The `tsql` is a string of transact SQL INSERT statements that, if executed against the db, would insert the rows from `payload` into the table of the db
 
     The idea is that, if you write `tsql`s to file, you have the TSQL to seed the db from scratch
+
+    Each column is formatted once (see `_tsql_text()`); the text is identical to formatting each row with `str(tuple(row.values))` (see tests/test_tsql.py).
     """
     # e.g.,
     # INSERT INTO [NCRN_Landbirds].[lu].[ExperienceLevel] ([ID],[Code],[Label],[Description],[SortOrder]) VALUES (2,'EXP','Expert','An expert',2)
-    nonsense = {
-        "'NULL'":'NULL'
-        ,"'nan'":'NULL'
-        ,", nan":', NULL'
-        ,"<NA>":'NULL'
-        ,'"':"'"
-    }
     for schema in xwalk_dict.keys():
         for tbl in xwalk_dict[schema].keys():
-            df = xwalk_dict[schema][tbl]['payload'].copy()
-            target = f'[NCRN_Landbirds].[{schema}].[{tbl}]'
-            sql_texts = []
-            cleancols = [re.sub(r"\b%s\b" % 'Group' , '[Group]', x) for x in list(df.columns)]
-            cleancols = [re.sub(r"\b%s\b" % 'Order' , '[Order]', x) for x in cleancols]
-            for index, row in df.iterrows():
-                line = 'INSERT INTO '+target+' ('+ str(', '.join(cleancols))+ ') VALUES '+ str(tuple(row.values))
-                for k,v in nonsense.items():
-                    line = line.replace(k,v)
-                sql_texts.append(line)
-            xwalk_dict[schema][tbl]['tsql'] = '\n'.join(sql_texts)
+            if tbls is not None and (schema, tbl) not in tbls:
+                continue
+            with prof._span('tsql', '_generate_tsql', schema, tbl) as record:
+                table = xwalk_dict[schema][tbl]
+                fieldtypes = dict(zip(table.xwalk['destination'], table.xwalk['fieldtype']))
+                if table.lazy: # made when it's read, e.g., by `src.load_tbls`
+                    table.tsql = bd.Deferred(_tsql_text, table.payload, schema, tbl, fieldtypes)
+                else:
+                    table.tsql = _tsql_text(table.payload, schema, tbl, fieldtypes)
+                record['rows'] = len(table.payload)
 
     return xwalk_dict
 
+def _tsql_prefix(df:pd.DataFrame, schema:str, tbl:str) -> str:
+    target = f'[NCRN_Landbirds].[{schema}].[{tbl}]'
+    cleancols = [re.sub(r"\b%s\b" % 'Group' , '[Group]', x) for x in list(df.columns)]
+    cleancols = [re.sub(r"\b%s\b" % 'Order' , '[Order]', x) for x in cleancols]
+
+    return 'INSERT INTO '+target+' ('+ str(', '.join(cleancols))+ ') VALUES '
+
+def _tsql_text(df:pd.DataFrame, schema:str, tbl:str, fieldtypes:dict=None) -> str:
+    """Format a `payload` as INSERT statements, one column at a time
+
+    `str(tuple(row.values))` writes each value with `repr()`, so each column is formatted to the `repr()` of the values `df.iterrows()` would give: the xwalk `fieldtype` picks the vectorized formatter (`TSQL_FORMATS`), and values the formatter can't vouch for (e.g., a string that `repr()` would escape, a `Timestamp`) fall back to `repr()` one value at a time.
+    None of the `TSQL_NONSENSE` patterns can span a line break, so the replacements run once over the joined text instead of once per row.
+
+    Args:
+        df (pd.DataFrame): `payload`
+        schema (str): e.g., 'ncrn'
+        tbl (str): e.g., 'BirdDetection'
+        fieldtypes (dict, optional): {destination column: xwalk fieldtype}. Defaults to None, i.e., infer from the values.
+
+    Returns:
+        str: newline-separated INSERT statements
+    """
+    if len(df) == 0:
+        return ''
+    if fieldtypes is None:
+        fieldtypes = {}
+    values = df.values # the same array `df.iterrows()` slices its rows from
+    cols = [_format_tsql_column(values[:, i], TSQL_FORMATS.get(fieldtypes.get(col), '')) for i, col in enumerate(df.columns)]
+    if len(cols) == 0:
+        rows = np.full(len(df), '()', dtype=object)
+    elif len(cols) == 1:
+        rows = '(' + cols[0] + ',)' # a one-item tuple
+    else:
+        rows = cols[0]
+        for col in cols[1:]:
+            rows = rows + ', ' + col
+        rows = '(' + rows + ')'
+    text = '\n'.join(_tsql_prefix(df, schema, tbl) + rows)
+    for k,v in TSQL_NONSENSE.items():
+        text = text.replace(k,v)
+
+    return text
+
+def _format_tsql_column(col:np.ndarray, kind:str) -> np.ndarray:
+    """`repr()` of every value in one column of `df.values`, as an object array of strings
+
+    Args:
+        col (np.ndarray): one column of `df.values`
+        kind (str): 'text', 'number', or '' (see `TSQL_FORMATS`)
+    """
+    if col.dtype != object: # every column has the same numpy dtype, so the values are numpy scalars e.g., `np.int64(2)`
+        if NUMPY_REPR_IS_STR and col.dtype.kind in 'iufb':
+            return col.astype(str).astype(object)
+        return np.array([repr(x) for x in col], dtype=object)
+    types = set(map(type, col))
+    if kind == 'text' and types <= {str}:
+        text = pd.Series(col, dtype=object)
+        escaped = text.str.contains(r"['\\]|[^\x20-\x7e]", regex=True).values # quotes, backslashes, and non-ASCII characters are up to `repr()`
+        formatted = ("'" + text + "'").to_numpy(dtype=object, copy=True)
+        if escaped.any():
+            formatted[escaped] = [repr(x) for x in col[escaped]]
+        return formatted
+    if types <= TSQL_STR_IS_REPR: # e.g., INT, BIT, FLOAT, or DECIMAL values with NULLs
+        return col.astype(str).astype(object)
+
+    return np.array([repr(x) for x in col], dtype=object)
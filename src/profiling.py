@@ -0,0 +1,190 @@
+"""Per-stage and per-table profiling for `make_birds()`, `check_birds()`, `unit_test()`, and `load_birds()`
+
+With profiling on (e.g., `make_birds(profile='assets/profile.json')`), each step of the pipeline is recorded in `PROFILE_LOG` as a dictionary:
+-run: the entry point the step ran under e.g., 'make_birds', 'check_birds'
+-stage: 'extract', 'create_xwalks', 'exceptions', 'xwalks', 'constraints', 'k_load', 'payload', 'tsql', 'save', or the entry point's name for `check_birds()`, `unit_test()`, and `load_birds()`
+-step: the function that ran e.g., '_exception_ncrn_Location', '_ncrn_Park', '_update_foreign_keys'
+-schema, tbl: the table the step worked on; '' for steps that work on every table at once
+-wall_s, cpu_s: wall-clock and CPU seconds (CPU time counts every thread in the process, e.g., the extraction thread pool)
+-rss_peak_mb: the process's peak resident set size when the step finished; None if it can't be read
+-rss_growth_mb: how much the step raised that peak, i.e., the memory the step needed beyond what earlier steps already needed
+-rows: rows in the step's output (e.g., the table's `source` after an exception, its `k_load` after k_load); None if the step has no one output
+-ok: False if the step raised
+-pid: the process the step ran in; with `make_birds(workers=...)`, the transform and load steps run in `src.scheduler`'s worker processes
+
+Steps don't nest, so summing `wall_s` by stage gives each stage's time. In a lazy `src.birds.BirdsTable`, the `tsql` step only defers `tsql`; it's made when it's read, e.g., by `load_birds()`.
+`_report()` prints the slowest steps and each stage's totals, and writes every record to `PROFILING['json']`.
+"""
+import pandas as pd
+import contextlib
+import datetime
+import time
+import json
+import sys
+import os
+try:
+    import resource
+except ImportError: # e.g., Windows; try psutil instead
+    resource = None
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+PROFILING = {
+    'enabled': False
+    ,'json': '' # filepath to which `_report()` writes every record; '' to print only
+    ,'top': 20 # the number of slowest steps `_report()` prints
+}
+PROFILE_LOG = []
+_RUN = {'name': ''} # the entry point steps are recorded under; set by `_configure()` and `_start_run()`
+
+def _configure(enabled:bool=False, json_path:str='', run:str='make_birds') -> None:
+    """Clear `PROFILE_LOG` and turn profiling on or off for the next run
+
+    Args:
+        enabled (bool, optional): record steps at all. Defaults to False.
+        json_path (str, optional): write every record to this JSON file in `_report()`. Defaults to ''.
+        run (str, optional): the entry point the next steps run under. Defaults to 'make_birds'.
+    """
+    PROFILING['enabled'] = enabled
+    PROFILING['json'] = json_path
+    _RUN['name'] = run
+    PROFILE_LOG.clear()
+
+def _start_run(run:str) -> None:
+    """Record the next steps under another entry point, keeping the records so far, e.g., `check_birds()` after `make_birds()`"""
+    _RUN['name'] = run
+
+@contextlib.contextmanager
+def _span(stage:str, step:str, schema:str='', tbl:str=''):
+    """Time one step; the caller can set the yielded record's 'rows'
+
+    Examples:
+        with prof._span('payload', '_generate_payload', schema, tbl) as record:
+            ...
+            record['rows'] = len(table.payload)
+    """
+    record = {'run':_RUN['name'], 'stage':stage, 'step':step, 'schema':schema, 'tbl':tbl, 'rows':None, 'ok':True}
+    if not PROFILING['enabled']:
+        yield record
+        return
+    peak_before = _peak_rss()
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        yield record
+    except:
+        record['ok'] = False
+        raise
+    finally:
+        record['wall_s'] = time.perf_counter() - wall_start
+        record['cpu_s'] = time.process_time() - cpu_start
+        peak_after = _peak_rss()
+        record['rss_peak_mb'] = None if peak_after is None else peak_after/2**20
+        record['rss_growth_mb'] = None if peak_after is None or peak_before is None else (peak_after - peak_before)/2**20
+        record['pid'] = os.getpid()
+        PROFILE_LOG.append(record)
+
+def _call(stage:str, func, xwalk_dict:dict, *args, attr:str='source', **kwargs):
+    """Run `func(xwalk_dict, *args, **kwargs)` as one step, e.g., an exception function in `src.tbl_xwalks`
+
+    The table is read from the function's name (e.g., `_exception_ncrn_Location` or `_ncrn_Park` is ncrn.Location or ncrn.Park), and `rows` is the length of that table's `attr` afterwards.
+
+    Returns:
+        object: what `func` returns
+    """
+    schema, tbl = _table_of(func.__name__, xwalk_dict)
+    with _span(stage, func.__name__, schema, tbl) as record:
+        result = func(xwalk_dict, *args, **kwargs)
+        if PROFILING['enabled'] and tbl != '':
+            try:
+                record['rows'] = len(result[schema][tbl][attr])
+            except:
+                pass
+
+    return result
+
+def _table_of(name:str, xwalk_dict:dict) -> tuple:
+    """(schema, tbl) from a function name like '_exception_ncrn_Location' or '_ncrn_Park'; ('', '') if it doesn't name a table in `xwalk_dict`"""
+    stem = name[len('_exception'):] if name.startswith('_exception_') else name
+    try:
+        for schema in xwalk_dict.keys():
+            if stem.startswith(f'_{schema}_') and stem[len(schema)+2:] in xwalk_dict[schema].keys():
+                return schema, stem[len(schema)+2:]
+    except AttributeError:
+        pass
+
+    return '', ''
+
+def _drain() -> list:
+    """Remove and return every record so far, e.g., to send a worker process's records back with its results"""
+    records = list(PROFILE_LOG)
+    PROFILE_LOG.clear()
+
+    return records
+
+def _peak_rss():
+    """The process's peak resident set size in bytes; None if neither `resource` nor psutil can read it"""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak*1024 # bytes on macOS, kilobytes elsewhere
+    if psutil is not None:
+        memory = psutil.Process().memory_info()
+        return getattr(memory, 'peak_wset', memory.rss) # Windows reports the peak working set
+
+    return None
+
+def _report(records:list=None, run:str='', verbose:bool=True) -> pd.DataFrame:
+    """Summarize profiling records, print the slowest steps and each stage's totals, and write every record to `PROFILING['json']`
+
+    Args:
+        records (list, optional): records to summarize, e.g., read back from the JSON file. Defaults to `PROFILE_LOG`.
+        run (str, optional): summarize only this entry point's steps e.g., 'make_birds'. Defaults to '', i.e., every step.
+        verbose (bool, optional): print the summary. Defaults to True.
+
+    Returns:
+        pd.DataFrame: one row per step; slowest first
+
+    Examples:
+        import src.profiling as prof
+        report = prof._report()
+        report = prof._report(json.load(open('assets/profile.json'))['records'])
+        report.groupby(['schema', 'tbl'])['wall_s'].sum().sort_values() # time per table across stages
+    """
+    cols = ['run', 'stage', 'step', 'schema', 'tbl', 'wall_s', 'cpu_s', 'rss_peak_mb', 'rss_growth_mb', 'rows', 'ok', 'pid']
+    write = records is None
+    if records is None:
+        records = list(PROFILE_LOG)
+        if write and PROFILING['json'] != '':
+            _write_json(records)
+    report = pd.DataFrame(records, columns=cols)
+    if run != '':
+        report = report[report['run'] == run]
+    report = report.sort_values('wall_s', ascending=False).reset_index(drop=True)
+    if verbose and len(report) > 0:
+        table = report.head(PROFILING['top']).copy()
+        table['table'] = (table['schema'] + '.' + table['tbl']).where(table['tbl'] != '', '')
+        for col in ['wall_s', 'cpu_s', 'rss_peak_mb', 'rss_growth_mb']:
+            table[col] = table[col].astype(float).round(2)
+        table['rows'] = table['rows'].astype('Int64')
+        print('')
+        print(f"Profile{' of `' + run + '()`' if run != '' else ''}: {len(report)} steps in {round(report['wall_s'].sum(), 2)}s wall, {round(report['cpu_s'].sum(), 2)}s CPU; the {len(table)} slowest steps:")
+        print(table[['stage', 'step', 'table', 'wall_s', 'cpu_s', 'rss_peak_mb', 'rss_growth_mb', 'rows']].to_string(index=False))
+        totals = report.groupby('stage', sort=False)[['wall_s', 'cpu_s']].sum().sort_values('wall_s', ascending=False)
+        print('By stage:')
+        for stage, row in totals.iterrows():
+            print(f"    {stage}: {round(row['wall_s'], 2)}s wall, {round(row['cpu_s'], 2)}s CPU")
+        for failure in report[report['ok'] == False].itertuples():
+            print(f"    FAIL: {failure.stage}.{failure.step} {failure.schema}.{failure.tbl} raised")
+
+    return report
+
+def _write_json(records:list) -> None:
+    try:
+        if os.path.dirname(PROFILING['json']) != '':
+            os.makedirs(os.path.dirname(PROFILING['json']), exist_ok=True)
+        with open(PROFILING['json'], 'w') as f:
+            json.dump({'saved':datetime.datetime.now().isoformat(timespec='seconds'), 'records':records}, f, indent=2, default=str)
+    except:
+        print(f"WARNING! Could not write the profile to `{PROFILING['json']}`.")
@@ -0,0 +1,8 @@
+SELECT
+  TABLE_SCHEMA
+  ,TABLE_NAME
+  ,COLUMN_NAME
+  ,ORDINAL_POSITION
+  ,DATA_TYPE
+FROM INFORMATION_SCHEMA.COLUMNS
+ORDER BY TABLE_SCHEMA, TABLE_NAME, ORDINAL_POSITION;
@@ -0,0 +1,218 @@
+"""Run the per-table stages of `make_birds()` concurrently, in an order derived from the dependencies between tables
+
+After the exceptions, each table goes through two tasks:
+-transform: `_execute_xwalks()`, `tx._add_row_id()`, `tx._add_sql_constraints()`, and `tx._make_pk_fk_lookup()` for the table
+-load: `_generate_k_load()`, `_generate_payload()`, and `_generate_tsql()` for the table
+
+Dependencies (see `_table_dag()`):
+-a table's load waits for its own transform and for the transform of every table its foreign keys reference (the `references` column that `tx._add_sql_constraints()` attaches), because `k_load` reads their `pk_fk_lookup`
+-a table's transform waits for the transform of every earlier table (in `birds` order) its calculated fields read; a later table is read as it was before any transform, like `_execute_xwalks()` would see it. The exceptions have all run before any transform, so what they read doesn't order the transforms
+
+With checkpoints (see `_run_tables()`), every table finishes each stage before any table starts the next one, i.e., xwalks (the transforms), then `k_load`, `payload`, and `tsql`, so each stage can be saved like in a run without workers.
+
+Tasks run in a process pool. Each task gets a copy of the tables it reads and sends back only the attributes it makes, and its console output is printed in table order once every task has finished, so neither `birds` nor the output depends on which task finishes first.
+With profiling on (see `src.profiling`), each task profiles its own steps and sends the records back with its attributes.
+The exceptions still run one after another, in `make_templates._execute_xwalk_exceptions()`, because their order is part of their logic (e.g., `_exception_ncrn_DetectionEvent()` reads `ncrn.Contact` before `_exception_ncrn_Contact()` changes it).
+"""
+import src.make_templates as mt
+import src.tbl_xwalks as tx
+import src.birds as bd
+import src.profiling as prof
+import concurrent.futures
+import contextlib
+import ast
+import io
+
+TRANSFORM_ATTRS = ['xwalk', 'tbl_load', 'pk_fk_lookup'] # the attributes a transform task sends back; `source` only has its index reset, which `_run_tables()` does afterwards
+LOAD_READS = ['xwalk', 'tbl_load', 'pk_fk_lookup'] # the attributes a load task needs from its own table
+# with checkpoints, the load runs as one task per stage: {stage: (the attributes it needs from its own table, the attributes it sends back)}
+LOAD_STAGES = {
+    'k_load': (['xwalk', 'tbl_load', 'pk_fk_lookup'], ['k_load'])
+    ,'payload': (['xwalk', 'k_load'], ['payload', 'audit'])
+    ,'tsql': (['xwalk', 'payload'], ['tsql'])
+}
+
+def _run_tables(xwalk_dict:dict, workers:int, checkpoint=None) -> dict:
+    """Transform every table and generate its `k_load`, `payload`, and `tsql`, in `workers` processes
+
+    The result is the same as running `_execute_xwalks()` through `_generate_tsql()` one after another.
+
+    Args:
+        xwalk_dict (dict): `birds` after `make_templates._execute_xwalk_exceptions()`
+        workers (int): the number of processes
+        checkpoint (callable, optional): called as `checkpoint(stage, xwalk_dict)` once every table has finished each of 'xwalks', 'k_load', 'payload', and 'tsql', e.g., `src.checkpoints._save`; the stages then run one after another. Defaults to None, i.e., a table's load starts as soon as the transforms it depends on have finished.
+
+    Returns:
+        dict: `xwalk_dict` with every table's `tbl_load`, `pk_fk_lookup`, `k_load`, `payload`, `audit`, and `tsql`
+
+    Examples:
+        import src.scheduler as scheduler
+        import src.checkpoints as ck
+        birds = scheduler._run_tables(birds, workers=4)
+        birds = scheduler._run_tables(birds, workers=4, checkpoint=ck._save)
+    """
+    constraints = tx._sql_constraints(xwalk_dict)
+    dag = _table_dag(xwalk_dict, constraints)
+    order = [(schema, tbl) for schema in xwalk_dict.keys() for tbl in xwalk_dict[schema].keys()]
+    plans = mt._load_payload_plans()
+    initial = {key: xwalk_dict[key[0]][key[1]].copy() for key in order} # each table before its transform, for the tables that read it before their turn
+    if checkpoint is None:
+        phases = [['transform', 'load']]
+    else:
+        phases = [['transform']] + [[stage] for stage in LOAD_STAGES.keys()]
+    transformed = set()
+    logs = {}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        for phase in phases:
+            pending = [(stage, key) for stage in phase for key in order]
+            futures = {}
+            while len(pending) > 0 or len(futures) > 0:
+                for task in [x for x in pending if dag.get(x[0], {}).get(x[1], set()) <= transformed]:
+                    pending.remove(task)
+                    futures[_submit(pool, xwalk_dict, initial, task, dag, constraints, plans)] = task
+                finished, _ = concurrent.futures.wait(futures.keys(), return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in finished:
+                    stage, (schema, tbl) = futures.pop(future)
+                    attrs, plan, log, records = future.result()
+                    xwalk_dict[schema][tbl].update(attrs)
+                    prof.PROFILE_LOG.extend(records)
+                    logs[(stage, (schema, tbl))] = log
+                    if stage == 'transform':
+                        transformed.add((schema, tbl))
+                    elif plan is not None:
+                        plans[f'{schema}.{tbl}'] = plan
+            if 'transform' in phase:
+                for schema, tbl in order:
+                    xwalk_dict[schema][tbl].source.reset_index(inplace=True, drop=True)
+            if 'payload' in phase or 'load' in phase:
+                mt._save_payload_plans(plans)
+            if checkpoint is not None:
+                checkpoint('xwalks' if phase == ['transform'] else phase[0], xwalk_dict)
+    for stage in [stage for phase in phases for stage in phase]:
+        for key in order:
+            if logs[(stage, key)] != '':
+                print(logs[(stage, key)], end='')
+
+    return xwalk_dict
+
+def _submit(pool, xwalk_dict:dict, initial:dict, task:tuple, dag:dict, constraints:dict, plans:dict) -> concurrent.futures.Future:
+    stage, (schema, tbl) = task
+    if stage == 'transform':
+        tables = {schema: {tbl: xwalk_dict[schema][tbl]}}
+        for ref in dag['reads'][(schema, tbl)]:
+            tables.setdefault(ref[0], {})[ref[1]] = xwalk_dict[ref[0]][ref[1]]
+        for ref in dag['reads_initial'][(schema, tbl)]:
+            tables.setdefault(ref[0], {})[ref[1]] = initial[ref]
+        tbl_constraints = {schema: {tbl: constraints[schema][tbl]}} if tbl in constraints.get(schema, {}).keys() else {}
+        return pool.submit(_transform_task, schema, tbl, tables, tbl_constraints, mt.XWALK_EXPRESSIONS, prof.PROFILING['enabled'])
+    table = xwalk_dict[schema][tbl]
+    reads = LOAD_READS if stage == 'load' else LOAD_STAGES[stage][0]
+    tables = {schema: {tbl: bd.BirdsTable({attr: table.raw(attr) for attr in reads}, lazy=table.lazy)}} # `lazy`, so the worker defers `audit` and `tsql` too
+    if stage in ['load', 'k_load']:
+        for ref_schema, ref_tbl in dag['load'][(schema, tbl)] - {(schema, tbl)}:
+            tables.setdefault(ref_schema, {})[ref_tbl] = bd.BirdsTable({'pk_fk_lookup': xwalk_dict[ref_schema][ref_tbl].pk_fk_lookup})
+    name = f'{schema}.{tbl}'
+    tbl_plans = {name: plans[name]} if name in plans.keys() else {}
+    stages = list(LOAD_STAGES.keys()) if stage == 'load' else [stage]
+    return pool.submit(_load_task, schema, tbl, tables, tbl_plans, prof.PROFILING['enabled'], stages)
+
+def _transform_task(schema:str, tbl:str, tables:dict, constraints:dict, expressions:bool, profiling:bool=False) -> tuple:
+    """Run in a worker process: crosswalk one table and make its `pk_fk_lookup`"""
+    mt.XWALK_EXPRESSIONS = expressions
+    prof._configure(enabled=profiling)
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        mt._execute_xwalks(tables, tbls=[(schema, tbl)])
+        own = {schema: {tbl: tables[schema][tbl]}}
+        with prof._span('constraints', '_add_row_id', schema, tbl):
+            tx._add_row_id(own)
+        with prof._span('constraints', '_add_sql_constraints', schema, tbl):
+            tx._add_sql_constraints(own, constraints)
+        with prof._span('constraints', '_make_pk_fk_lookup', schema, tbl):
+            tx._make_pk_fk_lookup(own)
+    attrs = {attr: tables[schema][tbl][attr] for attr in TRANSFORM_ATTRS}
+
+    return attrs, None, log.getvalue(), prof._drain()
+
+def _load_task(schema:str, tbl:str, tables:dict, plans:dict, profiling:bool=False, stages:list=None) -> tuple:
+    """Run in a worker process: make one table's `k_load`, `payload`, and `tsql`, or only the `stages` of them"""
+    if stages is None:
+        stages = list(LOAD_STAGES.keys())
+    prof._configure(enabled=profiling)
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        if 'k_load' in stages:
+            mt._generate_k_load(tables, tbls=[(schema, tbl)])
+        if 'payload' in stages:
+            mt._generate_payload(tables, tbls=[(schema, tbl)], plans=plans)
+        if 'tsql' in stages:
+            mt._generate_tsql(tables, tbls=[(schema, tbl)])
+    attrs = {attr: tables[schema][tbl].raw(attr) for stage in stages for attr in LOAD_STAGES[stage][1]} # deferred attributes go back as their recipes
+
+    return attrs, plans.get(f'{schema}.{tbl}'), log.getvalue(), prof._drain()
+
+def _table_dag(xwalk_dict:dict, constraints:dict) -> dict:
+    """The tables whose transform each task waits for
+
+    Args:
+        xwalk_dict (dict): `birds`
+        constraints (dict): output of `tx._sql_constraints()`
+
+    Returns:
+        dict: {'transform': {(schema, tbl): set of (schema, tbl)}, 'load': {...}, 'reads': {(schema, tbl): the earlier tables its calculated fields read}, 'reads_initial': {...: the later tables}}
+    """
+    order = [(schema, tbl) for schema in xwalk_dict.keys() for tbl in xwalk_dict[schema].keys()]
+    keys = set(order)
+    dag = {'transform': {}, 'load': {}, 'reads': {}, 'reads_initial': {}}
+    for i, (schema, tbl) in enumerate(order):
+        reads = (_calculation_reads(xwalk_dict, schema, tbl) & keys) - {(schema, tbl)}
+        dag['reads'][(schema, tbl)] = reads & set(order[:i])
+        dag['reads_initial'][(schema, tbl)] = reads - set(order[:i])
+        dag['transform'][(schema, tbl)] = set(dag['reads'][(schema, tbl)])
+        references = set()
+        if tbl in constraints.get(schema, {}).keys():
+            constraint_df = constraints[schema][tbl]['constraint_df']
+            for ref in constraint_df[constraint_df['fk']==True].references.dropna().unique():
+                lookup = ref.split('.')
+                if len(lookup) == 3:
+                    references.add((lookup[0], lookup[1]))
+        dag['load'][(schema, tbl)] = (references & keys) | {(schema, tbl)}
+    _break_cycles(dag['transform'])
+
+    return dag
+
+def _break_cycles(deps:dict) -> None:
+    """Drop the edges that would keep some transforms from ever starting; they then run in whichever order they finish"""
+    done = set()
+    while len(done) < len(deps):
+        ready = [key for key in deps.keys() if key not in done and deps[key] <= done]
+        if len(ready) == 0:
+            stuck = sorted([key for key in deps.keys() if key not in done])
+            print(f"WARNING! Circular dependency among {['.'.join(x) for x in stuck]}; ignoring {['.'.join(x) for x in deps[stuck[0]] - done]} for `{'.'.join(stuck[0])}`")
+            deps[stuck[0]] = deps[stuck[0]] & done
+            continue
+        done.update(ready)
+
+def _calculation_reads(xwalk_dict:dict, schema:str, tbl:str) -> set:
+    """The tables a table's calculated fields read, from the `xwalk_dict[schema][tbl]` subscripts in their code"""
+    xwalk = xwalk_dict[schema][tbl]['xwalk']
+    codes = xwalk[xwalk['calculation']=='calculate_dest_field_from_source_field'].source.values
+    reads = set()
+    for code in codes:
+        for line in str(code).split('$splithere$'):
+            try:
+                reads.update(_table_subscripts(ast.parse(line.strip())))
+            except SyntaxError:
+                pass # reported by `make_templates._compile_xwalk_code()`
+
+    return reads
+
+def _table_subscripts(tree) -> set:
+    """Every (schema, tbl) in a `xwalk_dict['schema']['tbl']` subscript under an AST node"""
+    tables = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Subscript) and isinstance(node.value, ast.Subscript) and isinstance(node.value.value, ast.Name) and node.value.value.id == 'xwalk_dict':
+            if isinstance(node.slice, ast.Constant) and isinstance(node.value.slice, ast.Constant):
+                tables.add((node.value.slice.value, node.slice.value))
+
+    return tables
@@ -0,0 +1,151 @@
+"""Build SQLite replicas of the source and destination databases for the 'sqlite' backend (see `src.backends`)
+
+The Access replicas are copied table-by-table from the production files, so building them requires the Access ODBC driver once (e.g., on a Windows workstation); the replicas can then be copied to any machine.
+The destination replica is built offline from the CREATE TABLE script (`assets.CREATE_SQL`), one attached SQLite database per schema.
+"""
+import src.backends as backends
+import src.tbl_xwalks as tx
+import pandas as pd
+import sqlite3
+import os
+
+# SQLite column types for the destination, by SQL Server field type; anything not listed (e.g., VARCHAR, UNIQUEIDENTIFIER) is TEXT
+DEST_TYPES = {
+    'INT':'INTEGER'
+    ,'BIGINT':'INTEGER'
+    ,'SMALLINT':'INTEGER'
+    ,'TINYINT':'INTEGER'
+    ,'BIT':'INTEGER'
+    ,'DECIMAL':'NUMERIC'
+    ,'NUMERIC':'NUMERIC'
+    ,'FLOAT':'REAL'
+    ,'REAL':'REAL'
+    ,'DATE':'DATE'
+    ,'DATETIME':'DATETIME'
+    ,'DATETIME2':'DATETIME'
+    ,'SMALLDATETIME':'DATETIME'
+    ,'ROWVERSION':'BLOB'
+}
+
+def build_replicas(sources:list=None, destination:bool=True) -> dict:
+    """Build the SQLite replicas in `backends.SQLITE['dir']`
+
+    Args:
+        sources (list, optional): the Access databases to copy; each needs the Access ODBC driver. Defaults to None, i.e., ['access', 'c'].
+        destination (bool, optional): (re)build an empty `NCRN_Landbirds` from `assets.CREATE_SQL`. Defaults to True.
+
+    Returns:
+        dict: {replica filepath: number of tables}
+
+    Examples:
+        import src.sqlite_replica as sr
+        sr.build_replicas() # on a machine with the Access ODBC driver
+        sr.build_replicas(sources=[]) # anywhere; only rebuilds the empty destination
+    """
+    if sources is None:
+        sources = ['access', 'c']
+    os.makedirs(backends.SQLITE['dir'], exist_ok=True)
+    built = {}
+    for db in sources:
+        path = backends._sqlite_path(db)
+        built[path] = _replicate_access(db, path)
+    if destination:
+        built.update(_create_destination())
+    for path, n in built.items():
+        print(f'Built `{path}`: {n} tables')
+
+    return built
+
+def _replicate_access(db:str, path:str) -> int:
+    """Copy every table in an Access database into a new SQLite file
+
+    Column types are declared (TIMESTAMP, BOOLEAN, INTEGER, REAL, TEXT) so the 'sqlite' backend returns the same Python types the Access driver does.
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    src = backends._odbc_connect(db)
+    tbls = [row.table_name for row in src.cursor().tables(tableType='TABLE')]
+    dest = sqlite3.connect(path)
+    n = 0
+    for tbl in tbls:
+        try:
+            df = pd.read_sql_query(f'SELECT * FROM [{tbl}]', src)
+            df.to_sql(tbl, dest, index=False, if_exists='replace', dtype=_sqlite_dtypes(df))
+            n += 1
+        except:
+            print(f'WARNING! Could not copy `{db}`.`{tbl}` to `{path}`.')
+    dest.commit()
+    dest.close()
+    src.close()
+
+    return n
+
+def _sqlite_dtypes(df:pd.DataFrame) -> dict:
+    dtypes = {}
+    for col in df.columns:
+        if pd.api.types.is_datetime64_any_dtype(df[col]):
+            dtypes[col] = 'TIMESTAMP'
+        elif pd.api.types.is_bool_dtype(df[col]):
+            dtypes[col] = 'BOOLEAN'
+        elif pd.api.types.is_integer_dtype(df[col]):
+            dtypes[col] = 'INTEGER'
+        elif pd.api.types.is_float_dtype(df[col]):
+            dtypes[col] = 'REAL'
+        else:
+            dtypes[col] = 'TEXT'
+
+    return dtypes
+
+def _create_destination() -> dict:
+    """Create an empty `NCRN_Landbirds` replica: a main file plus one attached file per schema
+
+    PRIMARY KEY and UNIQUE constraints are kept, so the load fails on the same duplicates SQL Server would reject.
+    FOREIGN KEYs are dropped because SQLite can't enforce them across attached databases.
+    """
+    constraints = tx._field_sql_constraints(tx._preprocess_sql())
+    stub = {schema: {tbl: {'unique_vals': []} for tbl in constraints[schema].keys()} for schema in constraints.keys()}
+    constraints, stub = tx._table_sql_constraints(constraints, stub)
+
+    paths = [backends._sqlite_path('local')] + [backends._sqlite_path('local', schema) for schema in backends.DEST_SCHEMAS]
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+    con = sqlite3.connect(paths[0])
+    backends._attach_schemas(con)
+    built = {path: 0 for path in paths}
+    for schema in constraints.keys():
+        for tbl in constraints[schema].keys():
+            constraint_df = constraints[schema][tbl]['constraint_df']
+            if len(constraint_df) == 0:
+                continue
+            try:
+                con.execute(_create_tbl_sql(schema, tbl, constraint_df, stub[schema][tbl]['unique_vals']))
+                built[backends._sqlite_path('local', schema)] += 1
+            except:
+                print(f"FAIL: could not create [{schema}].[{tbl}] in the sqlite replica")
+    con.commit()
+    con.close()
+
+    return built
+
+def _create_tbl_sql(schema:str, tbl:str, constraint_df:pd.DataFrame, unique_vals:list) -> str:
+    """Translate one table's parsed constraints into SQLite DDL
+
+    Examples:
+        CREATE TABLE [lu].[ExperienceLevel] ([ID] INTEGER PRIMARY KEY, [Code] TEXT NOT NULL, ..., UNIQUE ([Code]))
+    """
+    lines = []
+    for row in constraint_df.itertuples():
+        line = f"[{row.destination}] {DEST_TYPES.get(row.fieldtype, 'TEXT')}"
+        if row.pk:
+            lines.append(line + ' PRIMARY KEY') # an INTEGER PRIMARY KEY is SQLite's rowid alias, which stands in for an IDENTITY column
+            continue
+        if not row.can_be_null and pd.isna(row.default) and row.fieldtype != 'ROWVERSION': # SQL Server fills defaults and rowversions on INSERT; SQLite would reject the NULL
+            line += ' NOT NULL'
+        lines.append(line)
+    for unique in unique_vals:
+        fields = ', '.join([f'[{x}]' for x in unique.split(',')])
+        lines.append(f'UNIQUE ({fields})')
+    sql = f"CREATE TABLE [{schema}].[{tbl}] ({', '.join(lines)})"
+
+    return sql
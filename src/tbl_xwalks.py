@@ -25,14 +25,17 @@ import pandas as pd
 import numpy as np
 import datetime as dt
 import src.db_connect as dbc
+import src.ddl as ddl
 import datetime
 import assets.assets as assets
 import warnings
 warnings.simplefilter(action='ignore', category=UserWarning)
+import hashlib
 import re
 
 TBL_XWALK = assets.TBL_XWALK
 deletes = assets.DELETES
+RECODE_AUDIT = [] # one record per rule per `_recode()` call: how many rows each rule changed; cleared by `src.make_templates._execute_xwalk_exceptions()`
 
 def _ncrn_DetectionEvent(xwalk_dict:dict) -> dict:
     """Make the crosswalk for source.tbl_Events to destination.ncrn.DetectionEvent
@@ -945,9 +948,7 @@ def _exception_lu_DistanceClass(xwalk_dict:dict) -> dict:
         '25 - 50 Meters':'26 - 50 Meters'
         ,'50 - 100 Meters': '51 - 100 Meters'
     }
-    for k,v in lookup.items():
-        mask = (xwalk_dict['lu']['DistanceClass']['source']['Distance_Text']==k)
-        xwalk_dict['lu']['DistanceClass']['source']['Distance_Text'] = np.where(mask, v, xwalk_dict['lu']['DistanceClass']['source']['Distance_Text'])
+    _recode(xwalk_dict['lu']['DistanceClass']['source'], 'Distance_Text', lookup, name='lu.DistanceClass')
 
     return xwalk_dict
 
@@ -1792,14 +1793,11 @@ def _lu_Habitat(xwalk_dict:dict) -> dict:
     return xwalk_dict
 
 
-def _exception_ncrn_DetectionEvent(xwalk_dict:dict, deletes:list) -> dict:
+def _exception_ncrn_DetectionEvent(xwalk_dict:dict, deletes:list, source_dict:dict=None) -> dict:
     """Exceptions associated with the generation of destination table ncrn.DetectionEvent"""
 
     #  EXCEPTION 1: exceptions from storing observers/recorders in long-format instead of wide-format
-    con = dbc._db_connect('access')
-    with open(r'src\qry\qry_long_event_contacts.sql', 'r') as query:
-        df = pd.read_sql_query(query.read(),con)
-    con.close()
+    df = dbc._get_extract(source_dict, 'access', 'qry_long_event_contacts')
 
     mysorts = df.groupby(['Event_ID']).size().reset_index(name='count').sort_values(['count'], ascending=True)
     double_events = mysorts[mysorts['count']>1].Event_ID.unique()
@@ -1842,10 +1840,8 @@ def _exception_ncrn_DetectionEvent(xwalk_dict:dict, deletes:list) -> dict:
     xwalk_dict['ncrn']['DetectionEvent']['source'].loc[:,'activity_start_datetime'] = pd.to_datetime(xwalk_dict['ncrn']['DetectionEvent']['source'].Date.astype(str)+' '+xwalk_dict['ncrn']['DetectionEvent']['source'].start_time.astype(str))
 
     # EXCEPTION 3: add additional rows from assets.C_DB to xwalk_dict['ncrn']['DetectionEvent']['source']
-    con = dbc._db_connect('c')
     tbl = 'tbl_Events'
-    df = dbc._exec_qry(con=con, qry=f'get_c_{tbl}')
-    con.close()
+    df = dbc._get_extract(source_dict, 'c', f'get_c_{tbl}')
     xwalk_dict['ncrn']['DetectionEvent']['source'] = pd.concat([xwalk_dict['ncrn']['DetectionEvent']['source'], df])
     mask = (xwalk_dict['ncrn']['DetectionEvent']['source']['Date'].isna()) & (xwalk_dict['ncrn']['DetectionEvent']['source'].activity_start_datetime.isna()==False)
     xwalk_dict['ncrn']['DetectionEvent']['source']['Date'] = np.where(mask, xwalk_dict['ncrn']['DetectionEvent']['source'].activity_start_datetime.dt.date, xwalk_dict['ncrn']['DetectionEvent']['source']['Date'])
@@ -1996,18 +1992,13 @@ def _exception_ncrn_DetectionEvent(xwalk_dict:dict, deletes:list) -> dict:
 
     # EXCEPTION 11: cascade update changes from deduplicating `ncrn.Contact.source.Contact_ID` in `_exception_ncrn_Contact()`
     targets = _find_erroneous_contacts(xwalk_dict)
-    for k,v in targets['lookup'].items():
-        mask = (xwalk_dict['ncrn']['DetectionEvent']['source']['observer']==k)
-        xwalk_dict['ncrn']['DetectionEvent']['source']['observer'] = np.where(mask, v, xwalk_dict['ncrn']['DetectionEvent']['source']['observer'])
-        mask = (xwalk_dict['ncrn']['DetectionEvent']['source']['recorder']==k)
-        xwalk_dict['ncrn']['DetectionEvent']['source']['recorder'] = np.where(mask, v, xwalk_dict['ncrn']['DetectionEvent']['source']['recorder'])
+    for col in ['observer', 'recorder']:
+        _recode(xwalk_dict['ncrn']['DetectionEvent']['source'], col, targets['lookup'], name='ncrn.DetectionEvent')
 
     # EXCEPTION 12: ncrn.DetectionEvent.UserCode is a non-NCRN field that we need to generate because it's required non-null
     emails = assets.EMAIL_LOOKUP
     xwalk_dict['ncrn']['DetectionEvent']['source']['UserCode'] = xwalk_dict['ncrn']['DetectionEvent']['source']['entered_by']
-    for k,v in emails.items():
-        mask = (xwalk_dict['ncrn']['DetectionEvent']['source']['UserCode'] == k)
-        xwalk_dict['ncrn']['DetectionEvent']['source']['UserCode'] = np.where(mask, v, xwalk_dict['ncrn']['DetectionEvent']['source']['UserCode'])
+    _recode(xwalk_dict['ncrn']['DetectionEvent']['source'], 'UserCode', emails, name='ncrn.DetectionEvent')
 
     # EXCEPTION 13: update birds.ncrn.DetectionEvent.source.Protocol from quasi-protocols (forest, grassland) to single protocol (ncrn landbirds)
     xwalk_dict['ncrn']['DetectionEvent']['source']['protocol_id'] = 1
@@ -2024,13 +2015,13 @@ def _exception_ncrn_BirdSpecies(xwalk_dict:dict) -> dict:
     # If there's a value in xwalk_dict['ncrn']['BirdSpecies']['source'] for an attribute but not in csv for that attribute, keep the one from source
     
     # get the best-available taxonomic info
-    csv = pd.read_csv(r'assets\db\official_BirdSpecies.csv')
+    csv = pd.read_csv(r'assets/db/official_BirdSpecies.csv')
     df = xwalk_dict['ncrn']['BirdSpecies']['source'].copy()
     df = df[[x for x in df.columns if x == 'AOU_Code' or x not in csv.columns]]
     df = csv.merge(df, on='AOU_Code', how='left')
 
     # get the best-available secondary attributes
-    csv = pd.read_csv(r'assets\db\bird_species.csv') # 'integration' [netnmidn].[BirdSpecies]
+    csv = pd.read_csv(r'assets/db/bird_species.csv') # 'integration' [netnmidn].[BirdSpecies]
     csv = csv[['Code', 'IsActive', 'IsTarget', 'SynonymID']]
     csv.rename(columns={'Code':'AOU_Code'}, inplace=True)
     df = df.merge(csv, on='AOU_Code', how='left')
@@ -2047,7 +2038,7 @@ def _exception_ncrn_BirdSpecies(xwalk_dict:dict) -> dict:
     xwalk_dict['ncrn']['BirdSpecies']['source'] = df
 
     # add rows for ncrn-specific unidentified bird codes
-    df = pd.read_excel(r'assets\birds_questions_20240215.xlsx', sheet_name='species_missing_attribute')
+    df = pd.read_excel(r'assets/birds_questions_20240215.xlsx', sheet_name='species_missing_attribute')
     newrows = df[df['RESOLUTION'].isna()].reset_index(drop=True)
     newrows.rename(columns={
         'scientific_name':'Scientific_Name'
@@ -2097,9 +2088,7 @@ def _exception_ncrn_AuditLogDetail(xwalk_dict:dict) -> dict:
     xwalk_dict['ncrn']['AuditLogDetail']['source'] = df.copy()
 
     emails = assets.EMAIL_LOOKUP
-    for k,v in emails.items():
-        mask = (xwalk_dict['ncrn']['AuditLogDetail']['source']['Contact_ID'] == k)
-        xwalk_dict['ncrn']['AuditLogDetail']['source']['Contact_ID'] = np.where(mask, v, xwalk_dict['ncrn']['AuditLogDetail']['source']['Contact_ID'])
+    _recode(xwalk_dict['ncrn']['AuditLogDetail']['source'], 'Contact_ID', emails, name='ncrn.AuditLogDetail')
 
     return xwalk_dict
 
@@ -2116,16 +2105,14 @@ def _exception_ncrn_AuditLog(xwalk_dict:dict) -> dict:
     xwalk_dict['ncrn']['AuditLog']['source'] = df.copy()
 
     emails = assets.EMAIL_LOOKUP
-    for k,v in emails.items():
-        mask = (xwalk_dict['ncrn']['AuditLog']['source']['Contact_ID'] == k)
-        xwalk_dict['ncrn']['AuditLog']['source']['Contact_ID'] = np.where(mask, v, xwalk_dict['ncrn']['AuditLog']['source']['Contact_ID'])
+    _recode(xwalk_dict['ncrn']['AuditLog']['source'], 'Contact_ID', emails, name='ncrn.AuditLog')
 
     return xwalk_dict
 
 def _exception_lu_Habitat(xwalk_dict:dict) -> dict:
     """NCRN doesn't keep this table so borrow from NETNMIDN"""
 
-    filename = r'assets\db\lu_habitat.csv'
+    filename = r'assets/db/lu_habitat.csv'
     habitat = pd.read_csv(filename)
 
     xwalk_dict['lu']['Habitat']['source'] = habitat
@@ -2264,18 +2251,11 @@ def _exception_ncrn_BirdSpeciesPark(xwalk_dict:dict) -> dict:
     # 3  | 1             | 2      | 1                 | Null
     # 4  | 2             | 2      | 1                 | Null
 
-    species = xwalk_dict['ncrn']['BirdSpecies']['source'].copy()
-    parks = xwalk_dict['ncrn']['Park']['source'].copy()
-
-    df = pd.DataFrame()
-    for park in parks.PARKCODE.unique():
-        tmp = pd.DataFrame()
-        tmp['BirdSpeciesID'] = species[['AOU_Code']].copy()
-        tmp['ParkID'] = park
-        tmp['ProtectedStatusID'] = 3
-        df = pd.concat([df, tmp])
-    df = df.reset_index()
-    df['ID'] = df['BirdSpeciesID'] + '_' + df['ParkID']
+    # `ID` stays the logical key AOU_Code_PARKCODE: `_exception_ncrn_BirdDetection()` makes `BirdSpeciesParkID` the same way, and `src.k_loads` swaps both for integers
+    species = xwalk_dict['ncrn']['BirdSpecies']['source']
+    parks = xwalk_dict['ncrn']['Park']['source']
+
+    df = _bridge(parks['PARKCODE'], species[['AOU_Code']].rename(columns={'AOU_Code':'BirdSpeciesID'}), 'ParkID', protected_status=[3], key=['BirdSpeciesID', 'ParkID'])
     df['Comment'] = np.NaN
     df = df[xwalk_dict['ncrn']['BirdSpeciesPark']['source'].columns]
 
@@ -2384,7 +2364,7 @@ def _exception_dbo_User(xwalk_dict:dict) -> dict:
     """dbo.User is a table that does not exist in source"""
     # this is an empty table for the initial database load because we have no scanned files
 
-    # df = pd.read_csv(r'assets\db\dbo_user.csv')
+    # df = pd.read_csv(r'assets/db/dbo_user.csv')
     xwalk_dict['dbo']['User']['source'] = assets.DBO_USER.copy()
 
     return xwalk_dict
@@ -2444,7 +2424,7 @@ def _dbo_User(xwalk_dict:dict) -> dict:
 
 def _exception_dbo_UserRole(xwalk_dict:dict) -> dict:
     """dbo.User is a table that does not exist in source"""
-    df = pd.read_csv(r'assets\db\dbo_userrole.csv')
+    df = pd.read_csv(r'assets/db/dbo_userrole.csv')
     xwalk_dict['dbo']['UserRole']['source'] = df.copy()
     return xwalk_dict
 
@@ -2495,15 +2475,7 @@ def _exception_ncrn_ProtocolWindCode(xwalk_dict:dict) -> dict:
     protocols = xwalk_dict['ncrn']['Protocol']['source']
     windcodes = xwalk_dict['lu']['WindCode']['source']
 
-    df = pd.DataFrame()
-    for protocol in protocols.Protocol_ID.unique():
-        windcodes2 = windcodes.copy()
-        windcodes2['ProtocolID'] = protocol
-        df = pd.concat([df, windcodes2])
-    df = df[['Wind_Code', 'ProtocolID']]
-    df = df.reset_index()
-    del df['index']
-    df['ID'] = df.index+1
+    df = _bridge(protocols['Protocol_ID'], windcodes[['Wind_Code']], 'ProtocolID')
     xwalk_dict['ncrn']['ProtocolWindCode']['source'] = df.copy()
 
     return xwalk_dict
@@ -2561,15 +2533,8 @@ def _exception_ncrn_ProtocolPrecipitationType(xwalk_dict:dict) -> dict:
     protocols = xwalk_dict['ncrn']['Protocol']['source']
     PrecipitationTypes = xwalk_dict['lu']['PrecipitationType']['source']
 
-    df = pd.DataFrame()
-    for protocol in protocols.Protocol_ID.unique():
-        PrecipitationTypes2 = PrecipitationTypes.copy()
-        PrecipitationTypes2['ProtocolID'] = protocol
-        PrecipitationTypes2['PrecipitationTypeID'] = PrecipitationTypes2['ID']
-        df = pd.concat([df, PrecipitationTypes2])
+    df = _bridge(protocols['Protocol_ID'], PrecipitationTypes[['ID']].rename(columns={'ID':'PrecipitationTypeID'}), 'ProtocolID')
     df = df[['ID', 'ProtocolID', 'PrecipitationTypeID']]
-    df.reset_index(drop=True, inplace=True)
-    df['ID'] = df.index+1
     xwalk_dict['ncrn']['ProtocolPrecipitationType']['source'] = df.copy()
 
     return xwalk_dict
@@ -2622,15 +2587,7 @@ def _exception_ncrn_ProtocolNoiseLevel(xwalk_dict:dict) -> dict:
     protocols = xwalk_dict['ncrn']['Protocol']['source']
     NoiseLevels = xwalk_dict['lu']['NoiseLevel']['source']
 
-    df = pd.DataFrame()
-    for protocol in protocols.Protocol_ID.unique():
-        NoiseLevels2 = NoiseLevels.copy()
-        NoiseLevels2['ProtocolID'] = protocol
-        df = pd.concat([df, NoiseLevels2])
-    df = df[['Disturbance_Code', 'ProtocolID']]
-    df = df.reset_index()
-    del df['index']
-    df['ID'] = df.index+1
+    df = _bridge(protocols['Protocol_ID'], NoiseLevels[['Disturbance_Code']], 'ProtocolID')
     xwalk_dict['ncrn']['ProtocolNoiseLevel']['source'] = df.copy()
 
     return xwalk_dict
@@ -2688,15 +2645,7 @@ def _exception_ncrn_ProtocolTimeInterval(xwalk_dict:dict) -> dict:
     protocols = xwalk_dict['ncrn']['Protocol']['source']
     TimeIntervals = xwalk_dict['lu']['TimeInterval']['source']
 
-    df = pd.DataFrame()
-    for protocol in protocols.Protocol_ID.unique():
-        TimeIntervals2 = TimeIntervals.copy()
-        TimeIntervals2['ProtocolID'] = protocol
-        df = pd.concat([df, TimeIntervals2])
-    df = df[['Interval', 'ProtocolID']]
-    df = df.reset_index()
-    del df['index']
-    df['ID'] = df.index+1
+    df = _bridge(protocols['Protocol_ID'], TimeIntervals[['Interval']], 'ProtocolID')
     xwalk_dict['ncrn']['ProtocolTimeInterval']['source'] = df.copy()
 
     return xwalk_dict
@@ -2748,24 +2697,14 @@ def _exception_ncrn_ProtocolDetectionType(xwalk_dict:dict) -> dict:
     protocols = xwalk_dict['ncrn']['Protocol']['source']
     DetectionTypes = xwalk_dict['lu']['DetectionType']['source']
 
-    df = pd.DataFrame()
-    for protocol in protocols.Protocol_ID.unique():
-        DetectionTypes2 = DetectionTypes.copy()
-        DetectionTypes2['ProtocolID'] = protocol
-        df = pd.concat([df, DetectionTypes2])
-    df = df[['ID_Code', 'ProtocolID']]
-    df = df.reset_index()
-    del df['index']
-    df['ID'] = df.index+1
+    df = _bridge(protocols['Protocol_ID'], DetectionTypes[['ID_Code']], 'ProtocolID')
     xwalk_dict['ncrn']['ProtocolDetectionType']['source'] = df.copy()
 
     lookup = {}
     lookup['C'] = 1
     lookup['S'] = 2
     lookup['V'] = 3
-    for k,v in lookup.items():
-        mask = (xwalk_dict['ncrn']['ProtocolDetectionType']['source']['ID_Code']==k)
-        xwalk_dict['ncrn']['ProtocolDetectionType']['source']['ID_Code'] = np.where(mask, v, xwalk_dict['ncrn']['ProtocolDetectionType']['source']['ID_Code'])
+    _recode(xwalk_dict['ncrn']['ProtocolDetectionType']['source'], 'ID_Code', lookup, name='ncrn.ProtocolDetectionType')
 
     return xwalk_dict
 
@@ -2819,15 +2758,7 @@ def _exception_ncrn_ProtocolDistanceClass(xwalk_dict:dict) -> dict:
     DistanceClasss = DistanceClasss.reset_index(drop=True, inplace=False)
     DistanceClasss['Distance_id'] = DistanceClasss.index+1
 
-    df = pd.DataFrame()
-    for protocol in protocols.Protocol_ID.unique():
-        DistanceClasss2 = DistanceClasss.copy()
-        DistanceClasss2['ProtocolID'] = protocol
-        df = pd.concat([df, DistanceClasss2])
-    df = df[['Distance_id', 'ProtocolID']]
-    df = df.reset_index()
-    del df['index']
-    df['ID'] = df.index+1
+    df = _bridge(protocols['Protocol_ID'], DistanceClasss[['Distance_id']], 'ProtocolID')
     xwalk_dict['ncrn']['ProtocolDistanceClass']['source'] = df.copy()
 
     return xwalk_dict
@@ -3106,9 +3037,7 @@ def _exception_ncrn_Contact(xwalk_dict:dict) -> dict:
     mymap['Top Dog'] = 3
     xwalk_dict['ncrn']['Contact']['source']['ExperienceLevelID'] = np.NaN
     xwalk_dict['ncrn']['Contact']['source']['Position_Title'] = xwalk_dict['ncrn']['Contact']['source']['Position_Title'].astype(str)
-    for k,v in mymap.items():
-        mask = (xwalk_dict['ncrn']['Contact']['source'].Position_Title == k)
-        xwalk_dict['ncrn']['Contact']['source']['ExperienceLevelID'] = np.where(mask, v, xwalk_dict['ncrn']['Contact']['source']['ExperienceLevelID'])
+    _recode(xwalk_dict['ncrn']['Contact']['source'], 'Position_Title', mymap, into='ExperienceLevelID', name='ncrn.Contact')
 
     # EXCEPTION 2: fill in blanks and replace erroneous `organization` values
     xwalk_dict['ncrn']['Contact']['source']['Organization'] = xwalk_dict['ncrn']['Contact']['source']['Organization'].str.upper() # make org case-insensitive
@@ -3159,30 +3088,28 @@ def _find_erroneous_contacts(xwalk_dict:dict) -> dict:
         a dictionary with two key-value pairs:
             `deletes` (pd.DataFrame): `deletes.Contact_ID` is a `ncrn.Contact.source.Contact_ID` that should be replaced by its `deletes.update_to` value in `ncrn.Contact.source` and `ncrn.DetectionEvent.source.observer` and `ncrn.DetectionEvent.source.recorder`
             `attributes` (pd.DataFrame): the combined attributes (email, phone, etc.) for all unique combinations of first and last name (i.e.,`dummy`s) containing attribute data.
+            `lookup` (dict): {`deletes.Contact_ID`: `deletes.update_to`}, for `_recode()`
+
+    Only the contacts with a duplicated name affect the result, so it's cached in `birds.context['erroneous_contacts']` keyed by a hash of those rows: `_exception_ncrn_DetectionEvent()` and `_exception_ncrn_Contact()` share one result unless `ncrn.Contact.source`'s duplicated contacts change in between.
     """
 
-    orig_contacts = xwalk_dict['ncrn']['Contact']['source'].copy()
+    orig_contacts = xwalk_dict['ncrn']['Contact']['source'][['Contact_ID', 'Last_Name', 'First_Name', 'Active_Contact', 'Email_Address', 'Work_Phone', 'Contact_Notes']].copy()
     orig_contacts['dummy'] = orig_contacts['Last_Name'] + orig_contacts['First_Name']
-    df = orig_contacts.groupby(['dummy']).size().reset_index(name='count').sort_values(['count'], ascending=False)
-    df = df[df['count']>1]
-
-    mask = (orig_contacts['dummy'].isin(df.dummy.unique()))
+    mask = (orig_contacts.groupby('dummy')['dummy'].transform('size') > 1)
     orig_contacts = orig_contacts[mask][['Contact_ID', 'dummy', 'Active_Contact', 'Email_Address', 'Work_Phone', 'Contact_Notes']]
 
-    # keep the attribute data (email, phone, etc.) regardless of which `Contact_ID` we keep
-    attribute_info = {}
-    for dummy in orig_contacts.dummy.unique():
-        attribute_info[dummy] = {}
-    for dummy in orig_contacts.dummy.unique():
-        mysub = orig_contacts[orig_contacts['dummy']==dummy]
-        emails = [x for x in mysub.Email_Address.unique() if x != None]
-        phones = [x for x in mysub.Work_Phone.unique() if x != None]
-        notes = [x for x in mysub.Contact_Notes.unique() if x != None]
-        attribute_info[dummy]['emails'] = ';'.join(set(emails))
-        attribute_info[dummy]['phones'] = ';'.join(set(phones))
-        attribute_info[dummy]['notes'] = ';'.join(set(notes))
-    attributes = pd.DataFrame(attribute_info).transpose()
-    attributes = attributes.reset_index().rename(columns={'index':'dummy'})
+    context = getattr(xwalk_dict, 'context', None)
+    key = hashlib.sha256(pd.util.hash_pandas_object(orig_contacts, index=False).values.tobytes()).hexdigest()
+    if context is not None and context.get('erroneous_contacts', {}).get('key') == key:
+        return context['erroneous_contacts']['result']
+
+    # keep the attribute data (email, phone, etc.) regardless of which `Contact_ID` we keep: each dummy's distinct non-null values, in the order they appear
+    attributes = orig_contacts[['dummy']].drop_duplicates().set_index('dummy')
+    for col, attr in [('Email_Address', 'emails'), ('Work_Phone', 'phones'), ('Contact_Notes', 'notes')]:
+        values = orig_contacts.loc[orig_contacts[col].notna(), ['dummy', col]].drop_duplicates()
+        attributes[attr] = values.groupby('dummy', sort=False)[col].agg(';'.join)
+        attributes[attr] = attributes[attr].fillna('')
+    attributes = attributes.reset_index()
 
     # Rule 1: if a `dummy` is flagged as 'active', keep that one
     keeps = orig_contacts[orig_contacts['Active_Contact']==True]
@@ -3212,20 +3139,189 @@ def _find_erroneous_contacts(xwalk_dict:dict) -> dict:
     deletes = deletes.merge(tmp_keep, on='dummy', how='left')
     deletes = deletes[['Contact_ID', 'update_to']]
 
-    lookup = {}
-    for i in range(len(deletes)):
-        lookup[deletes['Contact_ID'].values[i]] = deletes['update_to'].values[i]
+    lookup = dict(zip(deletes['Contact_ID'].values, deletes['update_to'].values))
 
     erroneous_contacts = {
         'deletes':deletes
         ,'attributes':attributes
         ,'lookup':lookup
     }
+    if context is not None:
+        context['erroneous_contacts'] = {'key':key, 'result':erroneous_contacts}
 
     return erroneous_contacts
 
 
-def _exception_ncrn_Location(xwalk_dict:dict) -> dict:
+def _recode(df:pd.DataFrame, col:str, mapping:dict, scope:tuple=None, into:str=None, name:str='') -> pd.DataFrame:
+    """Recode a column by an ordered mapping in one pass, in place
+
+    The result is the same as the loop it replaces:
+        for k,v in mapping.items():
+            mask = (df[col]==k) & df[scope[0]].isin(scope[1])
+            df[into] = np.where(mask, v, df[into])
+    i.e., the rules apply in order, so a value a rule writes is recoded again by a later rule with that key. That's why the `Sex_ID` fix is ordered {2:3, 1:2, 0:1}: no rule writes a later rule's key, so each row changes at most once.
+    Instead of one mask per rule, each key's final value is worked out on the mapping itself, and every row is matched to its key with one hash lookup.
+    The one exception is a mapping that writes strings into a non-string `col` (e.g., {1:'C', 2:'S'}): the first rule's `np.where()` turns every value into a string, which changes what later rules match, so it runs as that loop.
+    Missing values (NaN, None, NA) never match a key, as with `==`, and a nullable column (e.g., `Sex_ID`, pinned to 'Int8' by `src.db_connect.FIELD_DATA_DTYPES`) keeps its dtype if every value written fits it.
+
+    Args:
+        df (pd.DataFrame): e.g., `xwalk_dict['ncrn']['BirdDetection']['source']`; `df[col]` is replaced
+        col (str): e.g., 'Sex_ID'
+        mapping (dict): {from: to}, in the order the rules apply
+        scope (tuple, optional): (column, values): recode only the rows whose `column` is in `values` e.g., ('Event_ID', event_ids). Defaults to None, i.e., every row.
+        into (str, optional): write to this column instead, e.g., 'ExperienceLevelID' from 'Position_Title'; `col` doesn't change, so no rule recodes another's value. Defaults to None, i.e., `col`.
+        name (str, optional): the table, for the audit e.g., 'ncrn.BirdDetection'. Defaults to ''.
+
+    Returns:
+        pd.DataFrame: the audit, one row per rule: `name`, `col` (the column written), `rule` (its position), `from`, `to`, and `rows` (how many rows the rule changed); also appended to `RECODE_AUDIT`
+
+    Examples:
+        _recode(xwalk_dict['ncrn']['BirdDetection']['source'], 'Sex_ID', {2:3, 1:2, 0:1}, scope=('Event_ID', update_from_012_to_123), name='ncrn.BirdDetection')
+    """
+    into = col if into is None else into
+    rules = list(mapping.items())
+    if len(rules) == 0:
+        return pd.DataFrame(columns=['name', 'col', 'rule', 'from', 'to', 'rows'])
+    # where each key ends up, and which rules fire on the way
+    finals = []
+    paths = []
+    for i, (k, v) in enumerate(rules):
+        if into != col:
+            finals.append(v)
+            paths.append([i])
+            continue
+        val = k
+        path = []
+        for j, (rule_from, rule_to) in enumerate(rules):
+            if _recode_matches(val, rule_from):
+                val = rule_to
+                path.append(j)
+        finals.append(val)
+        paths.append(path)
+
+    # the dtype the loop's `np.where()`s would have promoted the column to
+    dtype = df[into].dtype
+    values = np.asarray(df[into])
+    probe = values[:0]
+    sequential = False
+    for _, rule_to in rules:
+        promoted = np.where(np.zeros(0, dtype=bool), rule_to, probe)
+        if into == col and promoted.dtype.kind in 'US' and probe.dtype.kind not in 'US':
+            sequential = True # e.g., {1:'C', 2:'S'} on an int column: the first rule turns every value into a string, so `2` no longer matches; only the loop itself gives that result
+            break
+        probe = promoted
+
+    if sequential:
+        in_scope = np.ones(len(df), dtype=bool) if scope is None else np.asarray(df[scope[0]].isin(scope[1]))
+        fired = []
+        for k, v in rules:
+            mask = (df[col]==k).to_numpy(dtype=bool, na_value=False) & in_scope # a nullable column compares <NA> to <NA>, not False
+            df[col] = np.where(mask, v, df[col])
+            fired.append(int(mask.sum()))
+    else:
+        keys = pd.Index([k for k, _ in rules], dtype=object)
+        pos = keys.get_indexer(np.asarray(df[col]).astype(object))
+        pos[np.asarray(pd.isna(df[col]))] = -1
+        if scope is not None:
+            pos[~np.asarray(df[scope[0]].isin(scope[1]))] = -1
+        hit = pos >= 0
+        result = values.astype(probe.dtype, copy=True)
+        replacements = np.empty(len(finals), dtype=object)
+        replacements[:] = finals
+        result[hit] = replacements[pos[hit]]
+        if isinstance(dtype, pd.api.extensions.ExtensionDtype) and not isinstance(dtype, pd.CategoricalDtype):
+            try:
+                result = pd.array(result, dtype=dtype) # e.g., 'Int8' holds <NA>, which `np.asarray()` made an object array
+            except (TypeError, ValueError):
+                pass
+        df[into] = result
+        counts = np.bincount(pos[hit], minlength=len(rules))
+        fired = np.zeros(len(rules), dtype=int)
+        for i in range(len(rules)):
+            for j in paths[i]:
+                fired[j] += counts[i]
+    audit = pd.DataFrame({'name':name, 'col':into, 'rule':range(len(rules)), 'from':[k for k, _ in rules], 'to':[v for _, v in rules], 'rows':fired})
+    RECODE_AUDIT.extend(audit.to_dict('records'))
+
+    return audit
+
+def _recode_matches(val, key) -> bool:
+    """`val == key` as a column comparison would see it: missing values match nothing"""
+    if pd.isna(val) is True or pd.isna(key) is True:
+        return False
+    try:
+        return bool(val == key)
+    except:
+        return False
+
+def _pack_notes(df:pd.DataFrame, cols:list, sep:str=';') -> pd.Series:
+    """Pack leftover source attributes into one notes string per row, e.g., 'Unit_Code:ANTI;Panel:1;Notes:nan'
+
+    Each column is formatted once, as `str()` of each of its values (so missing values read 'nan', 'None', 'NaT', or '<NA>', as they did in the original per-row loop), and the columns are joined row-wise in one pass.
+
+    Args:
+        df (pd.DataFrame): e.g., `xwalk_dict['ncrn']['Location']['source']`
+        cols (list): the columns to pack, in order
+        sep (str, optional): the separator between 'col:value' pairs. Defaults to ';'.
+
+    Returns:
+        pd.Series: one string per row of `df`, on `df`'s index
+
+    Examples:
+        source['Notes'] = _pack_notes(source, [x for x in source.columns if x not in used_cols])
+    """
+    if len(cols) == 0:
+        return pd.Series('', index=df.index, dtype=object)
+    template = sep.join([str(col).replace('{', '{{').replace('}', '}}') + ':{}' for col in cols])
+    formatted = [_format_values(df[col]) for col in cols]
+    notes = [template.format(*row) for row in zip(*formatted)]
+
+    return pd.Series(notes, index=df.index, dtype=object)
+
+def _format_values(col:pd.Series) -> list:
+    """`str()` of each value in a column, as `str(col.values[i])` would format it"""
+    values = col.values
+    if isinstance(values, np.ndarray) and (values.dtype.kind in 'iub' or values.dtype == np.float64):
+        return list(map(str, values.tolist())) # Python scalars format like their numpy counterparts, and faster
+    if not isinstance(values, np.ndarray): # e.g., Int64 or categorical columns
+        values = np.asarray(values, dtype=object)
+
+    return values.astype(str).tolist()
+
+def _bridge(outer:pd.Series, inner:pd.DataFrame, outer_col:str, protected_status:list=None, key:list=None) -> pd.DataFrame:
+    """Make a bridge table as a cross join: every row of `inner` for each unique value of `outer` (and each protected status)
+
+    The rows come out in the order the per-value `pd.concat()` loops made them: `outer`'s unique values in order of appearance, each followed by all of `inner`'s rows.
+
+    Args:
+        outer (pd.Series): e.g., `xwalk_dict['ncrn']['Protocol']['source']['Protocol_ID']`
+        inner (pd.DataFrame): the columns to repeat for each `outer` value e.g., `xwalk_dict['lu']['WindCode']['source'][['Wind_Code']]`
+        outer_col (str): the column `outer`'s values go in e.g., 'ProtocolID'
+        protected_status (list, optional): lu.ProtectedStatus.ID values; one row per status per pair, in column 'ProtectedStatusID'. Defaults to None.
+        key (list, optional): make `ID` by joining these columns with '_' (a logical key, for tables whose children reference them by it) instead of numbering the rows from 1. Defaults to None.
+
+    Returns:
+        pd.DataFrame: `inner`'s columns, `outer_col`, 'ProtectedStatusID' (if `protected_status`), and 'ID'
+
+    Examples:
+        df = _bridge(protocols['Protocol_ID'], windcodes[['Wind_Code']], 'ProtocolID')
+    """
+    df = pd.DataFrame({outer_col:outer.unique()}).merge(inner.reset_index(drop=True), how='cross')
+    cols = list(inner.columns) + [outer_col]
+    if protected_status is not None:
+        df = df.merge(pd.DataFrame({'ProtectedStatusID':protected_status}), how='cross')
+        cols.append('ProtectedStatusID')
+    df = df[cols]
+    if key is None:
+        df['ID'] = np.arange(1, len(df)+1)
+    else:
+        parts = [df[col].astype(object) for col in key] # `AOU_Code` can be the categorical pinned by `dbc.SOURCE_DTYPES`
+        df['ID'] = ['_'.join(map(str, x)) for x in zip(*parts)]
+        df.loc[np.logical_or.reduce([x.isna().values for x in parts]), 'ID'] = np.nan # as `+` would leave it
+
+    return df
+
+def _exception_ncrn_Location(xwalk_dict:dict, source_dict:dict=None) -> dict:
     """
     Clean up source.tbl_Locations
 
@@ -3245,10 +3341,8 @@ def _exception_ncrn_Location(xwalk_dict:dict) -> dict:
     """
     # 1. query additional rows from second source db, append to existing source
 
-    con = dbc._db_connect('c')
     tbl = 'tbl_Locations'
-    df = dbc._exec_qry(con=con, qry=f'get_c_{tbl}')
-    con.close()
+    df = dbc._get_extract(source_dict, 'c', f'get_c_{tbl}')
     xwalk_dict['ncrn']['Location']['source'] = pd.concat([xwalk_dict['ncrn']['Location']['source'], df])
 
     # 2. filter
@@ -3308,18 +3402,9 @@ def _exception_ncrn_Location(xwalk_dict:dict) -> dict:
     ]
     remaining_cols = [x for x in xwalk_dict['ncrn']['Location']['source'].columns if x not in used_cols]
 
-    mymap = {}
-    mymap['Location_ID'] = []
-    mymap['Notes'] = []
-    for loc in xwalk_dict['ncrn']['Location']['source'].Location_ID.unique():
-        mymap['Location_ID'].append(loc)
-        mystrings = []
-        mask = (xwalk_dict['ncrn']['Location']['source']['Location_ID']==loc)
-        for col in remaining_cols:
-            mystrings.append(f'{col}:' + str(xwalk_dict['ncrn']['Location']['source'][mask][col].values[0]))
-        mymap['Notes'].append(';'.join(mystrings))
-
-    mymap = pd.DataFrame(mymap)
+    # each `Location_ID` gets the notes of its first row
+    firsts = xwalk_dict['ncrn']['Location']['source'].drop_duplicates('Location_ID', keep='first')
+    mymap = pd.DataFrame({'Location_ID':firsts['Location_ID'].values, 'Notes':_pack_notes(firsts, remaining_cols).values})
     xwalk_dict['ncrn']['Location']['source'] = xwalk_dict['ncrn']['Location']['source'].merge(mymap, on='Location_ID', how='left')
     xwalk_dict['ncrn']['Location']['source']['GRTS_Order'] = xwalk_dict['ncrn']['Location']['source']['GRTS_Order'].astype(int).astype(str)
     mask = (xwalk_dict['ncrn']['Location']['source']['Location_ID'].isin(c_grts.keys()))
@@ -3342,16 +3427,14 @@ def _exception_ncrn_Location(xwalk_dict:dict) -> dict:
 
     return xwalk_dict
 
-def _exception_ncrn_BirdDetection(xwalk_dict:dict, deletes:list) -> dict:
+def _exception_ncrn_BirdDetection(xwalk_dict:dict, deletes:list, source_dict:dict=None) -> dict:
     """Clean up source.tbl_Field_Data
 
     1. Add additional rows from second source.tbl_Field_Data to ncrn.BirdDetection
     """
     # EXCEPTION 1: Add additional rows from second source.tbl_Field_Data to ncrn.BirdDetection
-    con = dbc._db_connect('c')
     tbl = 'tbl_Field_Data'
-    df = dbc._exec_qry(con=con, qry=f'get_c_{tbl}')
-    con.close()
+    df = dbc._get_extract(source_dict, 'c', f'get_c_{tbl}')
     xwalk_dict['ncrn']['BirdDetection']['source'] = pd.concat([xwalk_dict['ncrn']['BirdDetection']['source'], df])
 
     # EXCPETION 2: cascade delete dupliate site visits
@@ -3367,8 +3450,7 @@ def _exception_ncrn_BirdDetection(xwalk_dict:dict, deletes:list) -> dict:
     # # step 2, left-join the lookup to `ncrn.BirdDetection.source` to add the protocol column to `BirdDetection`
     # xwalk_dict['ncrn']['BirdDetection']['source'] = xwalk_dict['ncrn']['BirdDetection']['source'].merge(lookup, left_on='Event_ID', right_on='event_id', how='left')
     # step 3, replace NaNs in `ncrn.BirdDetection.source.Distance_id` it's erroneous to exclude this at data-entry...
-    mask = (xwalk_dict['ncrn']['BirdDetection']['source']['Distance_id'].isna())
-    xwalk_dict['ncrn']['BirdDetection']['source']['Distance_id'] = np.where(mask, 2, xwalk_dict['ncrn']['BirdDetection']['source']['Distance_id']) # `ncrn.BirdDetection.source.Distance_id` cannot be blank
+    xwalk_dict['ncrn']['BirdDetection']['source']['Distance_id'] = xwalk_dict['ncrn']['BirdDetection']['source']['Distance_id'].fillna(2) # `ncrn.BirdDetection.source.Distance_id` cannot be blank; `fillna()` keeps the pinned 'Int8' dtype (see `src.db_connect.FIELD_DATA_DTYPES`)
     # # step 4: make a dummy variable in `ncrn.BirdDetection.source`
     # xwalk_dict['ncrn']['BirdDetection']['source']['dummy'] = xwalk_dict['ncrn']['BirdDetection']['source']['Distance_id'].astype(int).astype(str) + '_' + xwalk_dict['ncrn']['BirdDetection']['source']['protocol_id'].astype(str)
     # # step 5, make a lookup of three columns `ncrn.ProtocolDistanceClass.ID`, `ncrn.ProtocolDistanceClass.ProtocolID`, and `ncrn.ProtocolDistanceClass.Distance_id`
@@ -3401,9 +3483,7 @@ def _exception_ncrn_BirdDetection(xwalk_dict:dict, deletes:list) -> dict:
         ,4:3
         ,5:4
     }
-    for k,v in lookup.items():
-        mask = (xwalk_dict['ncrn']['BirdDetection']['source']['Distance_id']==k)
-        xwalk_dict['ncrn']['BirdDetection']['source']['Distance_id'] = np.where(mask, v, xwalk_dict['ncrn']['BirdDetection']['source']['Distance_id'])
+    _recode(xwalk_dict['ncrn']['BirdDetection']['source'], 'Distance_id', lookup, name='ncrn.BirdDetection')
     
     # EXCEPTION 4: recode `SexID`s
     # refer to data/bird_sex_fix.py for details
@@ -3412,7 +3492,7 @@ def _exception_ncrn_BirdDetection(xwalk_dict:dict, deletes:list) -> dict:
     #     {1:"U",2:"M",3:"F"}
     #     {0:"U",1:"M",2:"F"}
     # From 2019 to present, NCRN consistently used integers to indicate bird sex: {0:"U",1:"M",2:"F"}.
-    to_correct = pd.read_csv(r'assets\db\update_sexes.csv') # a dataframe of `event_id`s, identified by `data/bird_sex_fix.py` as events that need to be changed from (0,1,2) to (1,2,3)
+    to_correct = pd.read_csv(r'assets/db/update_sexes.csv') # a dataframe of `event_id`s, identified by `data/bird_sex_fix.py` as events that need to be changed from (0,1,2) to (1,2,3)
     lookup = { # items are in this order to avoid overwriting the preceding change
         2:3 # (e.g., if you changed all `0`s to `1`s, and then changed all `1`s to `2`s, you'd also accidently be changing all `0`s to `2`s)
         ,1:2
@@ -3420,9 +3500,7 @@ def _exception_ncrn_BirdDetection(xwalk_dict:dict, deletes:list) -> dict:
     }
     # most of the birds require a straightforward shift from (0,1,2) to (1,2,3)
     update_from_012_to_123 = to_correct[to_correct['operation']=='update_from_012_to_123'].Event_ID.unique()
-    for k,v in lookup.items(): # only un-comment when all `Event_ID`s have a resolution in data/bird_sex_fix.py
-        mask = (xwalk_dict['ncrn']['BirdDetection']['source']['Event_ID'].isin(update_from_012_to_123)) & (xwalk_dict['ncrn']['BirdDetection']['source']['Sex_ID']==k)
-        xwalk_dict['ncrn']['BirdDetection']['source']['Sex_ID'] = np.where(mask, v, xwalk_dict['ncrn']['BirdDetection']['source']['Sex_ID'])
+    _recode(xwalk_dict['ncrn']['BirdDetection']['source'], 'Sex_ID', lookup, scope=('Event_ID', update_from_012_to_123), name='ncrn.BirdDetection') # only un-comment when all `Event_ID`s have a resolution in data/bird_sex_fix.py
 
     # EXCEPTION 5: birds['ncrn']['BirdDetection']['tbl_load']['ProtocolDetectionTypeID'] cannot be NULL
     # scope: 383 site visits, 6365 individual birds
@@ -3456,9 +3534,7 @@ def _exception_ncrn_BirdDetection(xwalk_dict:dict, deletes:list) -> dict:
     lookup = {}
     for x in replacements:
         lookup[x] = 'S'
-    for k,v in lookup.items():
-        mask = (xwalk_dict['ncrn']['BirdDetection']['source']['ID_Method_Code']==k)
-        xwalk_dict['ncrn']['BirdDetection']['source']['ID_Method_Code'] = np.where(mask, v, xwalk_dict['ncrn']['BirdDetection']['source']['ID_Method_Code'])
+    _recode(xwalk_dict['ncrn']['BirdDetection']['source'], 'ID_Method_Code', lookup, name='ncrn.BirdDetection')
     # step 3: recode str to int
     before_colnames = xwalk_dict['ncrn']['BirdDetection']['source'].columns
     birddetection = xwalk_dict['ncrn']['BirdDetection']['source'].copy()
@@ -3471,9 +3547,7 @@ def _exception_ncrn_BirdDetection(xwalk_dict:dict, deletes:list) -> dict:
     rev_lookup[1] = 'C'
     rev_lookup[2] = 'S'
     rev_lookup[3] = 'V'
-    for k,v in rev_lookup.items():
-        mask = (lookup['ID_Code']==k)
-        lookup['ID_Code'] = np.where(mask, v, lookup['ID_Code'])
+    _recode(lookup, 'ID_Code', rev_lookup, name='ProtocolDetectionType.pkl')
     lookup['dummy'] = lookup['ID_Code'].astype(str)  + '_' +  lookup['ProtocolID'].astype(str)
     lookup = lookup[['dummy','ID']]
     lookup.rename(columns={'ID':'dummyid'}, inplace=True)
@@ -3485,7 +3559,7 @@ def _exception_ncrn_BirdDetection(xwalk_dict:dict, deletes:list) -> dict:
     # species codes were entered wrong or have been updated since NCRN made tbl_species
     # step 1: update species codes per SME instruction: need to read in responses from `species_missing_attribute` and correct ncrn.BirdDetection.source.AOU_Code accordingly
     starters = [x for x in xwalk_dict['ncrn']['BirdDetection']['source']['AOU_Code'].unique() if x not in xwalk_dict['ncrn']['BirdSpecies']['source']['AOU_Code'].unique()]
-    df = pd.read_excel(r'assets\birds_questions_20240215.xlsx', sheet_name='species_missing_attribute')
+    df = pd.read_excel(r'assets/birds_questions_20240215.xlsx', sheet_name='species_missing_attribute')
     df['corrected_AOU'] = None
     mask = (df['RESOLUTION'].str.contains('should be changed'))
     df['corrected_AOU'] = np.where(mask, df['RESOLUTION'].str[-4:], df['corrected_AOU'])
@@ -3506,7 +3580,7 @@ def _exception_ncrn_BirdDetection(xwalk_dict:dict, deletes:list) -> dict:
     location = pd.read_pickle(r'assets/Location.pkl')
     detectionevent = detectionevent.merge(location[['Location_ID', 'Unit_Code']], left_on='location_id', right_on='Location_ID', how='left')
     df = birddetection.merge(detectionevent[['event_id','Unit_Code']], left_on='Event_ID', right_on='event_id', how='left')
-    df['AOU_Code'] = df['AOU_Code'] + '_' + df['Unit_Code']
+    df['AOU_Code'] = df['AOU_Code'].astype(object) + '_' + df['Unit_Code'] # `AOU_Code` can still be the categorical pinned by `dbc.SOURCE_DTYPES`
     xwalk_dict['ncrn']['BirdDetection']['source'] = df[before_colnames]
 
     # EXCEPTION 8: ncrn.BirdDetection.UserCode is a non-NCRN field that is non-nullable
@@ -3579,8 +3653,27 @@ def _make_pk_fk_lookup(xwalk_dict:dict) -> dict:
 
     return xwalk_dict
 
-def _add_sql_constraints(xwalk_dict:dict) -> dict:
-    """Extract constraints and params from the CREATE TABLE SQL and add to xwalk dataframe for each table"""
+def _add_sql_constraints(xwalk_dict:dict, constraints:dict=None) -> dict:
+    """Extract constraints and params from the CREATE TABLE SQL and add to xwalk dataframe for each table
+
+    Args:
+        xwalk_dict (dict): `birds`
+        constraints (dict, optional): output of `_sql_constraints()`, for the tables to update. Defaults to None, i.e., parse them for every table.
+    """
+    if constraints is None:
+        constraints = _sql_constraints(xwalk_dict)
+
+    for schema in constraints.keys():
+        for tbl in constraints[schema].keys():
+            try:
+                xwalk_dict[schema][tbl]['xwalk'] = xwalk_dict[schema][tbl]['xwalk'].merge(constraints[schema][tbl]['constraint_df'], on='destination', how='left')
+            except:
+                print(f"FAIL CONSTRAINT MERGE: birds['{schema}']['{tbl}']")
+
+    return xwalk_dict
+
+def _sql_constraints(xwalk_dict:dict) -> dict:
+    """Parse the CREATE TABLE SQL into each table's `constraint_df`, and add each table's `unique_vals` to `xwalk_dict`"""
 
     constraints = _preprocess_sql()
     constraints = _field_sql_constraints(constraints)
@@ -3592,138 +3685,65 @@ def _add_sql_constraints(xwalk_dict:dict) -> dict:
                 mask = (constraints[schema][tbl]['constraint_df']['destination'] == 'DetectionEventID')
                 constraints[schema][tbl]['constraint_df']['fk'] = np.where(mask, True, constraints[schema][tbl]['constraint_df']['fk'])
                 constraints[schema][tbl]['constraint_df']['references'] = np.where(mask, 'ncrn.DetectionEvent.ID', constraints[schema][tbl]['constraint_df']['references'])
-            try:
-                xwalk_dict[schema][tbl]['xwalk'] = xwalk_dict[schema][tbl]['xwalk'].merge(constraints[schema][tbl]['constraint_df'], on='destination', how='left')
-            except:
-                print(f"FAIL CONSTRAINT MERGE: birds['{schema}']['{tbl}']")
 
-    return xwalk_dict
+    return constraints
 
 def _preprocess_sql() -> dict:
-    """Read SQL file, break into lines, clean lines, assign lines into dictionary of tables for further processing"""
-
-    f = open(assets.CREATE_SQL, "r")
-    lines:str = f.read()
-    f.close()
-
-    tbls:list = lines.split('CREATE TABLE')
-    find:re.Pattern = re.compile(r"^([^;]*).*")
-    clean_tbls:list = []
-    for tbl in tbls:
-        clean_tbl:str = re.search(find, tbl).group(0)
-        clean_tbl:str = clean_tbl.strip().split(';', 1)[0]
-        if 'IF CREATING NEW DATABASE, START HERE' not in clean_tbl:
-            clean_tbls.append(clean_tbl)
-        
+    """Read the CREATE TABLE SQL's constraint catalog (see `src.ddl`) and assign each table's entry into a dictionary of tables for further processing"""
+
+    catalog = ddl.load_catalog()
     constraints:dict = {}
     colnames:list = ['destination','fieldtype','can_be_null','maxlen','default','pk','fk','references','maxval','minval']
-    for schema in assets.TBL_XWALK.keys():
-        constraints[schema] = {}
-        for tbl in assets.TBL_XWALK[schema].keys():
-            constraints[schema][tbl] = {
-                'all_constraints':''
-                ,'fieldwise':''
-                ,'tablewise':''
-                ,'constraint_df':pd.DataFrame(columns=colnames)
-            }
-    for schema in assets.TBL_ADDITIONS.keys():
-        if schema not in constraints.keys():
-            constraints[schema] = {}
-        for tbl in assets.TBL_ADDITIONS[schema]:
-            constraints[schema][tbl] = {
-                'all_constraints':''
-                ,'fieldwise':''
-                ,'tablewise':''
-                ,'constraint_df':pd.DataFrame(columns=colnames)
-            }
-
-    for tbl in clean_tbls:
-        splits = tbl.split('.',1)
-        schema = splits[0].replace('[','').replace(']','').strip()
-        remaining = splits[1].split(' ',1)
-        tbl_name = remaining[0].replace('[','').replace(']','').strip()
-        all_constraints = remaining[1]
-        try:
-            constraints[schema][tbl_name]['all_constraints'] = all_constraints
-        except:
-            print(f"FAIL: constraints['{schema}']['{tbl_name}']")
-
-    for schema in constraints.keys():
-        for tbl in constraints[schema].keys():
-            lines = constraints[schema][tbl]['all_constraints'].split('\n')
-            lines = [x.strip() for x in lines if x.startswith('(')==False and x.startswith(')')==False]
-            lines = [x for x in lines if x.startswith('(')==False and x.startswith(')')==False]
-            field_lines = [x for x in lines if x.startswith('CONSTRAINT')==False]
-            table_lines = [x for x in lines if x.startswith('CONSTRAINT')==True]
-            constraints[schema][tbl]['fieldwise'] = field_lines
-            constraints[schema][tbl]['tablewise'] = table_lines
+    tbls = [(schema, tbl) for schema in assets.TBL_XWALK.keys() for tbl in assets.TBL_XWALK[schema].keys()] + [(schema, tbl) for schema in assets.TBL_ADDITIONS.keys() for tbl in assets.TBL_ADDITIONS[schema]]
+    for schema, tbl in tbls:
+        constraints.setdefault(schema, {})[tbl] = {
+            'catalog':catalog['tables'].get(schema, {}).get(tbl, {'columns':[], 'primary_key':None, 'foreign_keys':[], 'unique':[], 'checks':[]})
+            ,'constraint_df':pd.DataFrame(columns=colnames)
+        }
+    for schema in catalog['tables'].keys():
+        for tbl_name in catalog['tables'][schema].keys():
+            if schema not in constraints.keys() or tbl_name not in constraints[schema].keys():
+                print(f"FAIL: constraints['{schema}']['{tbl_name}']")
 
     return constraints
 
 def _field_sql_constraints(constraints:dict) -> dict:
-    """Parse CREATE TABLE SQL into a dataframe of constraints for each field
+    """Make a dataframe of constraints for each field from its table's constraint catalog
     
     Field-constraints include:
     field type
     nullable
-    maximum length
-    default value
+    maximum length: an int for VARCHAR and CHAR (NaN for MAX), '(precision, scale)' for DECIMAL
+    default value: 'DEFAULT <expression>'
     """
             
     for schema in constraints.keys():
         for tbl in constraints[schema].keys():
-            field_lines = constraints[schema][tbl]['fieldwise']
-            fieldnames = []
-            fieldtypes = []
-            maxlens = []
-            nullbools = []
-            defaults = []
-            for field_line in field_lines:
-                fieldname = field_line.split(' ',1)[0].strip().replace('[','').replace(']','').strip()
-                fieldtype = field_line.split(' ',1)[1].strip().split(' ',1)[0].strip()
-                if fieldtype == 'BIT\t\t\tNOT':
-                    fieldtype = 'BIT'
-                if 'NOT NULL' in field_line:
-                    nullbool=False
-                else:
-                    nullbool=True
-                if fieldtype == 'VARCHAR' or fieldtype == 'CHAR':
-                    try:
-                        maxlen = re.findall(r'\(.*?\)', field_line.split(' ',1)[1].strip().split(' ',1)[1].strip())[0].replace('(','').replace(')','')
-                        if maxlen == 'MAX':
-                            maxlen = np.NaN
-                        else:
-                            maxlen = int(maxlen)
-                    except:
-                        print(field_line)
-                elif fieldtype == 'DECIMAL':
-                    tmp_chars = re.findall(r'\(.*?\)', field_line)[0].strip()
-                    maxlen = tmp_chars
-                else:
-                    maxlen = np.NaN
-                if 'DEFAULT' in field_line:
-                    try:
-                        default = re.findall(r'DEFAULT.*?,', field_line)[0].strip().rsplit(',',1)[0]
-                    except:
-                        print(f'ERROR: {field_line}')
-                else:
-                    default = np.NaN
-                fieldnames.append(fieldname)
-                nullbools.append(nullbool)
-                fieldtypes.append(fieldtype)
-                maxlens.append(maxlen)
-                defaults.append(default)
-                
-            constraints[schema][tbl]['constraint_df']['destination']=fieldnames
-            constraints[schema][tbl]['constraint_df']['fieldtype']=fieldtypes
-            constraints[schema][tbl]['constraint_df']['maxlen']=maxlens
-            constraints[schema][tbl]['constraint_df']['can_be_null']=nullbools
-            constraints[schema][tbl]['constraint_df']['default']=defaults
+            columns = constraints[schema][tbl]['catalog']['columns']
+            constraints[schema][tbl]['constraint_df']['destination']=[x['name'] for x in columns]
+            constraints[schema][tbl]['constraint_df']['fieldtype']=[x['type'] for x in columns]
+            constraints[schema][tbl]['constraint_df']['maxlen']=[_maxlen(x) for x in columns]
+            constraints[schema][tbl]['constraint_df']['can_be_null']=[x['nullable'] for x in columns]
+            constraints[schema][tbl]['constraint_df']['default']=[np.NaN if x['default'] is None else 'DEFAULT ' + x['default'] for x in columns]
 
     return constraints
 
+def _maxlen(column:dict):
+    """A catalog column's `maxlen`: an int for VARCHAR and CHAR (NaN for MAX), '(precision, scale)' for DECIMAL, else NaN"""
+    if column['type'] in ['VARCHAR', 'CHAR'] and column['params'] is not None:
+        if column['params'].strip().upper() == 'MAX':
+            return np.NaN
+        try:
+            return int(column['params'])
+        except ValueError:
+            print(f"FAIL MAXLEN: {column['name']} {column['type']} ({column['params']})")
+    elif column['type'] == 'DECIMAL' and column['params'] is not None:
+        return '(' + column['params'] + ')'
+
+    return np.NaN
+
 def _table_sql_constraints(constraints:dict, xwalk_dict:dict) -> tuple:
-    """Parse CREATE TABLE SQL into a dataframe of constraints for each table
+    """Add each table's constraints from its constraint catalog to its `constraint_df` and `unique_vals`
     
     Table constraints include:
     primary-key/foreign-key relationships
@@ -3733,95 +3753,24 @@ def _table_sql_constraints(constraints:dict, xwalk_dict:dict) -> tuple:
 
     for schema in constraints.keys():
         for tbl in constraints[schema].keys():
-            table_lines = constraints[schema][tbl]['tablewise']
-            # base cases
-            constraints[schema][tbl]['constraint_df']['pk'] = False
-            constraints[schema][tbl]['constraint_df']['fk'] = False
-            constraints[schema][tbl]['constraint_df']['references'] = None
-            constraints[schema][tbl]['constraint_df']['maxval'] = np.NaN
-            constraints[schema][tbl]['constraint_df']['minval'] = np.NaN
-            # exceptions to base cases
-            for table_line in table_lines:
-                if 'PRIMARY KEY' in table_line:
-                    pk = True
-                    try:
-                        fieldname = re.findall(r'\(.*?\)',re.findall(r'PRIMARY KEY.*?$', table_line)[0].strip())[0].split(' ',1)[0].replace('[','').replace(']','').replace('(','').replace(')','')
-                        constraints[schema][tbl]['constraint_df']['pk']=np.where((constraints[schema][tbl]['constraint_df']['destination']==fieldname),pk,constraints[schema][tbl]['constraint_df']['pk'])
-                    except:
-                        print(f"FAIL PK EXTRACT: constraints['{schema}']['{tbl}']")
-                        print(table_line)
-                if 'FOREIGN KEY' in table_line:
-                    fk = True
-                    try:
-                        fieldname = re.findall(r'FOREIGN KEY.*?REFERENCES', table_line)[0].replace('FOREIGN KEY','').replace('REFERENCES','').replace('(','').replace(')','').replace('[','').replace(']','').strip()
-                    except:
-                        print(f"FAIL FK EXTRACT: constraints['{schema}']['{tbl}']")
-                        print(table_line)
-                    try:
-                        constraints[schema][tbl]['constraint_df']['fk']=np.where((constraints[schema][tbl]['constraint_df']['destination']==fieldname),fk,constraints[schema][tbl]['constraint_df']['fk'])
-                    except:
-                        print(f"FAIL FK assign: constraints['{schema}']['{tbl}']")
-                        print(table_line)
-                    try:
-                        step1 = re.findall(r'REFERENCES.*?\)', table_line)[0]
-                        if step1.endswith(','):
-                            step1 = step1.rsplit(',',1)[0]
-                        step1 = step1.split('REFERENCES',1)[-1].strip().replace('[','').replace(']','').replace(' ','')
-                        step2 = step1.split('.')
-                        if len(step2) <3:
-                            for i in range(len(step2)):
-                                if '(' in step2[i]:
-                                    w = step2[i].split('(')
-                                    step2.pop(i)
-                                    for x in w:
-                                        step2.append(x.replace(')',''))
-                        if len(step2) == 2 and step2[0]=='Role' and step2[1]=='ID':
-                            tmp = ['dbo']
-                            for x in step2:
-                                tmp.append(x)
-                            step2 = tmp
-                            refers_to = '.'.join(step2)
-                        elif len(step2) == 2 and step2[0]=='User' and step2[1]=='ID':
-                            tmp = ['dbo']
-                            for x in step2:
-                                tmp.append(x)
-                            step2 = tmp
-                            refers_to = '.'.join(step2)
-                        elif len(step2) <3:
-                            print(f"FAIL REFERENCES EXTRACT: constraints['{schema}']['{tbl}']")
-                        else:
-                            refers_to = '.'.join(step2)
-                    except:
-                        print(f"FAIL REFERENCES EXTRACT: constraints['{schema}']['{tbl}']")
-                        print(table_line)
-                    try:
-                        constraints[schema][tbl]['constraint_df']['references']=np.where((constraints[schema][tbl]['constraint_df']['destination']==fieldname),refers_to,constraints[schema][tbl]['constraint_df']['references'])
-                    except:
-                        print(f"FAIL REFERENCES assign: constraints['{schema}']['{tbl}']")
-                        print(table_line)
-                if 'UNIQUE' in table_line:
-                    try:
-                        step1 = re.findall(r'UNIQUE.*?$', table_line)[0]
-                    except:
-                        print(f"FAIL UNIQUE parse step1: constraints['{schema}']['{tbl}']")
-                        print(table_line)
-                    try:
-                        step2 = re.findall(r'\(.*?\)',step1)[0]
-                        if step2.endswith(','):
-                            step2 = step2.rsplit(',',1)[0]
-                    except:
-                        print(f"FAIL UNIQUE parse step2: constraints['{schema}']['{tbl}']")
-                        print(table_line)
-                    try:
-                        step3 = step2.strip().replace('(','').replace(')','').strip().replace(' ','').replace('ASC','').replace('[','').replace(']','')
-                    except:
-                        print(f"FAIL UNIQUE parse step3: constraints['{schema}']['{tbl}']")
-                        print(table_line)
-                    try:
-                        xwalk_dict[schema][tbl]['unique_vals'].append(step3)
-                    except:
-                        print(f"FAIL UNIQUE append step3: constraints['{schema}']['{tbl}']")
-                        print(table_line)
+            table = constraints[schema][tbl]['catalog']
+            constraint_df = constraints[schema][tbl]['constraint_df']
+            # the first primary-key field only: `src.k_loads` expects one per table
+            pk = table['primary_key']['columns'][0] if table['primary_key'] is not None and len(table['primary_key']['columns']) > 0 else None
+            references = {}
+            for fk in table['foreign_keys']:
+                for col, ref_col in zip(fk['columns'], fk['references']['columns']):
+                    references[col] = f"{fk['references']['schema']}.{fk['references']['table']}.{ref_col}"
+            constraint_df['pk'] = (constraint_df['destination'] == pk)
+            constraint_df['fk'] = constraint_df['destination'].isin(references.keys())
+            constraint_df['references'] = np.array([references.get(x) for x in constraint_df['destination']], dtype=object)
+            constraint_df['maxval'] = np.NaN
+            constraint_df['minval'] = np.NaN
+            for unique in table['unique']:
+                try:
+                    xwalk_dict[schema][tbl]['unique_vals'].append(','.join(unique['columns']))
+                except:
+                    print(f"FAIL UNIQUE append: constraints['{schema}']['{tbl}'] {unique['name']}")
 
     return constraints,xwalk_dict
 
@@ -3832,119 +3781,71 @@ def _find_dupe_site_visits(xwalk_dict:dict) -> dict:
     Duplicate site visits occur when there are >1 ncrn.DetectionEvent.ID for a unique combination of ncrn.DetectionEvent.LocationID + ncrn.DetectionEvent.StartDateTime + ncrn.DetectionEvent.ProtocolID
     This aligns with sql:
     CONSTRAINT [UniqueLocationDate] UNIQUE NONCLUSTERED ([LocationID] ASC, [StartDateTime] ASC, [ProtocolID] ASC)
-    """
 
-    DetectionEvent = xwalk_dict['ncrn']['DetectionEvent']['source'].copy()
-    BirdDetection = xwalk_dict['ncrn']['BirdDetection']['source'].copy()
-    DetectionEvent['dummy'] = DetectionEvent['location_id'].astype(str)+DetectionEvent['Date'].astype(str)+DetectionEvent['protocol_id'].astype(str)
-    # DetectionEvent['dummy'] = DetectionEvent['location_id'].astype(str)+DetectionEvent['activity_start_datetime'].dt.date.astype(str)+DetectionEvent['protocol_id'].astype(str)
-    DetectionEvent = DetectionEvent[['event_id','dummy']]
-    BirdDetection = BirdDetection[['Event_ID']]
+    Each visit's species are reduced to one hash of its species multiset (i.e., each `AOU_Code` and how many times it was recorded) in one groupby, so visits are compared by hash instead of by sorted species lists.
 
-    tmp =DetectionEvent.groupby(['dummy']).size().reset_index(name='count').sort_values(['count'], ascending=True)
-    tmp = tmp[tmp['count']>1]
+    Returns:
+        dict: {'delete': [event_id], 'review': {dummy: {'counter': n_visits, 'DetectionEventID': [event_id]}}}
+    """
     ghosts = ['NoneNaT2','NoneNaT1']
-    tmp = tmp[tmp['dummy'].isin(ghosts)==False]
-    lookup = DetectionEvent[DetectionEvent['dummy'].isin(tmp.dummy.unique())]
-    BirdDetection = BirdDetection[BirdDetection['Event_ID'].isin(lookup.event_id.unique())]
-    BirdDetection = BirdDetection.merge(lookup, left_on='Event_ID', right_on='event_id')[['Event_ID','dummy']]
+    DetectionEvent = xwalk_dict['ncrn']['DetectionEvent']['source'][['event_id','location_id','Date','protocol_id']].copy()
+    DetectionEvent['dummy'] = DetectionEvent['location_id'].astype(str)+DetectionEvent['Date'].astype(str)+DetectionEvent['protocol_id'].astype(str)
+    BirdDetection = xwalk_dict['ncrn']['BirdDetection']['source'][['Event_ID','AOU_Code']]
+    counts = DetectionEvent.groupby('dummy')['dummy'].transform('size')
+    lookup = DetectionEvent.loc[(counts>1) & (DetectionEvent['dummy'].isin(ghosts)==False), ['event_id','dummy']].drop_duplicates()
+    visits = BirdDetection[['Event_ID']].merge(lookup, left_on='Event_ID', right_on='event_id')[['Event_ID','dummy']].drop_duplicates() # each dummy's events that recorded birds, in the order they're recorded
+    visits_by_dummy = visits.groupby('dummy', sort=False)['Event_ID'].agg(list)
+    n_visits = visits_by_dummy.map(len)
 
-    counter=0
     outcomes = {
         'delete':[]
         ,'review':{}
     }
     # CASE 1: one `DetectionEvent.dummy` has >1 `DetectionEvent.Event_ID` but we CAN determine which `DetectionEvent.Event_ID` to keep based on whether the `DetectionEvent.Event_ID` was present as a `BirdDetection.Event_ID`
-    for d in BirdDetection.dummy.unique():
-        mysub = BirdDetection[BirdDetection['dummy']==d]
-        visits = list(mysub.Event_ID.unique())
-        n_visits = len(mysub.Event_ID.unique())
-        if n_visits == 0: # if a dummy has >1 Event_ID and none of the Event_IDs recorded any bird detections, it doesn't matter which Event_ID we keep, so delete all but the [0]th
-            del_this = list(lookup[lookup['dummy']==d].event_id.unique())
-            del_this = del_this[1:]
-            for y in del_this:
-                outcomes['delete'].append(y)
-        elif n_visits == 1: # if a dummy has >1 Event_ID and only one of the Event_IDs recorded any bird detections, keep the Event_ID that logged birds and delete all others
-            del_this = list(lookup[lookup['dummy']==d].event_id.unique())
-            del_this = [x for x in del_this if x not in visits]
-            for y in del_this:
-                outcomes['delete'].append(y)
-        elif n_visits >1: # if a dummy has >1 Event_ID and each of the Event_IDs recorded bird detections, store for processing in CASE 2
-            counter+=1
-            outcomes['review'][d] = {
-                'counter': n_visits
-                ,'DetectionEventID':visits
-            }
-
-    DetectionEvent = xwalk_dict['ncrn']['DetectionEvent']['source'].copy()
-    BirdDetection = xwalk_dict['ncrn']['BirdDetection']['source'].copy()
-    DetectionEvent = DetectionEvent[DetectionEvent['event_id'].isin(outcomes['delete'])==False] # update original dataset to "look like" we already deleted the `delete`s identified in step 1, so we are reviewing the dataset at the correct "stage"
-    BirdDetection = BirdDetection[BirdDetection['Event_ID'].isin(outcomes['delete'])==False] # update original dataset to "look like" we already deleted the `delete`s identified in step 1, so we are reviewing the dataset at the correct "stage"
-    DetectionEvent['dummy'] = DetectionEvent['location_id'].astype(str)+DetectionEvent['Date'].astype(str)+DetectionEvent['protocol_id'].astype(str)
-    # DetectionEvent['dummy'] = DetectionEvent['location_id'].astype(str)+DetectionEvent['activity_start_datetime'].dt.date.astype(str)+DetectionEvent['protocol_id'].astype(str)
-    DetectionEvent = DetectionEvent[['event_id','dummy']]
-    BirdDetection = BirdDetection[['Event_ID','AOU_Code']]
-
-    tmp =DetectionEvent.groupby(['dummy']).size().reset_index(name='count').sort_values(['count'], ascending=True)
-    tmp = tmp[tmp['count']>1]
-    tmp = tmp[tmp['dummy'].isin(ghosts)==False]
-    lookup = DetectionEvent[DetectionEvent['dummy'].isin(tmp.dummy.unique())]
-    BirdDetection = BirdDetection[BirdDetection['Event_ID'].isin(lookup.event_id.unique())]
-    BirdDetection = BirdDetection.merge(lookup, left_on='Event_ID', right_on='event_id')[['Event_ID','AOU_Code','dummy']]
-
-    lookup = lookup[lookup['event_id'].isin(outcomes['delete'])==False]
-    BirdDetection = BirdDetection[BirdDetection['Event_ID'].isin(outcomes['delete'])==False]
-    DetectionEvent = DetectionEvent[(DetectionEvent['event_id'].isin(outcomes['delete'])==False)&(DetectionEvent['dummy'].isin(lookup['dummy']))]
+    # if a dummy has >1 Event_ID and only one of the Event_IDs recorded any bird detections, keep the Event_ID that logged birds and delete all others
+    # (a dummy whose Event_IDs recorded no bird detections never has a visit, so it is neither deleted nor reviewed)
+    keep = visits_by_dummy[n_visits==1].map(lambda x: x[0])
+    order = pd.Series(range(len(visits_by_dummy)), index=visits_by_dummy.index)
+    singles = lookup[lookup['dummy'].isin(keep.index)].copy()
+    singles['order'] = singles['dummy'].map(order)
+    singles = singles[singles['event_id'] != singles['dummy'].map(keep)].sort_values('order', kind='stable')
+    outcomes['delete'].extend(singles['event_id'].tolist())
+    # if a dummy has >1 Event_ID and each of the Event_IDs recorded bird detections, store for processing in CASE 2
+    for d, events in visits_by_dummy[n_visits>1].items():
+        outcomes['review'][d] = {
+            'counter': len(events)
+            ,'DetectionEventID':events
+        }
 
     # CASE 2: one `DetectionEvent.dummy` has >1 `DetectionEvent.Event_ID` but we CANNOT determine which `DetectionEvent.Event_ID` to keep based on whether the `DetectionEvent.Event_ID` was present as a `BirdDetection.Event_ID`
-    # If we can't determine which `DetectionEvent.Event_ID` to keep based on its presence/absence as a `BirdDetection.Event_ID`, subset `BirdDetection` by each `Event_ID` and compare
-    # If the subsets are identical, it doesn't matter which `Event_ID` we keep, so just keep the [0]th
-    # if the subsets are different, we have no choice but review the paper datasheet
-    for dummy in BirdDetection.dummy.unique():
-        n_records = []
-        n_unique_sp = []
-        species = []
-        dummy_subset = BirdDetection[BirdDetection['dummy']==dummy]
-        for visit in dummy_subset.Event_ID.unique():
-            visit_subset = dummy_subset[dummy_subset['Event_ID']==visit]
-            n_row = len(visit_subset) # how many rows are in the `visit`?
-            n_sp = len(visit_subset.AOU_Code.unique()) # how many unique species are in the `visit`?
-            sp = visit_subset.AOU_Code.values.tolist() # how many of each species were observed in the `visit`?
-            sp.sort()
-            n_records.append(n_row)
-            n_unique_sp.append(n_sp)
-            species.append(sp)
-        n_records = set(n_records)
-        n_unique_sp = set(n_unique_sp)
-        species = set(tuple(i) for i in species)
-        if len(n_records) == 1 and len(n_unique_sp) == 1 and len(species) == 1: # if these are all == 1, we know the subsets are identical so we just keep the [0]th `Event_ID`
-            delete = outcomes['review'][dummy]['DetectionEventID'][1:]
-            for d in delete:
-                outcomes['delete'].append(d)
-            outcomes['review'].pop(dummy)
-        else: # if any of the above != 1, we know the subsets are different, so we leave the `dummy` and its associated `Event_ID`s in the 'review' category
-            pass
+    # If the visits' species multisets are identical, it doesn't matter which `Event_ID` we keep, so just keep the [0]th
+    # if the multisets are different, we have no choice but review the paper datasheet
+    reviewed = visits[visits['dummy'].isin(outcomes['review'].keys())]
+    species = BirdDetection[BirdDetection['Event_ID'].isin(reviewed['Event_ID'])].groupby(['Event_ID','AOU_Code'], dropna=False, observed=True).size().reset_index(name='n')
+    species['hash'] = pd.util.hash_pandas_object(species[['AOU_Code','n']], index=False).values
+    visit_hash = species.groupby('Event_ID')['hash'].sum() # order-free, so it's the same for the same multiset
+    n_hashes = reviewed.assign(hash=reviewed['Event_ID'].map(visit_hash)).groupby('dummy', sort=False)['hash'].nunique()
+    same = reviewed[reviewed['dummy'].isin(n_hashes[n_hashes==1].index)]
+    multisets = {}
+    candidates = species[species['Event_ID'].isin(same['Event_ID'])]
+    for e, aou, n in zip(candidates['Event_ID'], candidates['AOU_Code'].astype(str), candidates['n']):
+        multisets.setdefault(e, []).append((aou, n)) # `species` is sorted by (Event_ID, AOU_Code), so each list is in the same order
+    for dummy in n_hashes[n_hashes==1].index:
+        events = outcomes['review'][dummy]['DetectionEventID']
+        if any([multisets[e] != multisets[events[0]] for e in events[1:]]): # a hash collision
+            continue
+        outcomes['delete'].extend(events[1:])
+        outcomes['review'].pop(dummy)
 
     # CASE 3: review the paper datasheet for each dupe identified in CASE 2 and update the dataset accordingly
     outcomedf = pd.read_excel(assets.BIRDS_RESEARCH, sheet_name='research')
     deletes = outcomedf[outcomedf['resolution']=='delete']
-
-    findkeys = [] # need to backtrace the key since I used a slightly different key format...
-    for d in outcomes['review'].keys():
-        for e in outcomes['review'][d]['DetectionEventID']:
-            if e in deletes.event_id.unique():
-                findkeys.append(d)
-    findkeys = set(findkeys)
-
-    for dummy in findkeys: # remove the key from the `review`s
-        try: # try-except because in cases where a `dummy` has >1 event to pop, pop will only work for the first attempt
-            outcomes['review'].pop(dummy)
-        except:
-            # print(dummy)
-            continue
+    researched = set(deletes.event_id.unique())
+    for dummy in [d for d in outcomes['review'].keys() if len(researched.intersection(outcomes['review'][d]['DetectionEventID'])) > 0]: # remove the key from the `review`s
+        outcomes['review'].pop(dummy)
     for e in deletes.event_id.unique(): # add the event to `delete`s
         outcomes['delete'].append(e)
-    
+
     return outcomes
 
 def _concat_deletes(xwalk_dict:dict, ghosts:list=assets.DELETES) -> list:
@@ -0,0 +1,186 @@
+"""Per-query telemetry for `src.db_connect`
+
+Every query run by `src.db_connect._run_qry()`, every snapshot-cache hit, and every failed connection is recorded in `QUERY_LOG` as a dictionary, and optionally appended as a JSON line to `TELEMETRY['jsonl']`.
+
+Query record fields:
+-event: 'query', 'cache_hit', or 'connect'
+-db, qry, backend: which query ran where
+-ok: False if the query or connection raised; `error` holds the exception
+-acquire_s: seconds to check the connection out of the pool (incl. connecting); None when the caller passed its own connection
+-execute_s: seconds in `cursor.execute()`
+-fetch_s: seconds in `cursor.fetch*()`
+-frame_s: seconds building the dataframe (pandas + dtype casts), i.e., total_s - execute_s - fetch_s
+-total_s, rows, cols, bytes: the result's size; `bytes` is approximate (deep memory usage of up to `BYTES_SAMPLE` rows, scaled up)
+"""
+import src.backends as backends
+import pandas as pd
+import threading
+import datetime
+import time
+import json
+import os
+
+TELEMETRY = {
+    'enabled': True
+    ,'jsonl': '' # filepath to append each record to as a JSON line; '' for in-memory only
+}
+QUERY_LOG = []
+BYTES_SAMPLE = 10000
+_LOCK = threading.Lock()
+_LOCAL = threading.local() # the acquire time of the connection the current thread checked out, set by `src.db_connect._pooled_connection()`
+
+class _TimedCursor:
+    """Wrap a DBAPI cursor to add the time spent in `execute()` and `fetch*()` to `timings`"""
+    def __init__(self, cursor, timings:dict):
+        self._cursor = cursor
+        self._timings = timings
+
+    def execute(self, *args, **kwargs):
+        start = time.perf_counter()
+        self._cursor.execute(*args, **kwargs)
+        self._timings['execute_s'] += time.perf_counter() - start
+        return self
+
+    def fetchall(self):
+        return self._timed_fetch(self._cursor.fetchall)
+
+    def fetchmany(self, *args):
+        return self._timed_fetch(self._cursor.fetchmany, *args)
+
+    def fetchone(self):
+        return self._timed_fetch(self._cursor.fetchone)
+
+    def _timed_fetch(self, fetch, *args):
+        start = time.perf_counter()
+        rows = fetch(*args)
+        self._timings['fetch_s'] += time.perf_counter() - start
+        return rows
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+class _TimedConnection:
+    """Wrap a DBAPI connection so `pd.read_sql_query()` gets `_TimedCursor`s"""
+    def __init__(self, con, timings:dict):
+        self._con = con
+        self._timings = timings
+
+    def cursor(self, *args, **kwargs):
+        return _TimedCursor(self._con.cursor(*args, **kwargs), self._timings)
+
+    def __getattr__(self, name):
+        return getattr(self._con, name)
+
+def _start(after_checkout:bool=True) -> dict:
+    """Start timing a query on the current thread
+
+    Args:
+        after_checkout (bool, optional): the query runs on the connection this thread just checked out, so claim its acquire time. Defaults to True.
+    """
+    acquire = None
+    if after_checkout:
+        acquire = getattr(_LOCAL, 'acquire_s', None)
+        _LOCAL.acquire_s = None # one checkout, one query's acquire time
+    return {'acquire_s':acquire, 'execute_s':0.0, 'fetch_s':0.0, 'start':time.perf_counter()}
+
+def _set_acquire(seconds:float) -> None:
+    _LOCAL.acquire_s = seconds
+
+def _record_query(db:str, qry:str, timings:dict, df:pd.DataFrame=None, error:Exception=None, event:str='query') -> dict:
+    total = time.perf_counter() - timings['start']
+    record = {
+        'event': event
+        ,'db': db
+        ,'qry': qry
+        ,'ok': error is None
+        ,'acquire_s': timings['acquire_s']
+        ,'execute_s': timings['execute_s']
+        ,'fetch_s': timings['fetch_s']
+        ,'frame_s': max(0.0, total - timings['execute_s'] - timings['fetch_s'])
+        ,'total_s': total
+        ,'rows': len(df) if df is not None else 0
+        ,'cols': len(df.columns) if df is not None else 0
+        ,'bytes': _approx_bytes(df) if df is not None else 0
+    }
+    if error is not None:
+        record['error'] = repr(error)
+
+    return _record(record)
+
+def _record_connect_failure(db:str, error:Exception) -> dict:
+    return _record({'event':'connect', 'db':db, 'qry':'', 'ok':False, 'error':repr(error)})
+
+def _record(record:dict) -> dict:
+    if not TELEMETRY['enabled']:
+        return record
+    record['backend'] = backends.BACKEND['name']
+    record['ts'] = datetime.datetime.now().isoformat()
+    with _LOCK:
+        QUERY_LOG.append(record)
+        if TELEMETRY['jsonl'] != '':
+            try:
+                if os.path.dirname(TELEMETRY['jsonl']) != '':
+                    os.makedirs(os.path.dirname(TELEMETRY['jsonl']), exist_ok=True)
+                with open(TELEMETRY['jsonl'], 'a') as f:
+                    f.write(json.dumps(record, default=str) + '\n')
+            except:
+                print(f"WARNING! Could not append query telemetry to `{TELEMETRY['jsonl']}`.")
+
+    return record
+
+def _approx_bytes(df:pd.DataFrame) -> int:
+    if len(df) <= BYTES_SAMPLE:
+        return int(df.memory_usage(deep=True, index=False).sum())
+    sample = df.iloc[:BYTES_SAMPLE]
+    return int(sample.memory_usage(deep=True, index=False).sum() * len(df) / BYTES_SAMPLE)
+
+def _configure(enabled:bool=True, jsonl:str='') -> None:
+    """Clear `QUERY_LOG` and set where the next run's records go
+
+    Args:
+        enabled (bool, optional): record at all. Defaults to True.
+        jsonl (str, optional): also append each record to this JSON-lines file. Defaults to ''.
+    """
+    TELEMETRY['enabled'] = enabled
+    TELEMETRY['jsonl'] = jsonl
+    with _LOCK:
+        QUERY_LOG.clear()
+
+def _report(records:list=None, verbose:bool=True) -> pd.DataFrame:
+    """Aggregate telemetry records by database and query
+
+    Args:
+        records (list, optional): records to aggregate, e.g., read back from a JSON-lines file. Defaults to `QUERY_LOG`.
+        verbose (bool, optional): print a summary. Defaults to True.
+
+    Returns:
+        pd.DataFrame: one row per (db, qry) with counts of queries, cache hits, and failures, and summed seconds, rows, and bytes; slowest first
+
+    Examples:
+        import src.telemetry as tel
+        report = tel._report()
+        report = tel._report([json.loads(line) for line in open('assets/query_log.jsonl')])
+    """
+    if records is None:
+        with _LOCK:
+            records = list(QUERY_LOG)
+    cols = ['acquire_s', 'execute_s', 'fetch_s', 'frame_s', 'total_s', 'rows', 'bytes']
+    if len(records) == 0:
+        return pd.DataFrame(columns=['db', 'qry', 'queries', 'cache_hits', 'failures'] + cols)
+    df = pd.DataFrame(records)
+    for col in cols:
+        if col not in df.columns:
+            df[col] = 0
+    df['queries'] = (df['event'] == 'query').astype(int)
+    df['cache_hits'] = (df['event'] == 'cache_hit').astype(int)
+    df['failures'] = (df['ok'] == False).astype(int)
+    report = df.groupby(['db', 'qry'], as_index=False)[['queries', 'cache_hits', 'failures'] + cols].sum(min_count=1)
+    report = report.sort_values('total_s', ascending=False).reset_index(drop=True)
+    if verbose:
+        totals = report[['queries', 'cache_hits', 'failures', 'execute_s', 'fetch_s', 'frame_s', 'rows', 'bytes']].sum()
+        print(f"Query telemetry: {int(totals['queries'])} queries, {int(totals['cache_hits'])} cache hits, {int(totals['failures'])} failures; {int(totals['rows'])} rows, {round(totals['bytes']/2**20, 1)} MB")
+        print(f"    execute {round(totals['execute_s'], 2)}s, fetch {round(totals['fetch_s'], 2)}s, build dataframes {round(totals['frame_s'], 2)}s")
+        for failure in df[df['ok'] == False].itertuples():
+            print(f"    FAIL: {failure.db}.{failure.qry}: {getattr(failure, 'error', '')}")
+
+    return report
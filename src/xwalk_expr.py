@@ -0,0 +1,213 @@
+"""A small expression language for the calculated crosswalk fields in `src.tbl_xwalks`
+
+Calculated fields are stored as Python statements, e.g.,
+    xwalk_dict['ncrn']['DetectionEvent']['tbl_load']['ExcludeEvent'] = np.where((xwalk_dict['ncrn']['DetectionEvent']['source']['label'].isna()), 0, 1)
+`_translate()` parses each statement into an expression tree over the table's own `source` and `tbl_load` columns, and `_execute_calculations()` evaluates every calculated field of a table in one pass and assigns them in one `DataFrame.assign()`.
+
+Expressions (nested tuples; the first item names the operation):
+-('col', frame, name): a column of `source` or `tbl_load`, e.g., `...['source']['label']` or `...['source'].label`
+-('index', frame): the row index of `source` or `tbl_load`, e.g., `...['tbl_load'].index`
+-('const', value): a constant, e.g., 1, 'NCRN', np.NaN, np.datetime64('1900-01-01')
+-('isna', x), ('astype_str', x), ('isin', x, values), ('contains', x, pattern, regex)
+-('where', condition, x, y): `np.where()`
+-('add', x, y), ('eq', x, y), ('or', x, y): `+` (numbers or string concatenation), `==`, `|`
+
+Anything else (e.g., `.str.split()`), or a reference to another table, is not translated and runs as compiled Python instead (`src.make_templates._compile_xwalk_code()`).
+"""
+import numpy as np
+import pandas as pd
+import hashlib
+import ast
+
+# translated expressions, keyed by (schema, tbl), then by (dest_col, hash of the code string); None marks a line that runs as compiled Python
+EXPRESSIONS = {}
+_FRAMES = ['source', 'tbl_load']
+
+def _execute_calculations(xwalk_dict:dict, schema:str, tbl:str, calculations:list, fallback) -> dict:
+    """Evaluate a table's calculated fields and assign them to its `tbl_load` in one batch
+
+    The fields are evaluated in crosswalk order. Before a line that can't be translated (or that reads a `tbl_load` column calculated earlier in the batch) runs, the batch so far is assigned, so every line sees the same `tbl_load` it would have seen running one statement at a time.
+
+    Args:
+        xwalk_dict (dict): `birds`
+        schema (str): e.g., 'ncrn'
+        tbl (str): e.g., 'DetectionEvent'
+        calculations (list): [(dest_col, code string)] in crosswalk order
+        fallback (function): `fallback(dest_col, code)` runs the code string as Python
+
+    Returns:
+        dict: `xwalk_dict` with `tbl_load` updated
+    """
+    pending = {}
+    for dest_col, code in calculations:
+        lines = _translate_field(schema, tbl, dest_col, code)
+        if lines is None:
+            _assign(xwalk_dict, schema, tbl, pending)
+            fallback(dest_col, code)
+            continue
+        for target, expr in lines:
+            refs = _tbl_load_refs(expr)
+            if len(pending) > 0 and (len(refs & set(pending.keys())) > 0 or '__index__' in refs):
+                _assign(xwalk_dict, schema, tbl, pending)
+            try:
+                pending[target] = _evaluate(expr, xwalk_dict[schema][tbl])
+            except Exception as e:
+                print(f"WARNING! Calculated column `dict['{schema}']['{tbl}']['tbl_load']['{target}']` failed ({type(e).__name__}: {e}). Debug `dict['{schema}']['{tbl}']['xwalk']` in src.tbl_xwalks._{schema}_{tbl}()")
+    _assign(xwalk_dict, schema, tbl, pending)
+
+    return xwalk_dict
+
+def _assign(xwalk_dict:dict, schema:str, tbl:str, pending:dict) -> None:
+    if len(pending) > 0:
+        xwalk_dict[schema][tbl]['tbl_load'] = xwalk_dict[schema][tbl]['tbl_load'].assign(**pending)
+        pending.clear()
+
+def _translate_field(schema:str, tbl:str, dest_col:str, code:str) -> list:
+    """Translate every '$splithere$'-separated line of a calculated field, or return None if any line can't be translated
+
+    Returns:
+        list: [(target column, expression)]; None if the field must run as Python
+    """
+    key = (dest_col, hashlib.sha1(code.encode('utf-8')).hexdigest())
+    cache = EXPRESSIONS.setdefault((schema, tbl), {})
+    if key not in cache.keys():
+        lines = []
+        for line in code.split('$splithere$'):
+            if line == 'placeholder':
+                continue
+            translated = _translate(line, schema, tbl)
+            if translated is None:
+                lines = None
+                break
+            lines.append(translated)
+        cache[key] = lines
+
+    return cache[key]
+
+def _translate(line:str, schema:str, tbl:str) -> tuple:
+    """Translate one statement `xwalk_dict[schema][tbl]['tbl_load'][col] = <expression>`
+
+    Returns:
+        tuple: (col, expression); None if the statement is outside the language
+    """
+    try:
+        tree = ast.parse(line.strip())
+    except SyntaxError:
+        return None
+    if len(tree.body) != 1 or not isinstance(tree.body[0], ast.Assign) or len(tree.body[0].targets) != 1:
+        return None
+    target = _frame_column(tree.body[0].targets[0], schema, tbl)
+    if target is None or target[0] != 'tbl_load':
+        return None
+    try:
+        expr = _expression(tree.body[0].value, schema, tbl)
+    except ValueError:
+        return None
+
+    return target[1], expr
+
+def _expression(node, schema:str, tbl:str) -> tuple:
+    """Translate an AST expression node; raises ValueError outside the language"""
+    column = _frame_column(node, schema, tbl)
+    if column is not None:
+        return ('col', column[0], column[1])
+    if isinstance(node, ast.Attribute) and node.attr == 'index' and _frame(node.value, schema, tbl) is not None:
+        return ('index', _frame(node.value, schema, tbl))
+    if isinstance(node, ast.Constant):
+        return ('const', node.value)
+    if isinstance(node, ast.Attribute) and _is_name(node.value, 'np') and node.attr in ['NaN', 'nan']:
+        return ('const', np.nan)
+    if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Add):
+        return ('add', _expression(node.left, schema, tbl), _expression(node.right, schema, tbl))
+    if isinstance(node, ast.BinOp) and isinstance(node.op, ast.BitOr):
+        return ('or', _expression(node.left, schema, tbl), _expression(node.right, schema, tbl))
+    if isinstance(node, ast.Compare) and len(node.ops) == 1 and isinstance(node.ops[0], ast.Eq):
+        return ('eq', _expression(node.left, schema, tbl), _expression(node.comparators[0], schema, tbl))
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute):
+        func = node.func
+        args = node.args
+        kwargs = {kw.arg: kw.value for kw in node.keywords}
+        if _is_name(func.value, 'np') and func.attr == 'where' and len(args) == 3 and len(kwargs) == 0:
+            return ('where',) + tuple([_expression(arg, schema, tbl) for arg in args])
+        if _is_name(func.value, 'np') and func.attr == 'datetime64' and len(args) == 1 and isinstance(args[0], ast.Constant) and len(kwargs) == 0:
+            return ('const', np.datetime64(args[0].value))
+        if func.attr == 'isna' and len(args) == 0 and len(kwargs) == 0:
+            return ('isna', _expression(func.value, schema, tbl))
+        if func.attr == 'astype' and len(args) == 1 and _is_name(args[0], 'str') and len(kwargs) == 0:
+            return ('astype_str', _expression(func.value, schema, tbl))
+        if func.attr == 'isin' and len(args) == 1 and isinstance(args[0], ast.List) and all(isinstance(x, ast.Constant) for x in args[0].elts) and len(kwargs) == 0:
+            return ('isin', _expression(func.value, schema, tbl), [x.value for x in args[0].elts])
+        if func.attr == 'contains' and isinstance(func.value, ast.Attribute) and func.value.attr == 'str' and len(args) == 1 and isinstance(args[0], ast.Constant) and set(kwargs.keys()) <= {'regex'}:
+            regex = kwargs.get('regex', ast.Constant(True))
+            if isinstance(regex, ast.Constant):
+                return ('contains', _expression(func.value.value, schema, tbl), args[0].value, regex.value)
+    raise ValueError(ast.dump(node))
+
+def _frame(node, schema:str, tbl:str) -> str:
+    """'source' or 'tbl_load' if `node` is `xwalk_dict[schema][tbl][frame]` for this table, else None"""
+    if not isinstance(node, ast.Subscript) or not isinstance(node.slice, ast.Constant) or node.slice.value not in _FRAMES:
+        return None
+    tbl_node = node.value
+    if not isinstance(tbl_node, ast.Subscript) or not isinstance(tbl_node.slice, ast.Constant) or tbl_node.slice.value != tbl:
+        return None
+    schema_node = tbl_node.value
+    if not isinstance(schema_node, ast.Subscript) or not isinstance(schema_node.slice, ast.Constant) or schema_node.slice.value != schema:
+        return None
+    if not _is_name(schema_node.value, 'xwalk_dict'):
+        return None
+    return node.slice.value
+
+def _frame_column(node, schema:str, tbl:str) -> tuple:
+    """(frame, column) if `node` is `xwalk_dict[schema][tbl][frame][column]` or `xwalk_dict[schema][tbl][frame].column`, else None"""
+    if isinstance(node, ast.Subscript) and isinstance(node.slice, ast.Constant) and isinstance(node.slice.value, str):
+        frame = _frame(node.value, schema, tbl)
+        if frame is not None:
+            return frame, node.slice.value
+    if isinstance(node, ast.Attribute) and not hasattr(pd.DataFrame, node.attr): # e.g., `.label`, but not `.index` or `.columns`
+        frame = _frame(node.value, schema, tbl)
+        if frame is not None:
+            return frame, node.attr
+    return None
+
+def _is_name(node, name:str) -> bool:
+    return isinstance(node, ast.Name) and node.id == name
+
+def _tbl_load_refs(expr:tuple) -> set:
+    """The `tbl_load` columns an expression reads; '__index__' if it reads the `tbl_load` index, which assigning a batch can change"""
+    if expr[0] == 'col':
+        return {expr[2]} if expr[1] == 'tbl_load' else set()
+    if expr[0] == 'index':
+        return {'__index__'} if expr[1] == 'tbl_load' else set()
+    refs = set()
+    for item in expr[1:]:
+        if isinstance(item, tuple):
+            refs.update(_tbl_load_refs(item))
+
+    return refs
+
+def _evaluate(expr:tuple, tbl_dict:dict):
+    """Evaluate an expression against one table's `source` and `tbl_load`, with the same pandas/numpy operations the Python statement would use"""
+    op = expr[0]
+    if op == 'col':
+        return tbl_dict[expr[1]][expr[2]]
+    if op == 'index':
+        return tbl_dict[expr[1]].index
+    if op == 'const':
+        return expr[1]
+    if op == 'isna':
+        return _evaluate(expr[1], tbl_dict).isna()
+    if op == 'astype_str':
+        return _evaluate(expr[1], tbl_dict).astype(str)
+    if op == 'isin':
+        return _evaluate(expr[1], tbl_dict).isin(expr[2])
+    if op == 'contains':
+        return _evaluate(expr[1], tbl_dict).str.contains(expr[2], regex=expr[3])
+    if op == 'where':
+        return np.where(_evaluate(expr[1], tbl_dict), _evaluate(expr[2], tbl_dict), _evaluate(expr[3], tbl_dict))
+    if op == 'add':
+        return _evaluate(expr[1], tbl_dict) + _evaluate(expr[2], tbl_dict)
+    if op == 'eq':
+        return _evaluate(expr[1], tbl_dict) == _evaluate(expr[2], tbl_dict)
+    if op == 'or':
+        return _evaluate(expr[1], tbl_dict) | _evaluate(expr[2], tbl_dict)
+    raise ValueError(f'Unknown crosswalk expression `{op}`')
@@ -0,0 +1,168 @@
+"""`src.ddl` (through `tbl_xwalks._sql_constraints()`) against the line-by-line CREATE TABLE parser it replaced"""
+import re
+import numpy as np
+import pandas as pd
+import pytest
+import src.ddl as ddl
+import src.tbl_xwalks as tx
+
+CREATE_SQL = """/* header comment */
+-- IF CREATING NEW DATABASE, START HERE
+CREATE TABLE [lu].[Kind] (
+\t[ID] INT IDENTITY(1,1) NOT NULL,
+\t[Code] VARCHAR (10) NOT NULL,
+\t[Label] VARCHAR (MAX) NULL,
+\t[IsActive] BIT\t\t\tNOT NULL DEFAULT ((1)),
+\t[Lat] DECIMAL (9, 6) NULL,
+\t[Rowversion] ROWVERSION NOT NULL,
+\tCONSTRAINT [PK_Kind] PRIMARY KEY CLUSTERED ([ID] ASC),
+\tCONSTRAINT [UQ_Kind] UNIQUE ([Code])
+);
+CREATE TABLE [dbo].[Role] (
+\t[ID] INT IDENTITY(1,1) NOT NULL,
+\t[Code] CHAR (4) NOT NULL,
+\tCONSTRAINT [PK_Role] PRIMARY KEY CLUSTERED ([ID] ASC)
+);
+CREATE TABLE [dbo].[UserRole] (
+\t[ID] INT IDENTITY(1,1) NOT NULL,
+\t[RoleID] INT NOT NULL,
+\t[Note] VARCHAR (200) NULL DEFAULT ('a'),
+\tCONSTRAINT [PK_UserRole] PRIMARY KEY CLUSTERED ([ID] ASC),
+\tCONSTRAINT [FK_UserRole_Role] FOREIGN KEY ([RoleID]) REFERENCES [Role] ([ID])
+);
+CREATE TABLE [ncrn].[Parent] (
+\t[ID] INT IDENTITY(1,1) NOT NULL,
+\t[Name] VARCHAR (20) NOT NULL,
+\t[KindID] INT NULL,
+\t[Start] DATETIME2 (7) NOT NULL,
+\t[Rowversion] ROWVERSION NOT NULL,
+\tCONSTRAINT [PK_Parent] PRIMARY KEY CLUSTERED ([ID] ASC),
+\tCONSTRAINT [FK_Parent_Kind] FOREIGN KEY ([KindID]) REFERENCES [lu].[Kind] ([ID]),
+\tCONSTRAINT [UniqueNameStart] UNIQUE NONCLUSTERED ([Name] ASC, [Start] ASC, [KindID] ASC),
+\tCONSTRAINT [CK_Name] CHECK (len([Name])>(0))
+);
+CREATE TABLE [ncrn].[Child] (
+\t[ID] INT IDENTITY(1,1) NOT NULL,
+\t[ParentID] INT NOT NULL,
+\t[Val] FLOAT NULL,
+\t[Note] VARCHAR (10) NULL,
+\t[Rowversion] ROWVERSION NOT NULL,
+\tCONSTRAINT [PK_Child] PRIMARY KEY CLUSTERED ([ID] ASC),
+\tCONSTRAINT [FK_Child_Parent] FOREIGN KEY ([ParentID]) REFERENCES [ncrn].[Parent] ([ID])
+);
+CREATE TABLE [ncrn].[AuditLog] (
+\t[ID] INT IDENTITY(1,1) NOT NULL,
+\t[DetectionEventID] INT NULL,
+\tCONSTRAINT [PK_AuditLog] PRIMARY KEY CLUSTERED ([ID] ASC)
+);
+"""
+TBL_XWALK = {'lu':{'Kind':'k'}, 'dbo':{'Role':'r', 'UserRole':'u'}, 'ncrn':{'Parent':'p', 'Child':'c'}}
+TBL_ADDITIONS = {'ncrn':['AuditLog']}
+COLNAMES = ['destination','fieldtype','can_be_null','maxlen','default','pk','fk','references','maxval','minval']
+
+def _sql_constraints_lines(path:str, xwalk_dict:dict) -> dict:
+    """The reference implementation: split the script on 'CREATE TABLE' and pattern-match each line"""
+    with open(path, 'r') as f:
+        lines = f.read()
+    constraints = {}
+    for schema, tbls in [(s, list(t.keys())) for s,t in TBL_XWALK.items()] + list(TBL_ADDITIONS.items()):
+        for tbl in tbls:
+            constraints.setdefault(schema, {})[tbl] = {'fieldwise':[], 'tablewise':[], 'constraint_df':pd.DataFrame(columns=COLNAMES)}
+    for tbl in lines.split('CREATE TABLE'):
+        tbl = re.search(r"^([^;]*).*", tbl).group(0).strip().split(';', 1)[0]
+        if 'IF CREATING NEW DATABASE, START HERE' in tbl:
+            continue
+        splits = tbl.split('.', 1)
+        schema = splits[0].replace('[','').replace(']','').strip()
+        tbl_name, all_constraints = splits[1].split(' ', 1)
+        tbl_lines = [x.strip() for x in all_constraints.split('\n') if x.startswith('(')==False and x.startswith(')')==False]
+        constraints[schema][tbl_name.replace('[','').replace(']','').strip()].update({
+            'fieldwise':[x for x in tbl_lines if x.startswith('CONSTRAINT')==False]
+            ,'tablewise':[x for x in tbl_lines if x.startswith('CONSTRAINT')==True]
+        })
+
+    for schema in constraints.keys():
+        for tbl in constraints[schema].keys():
+            rows = []
+            for field_line in constraints[schema][tbl]['fieldwise']:
+                fieldname = field_line.split(' ',1)[0].strip().replace('[','').replace(']','').strip()
+                fieldtype = field_line.split(' ',1)[1].strip().split(' ',1)[0].strip()
+                if fieldtype == 'BIT\t\t\tNOT':
+                    fieldtype = 'BIT'
+                if fieldtype == 'VARCHAR' or fieldtype == 'CHAR':
+                    maxlen = re.findall(r'\(.*?\)', field_line.split(' ',1)[1].strip().split(' ',1)[1].strip())[0].replace('(','').replace(')','')
+                    maxlen = np.nan if maxlen == 'MAX' else int(maxlen)
+                elif fieldtype == 'DECIMAL':
+                    maxlen = re.findall(r'\(.*?\)', field_line)[0].strip()
+                else:
+                    maxlen = np.nan
+                default = re.findall(r'DEFAULT.*?,', field_line)[0].strip().rsplit(',',1)[0] if 'DEFAULT' in field_line else np.nan
+                rows.append((fieldname, fieldtype, maxlen, 'NOT NULL' not in field_line, default))
+            df = constraints[schema][tbl]['constraint_df']
+            for i, col in enumerate(['destination','fieldtype','maxlen','can_be_null','default']):
+                df[col] = [x[i] for x in rows]
+            df['pk'] = False
+            df['fk'] = False
+            df['references'] = None
+            df['maxval'] = np.nan
+            df['minval'] = np.nan
+            for table_line in constraints[schema][tbl]['tablewise']:
+                if 'PRIMARY KEY' in table_line:
+                    fieldname = re.findall(r'\(.*?\)',re.findall(r'PRIMARY KEY.*?$', table_line)[0].strip())[0].split(' ',1)[0].replace('[','').replace(']','').replace('(','').replace(')','')
+                    df['pk'] = np.where(df['destination']==fieldname, True, df['pk'])
+                if 'FOREIGN KEY' in table_line:
+                    fieldname = re.findall(r'FOREIGN KEY.*?REFERENCES', table_line)[0].replace('FOREIGN KEY','').replace('REFERENCES','').replace('(','').replace(')','').replace('[','').replace(']','').strip()
+                    df['fk'] = np.where(df['destination']==fieldname, True, df['fk'])
+                    step1 = re.findall(r'REFERENCES.*?\)', table_line)[0]
+                    step1 = step1.split('REFERENCES',1)[-1].strip().replace('[','').replace(']','').replace(' ','')
+                    step2 = step1.split('.')
+                    if len(step2) < 3:
+                        w = step2.pop(-1).split('(')
+                        step2 += [x.replace(')','') for x in w]
+                    if len(step2) == 2 and step2[0] in ['Role','User'] and step2[1] == 'ID':
+                        step2 = ['dbo'] + step2
+                    df['references'] = np.where(df['destination']==fieldname, '.'.join(step2), df['references'])
+                if 'UNIQUE' in table_line:
+                    step2 = re.findall(r'\(.*?\)', re.findall(r'UNIQUE.*?$', table_line)[0])[0]
+                    xwalk_dict[schema][tbl]['unique_vals'].append(step2.strip().replace('(','').replace(')','').strip().replace(' ','').replace('ASC','').replace('[','').replace(']',''))
+            if schema == 'ncrn' and tbl == 'AuditLog':
+                mask = (df['destination'] == 'DetectionEventID')
+                df['fk'] = np.where(mask, True, df['fk'])
+                df['references'] = np.where(mask, 'ncrn.DetectionEvent.ID', df['references'])
+
+    return constraints
+
+def _stub() -> dict:
+    return {schema:{tbl:{'unique_vals':[]} for tbl in list(TBL_XWALK.get(schema, {}))+TBL_ADDITIONS.get(schema, [])} for schema in set(TBL_XWALK)|set(TBL_ADDITIONS)}
+
+@pytest.fixture
+def create_sql(tmp_path, monkeypatch):
+    path = tmp_path / 'create.sql'
+    path.write_text(CREATE_SQL)
+    monkeypatch.setattr(tx.assets, 'CREATE_SQL', str(path), raising=False)
+    monkeypatch.setattr(tx.assets, 'TBL_XWALK', TBL_XWALK, raising=False)
+    monkeypatch.setattr(tx.assets, 'TBL_ADDITIONS', TBL_ADDITIONS, raising=False)
+    monkeypatch.setattr(ddl, '_CATALOGS', {})
+
+    return str(path)
+
+@pytest.mark.parametrize('cached', [False, True])
+def test_sql_constraints_match_line_parser(create_sql, cached):
+    expected_xwalk, result_xwalk = _stub(), _stub()
+    expected = _sql_constraints_lines(create_sql, expected_xwalk)
+    if cached: # the second run reads `<script>.catalog.json` instead of parsing
+        tx._sql_constraints(_stub())
+        ddl._CATALOGS.clear()
+    result = tx._sql_constraints(result_xwalk)
+    for schema in expected.keys():
+        for tbl in expected[schema].keys():
+            pd.testing.assert_frame_equal(result[schema][tbl]['constraint_df'], expected[schema][tbl]['constraint_df'], obj=f'{schema}.{tbl}')
+    assert result_xwalk == expected_xwalk
+
+def test_catalog_is_cached_next_to_the_script(create_sql):
+    catalog = ddl.load_catalog()
+    ddl._CATALOGS.clear()
+    assert ddl.load_catalog() == catalog
+    with open(ddl.catalog_path(create_sql), 'r') as f:
+        assert f'"sha256": "{catalog["sha256"]}"' in f.read()
+    assert catalog['tables']['dbo']['UserRole']['foreign_keys'][0]['references'] == {'schema':'dbo', 'table':'Role', 'columns':['ID']}
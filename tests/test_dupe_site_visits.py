@@ -0,0 +1,102 @@
+"""`tbl_xwalks._find_dupe_site_visits()` against the per-dummy loops it replaced"""
+import numpy as np
+import pandas as pd
+import pytest
+import src.birds as bd
+import src.tbl_xwalks as tx
+
+RESEARCH = pd.DataFrame({'event_id':[7, 10, 9999], 'resolution':['delete', 'keep', 'delete']})
+
+def _find_dupe_site_visits_loop(xwalk_dict:dict) -> dict:
+    """The reference implementation: subset `BirdDetection` once per dummy and once per visit"""
+    ghosts = ['NoneNaT2','NoneNaT1']
+    def _stage(DetectionEvent:pd.DataFrame, BirdDetection:pd.DataFrame, cols:list) -> tuple:
+        DetectionEvent = DetectionEvent.copy()
+        DetectionEvent['dummy'] = DetectionEvent['location_id'].astype(str)+DetectionEvent['Date'].astype(str)+DetectionEvent['protocol_id'].astype(str)
+        DetectionEvent = DetectionEvent[['event_id','dummy']]
+        tmp = DetectionEvent.groupby(['dummy']).size().reset_index(name='count')
+        tmp = tmp[(tmp['count']>1) & (tmp['dummy'].isin(ghosts)==False)]
+        lookup = DetectionEvent[DetectionEvent['dummy'].isin(tmp.dummy.unique())]
+        BirdDetection = BirdDetection[BirdDetection['Event_ID'].isin(lookup.event_id.unique())]
+        BirdDetection = BirdDetection.merge(lookup, left_on='Event_ID', right_on='event_id')[cols+['dummy']]
+        return lookup, BirdDetection
+
+    outcomes = {'delete':[], 'review':{}}
+    # CASE 1
+    lookup, BirdDetection = _stage(xwalk_dict['ncrn']['DetectionEvent']['source'], xwalk_dict['ncrn']['BirdDetection']['source'], ['Event_ID'])
+    for d in BirdDetection.dummy.unique():
+        visits = list(BirdDetection[BirdDetection['dummy']==d].Event_ID.unique())
+        if len(visits) == 1:
+            outcomes['delete'].extend([x for x in lookup[lookup['dummy']==d].event_id.unique() if x not in visits])
+        elif len(visits) > 1:
+            outcomes['review'][d] = {'counter': len(visits), 'DetectionEventID': visits}
+
+    # CASE 2
+    DetectionEvent = xwalk_dict['ncrn']['DetectionEvent']['source']
+    BirdDetection = xwalk_dict['ncrn']['BirdDetection']['source']
+    DetectionEvent = DetectionEvent[DetectionEvent['event_id'].isin(outcomes['delete'])==False]
+    BirdDetection = BirdDetection[BirdDetection['Event_ID'].isin(outcomes['delete'])==False]
+    lookup, BirdDetection = _stage(DetectionEvent, BirdDetection, ['Event_ID','AOU_Code'])
+    for dummy in BirdDetection.dummy.unique():
+        dummy_subset = BirdDetection[BirdDetection['dummy']==dummy]
+        species = set()
+        for visit in dummy_subset.Event_ID.unique():
+            species.add(tuple(sorted(dummy_subset[dummy_subset['Event_ID']==visit].AOU_Code.values.tolist())))
+        if len(species) == 1:
+            outcomes['delete'].extend(outcomes['review'][dummy]['DetectionEventID'][1:])
+            outcomes['review'].pop(dummy)
+
+    # CASE 3
+    deletes = RESEARCH[RESEARCH['resolution']=='delete']
+    for dummy in [d for d in outcomes['review'].keys() if any([e in deletes.event_id.unique() for e in outcomes['review'][d]['DetectionEventID']])]:
+        outcomes['review'].pop(dummy)
+    outcomes['delete'].extend(deletes.event_id.unique())
+
+    return outcomes
+
+def _make(n_ev:int, seed:int) -> bd.Birds:
+    """Visits that collide on location + date + protocol, about half of which repeat their first visit's species"""
+    rs = np.random.default_rng(seed)
+    de = pd.DataFrame({
+        'event_id': np.arange(n_ev)*3+7
+        ,'location_id': rs.choice([f'L{i}' for i in range(max(n_ev//3, 2))], n_ev)
+        ,'Date': rs.choice(pd.date_range('2010-01-01', periods=3).date, n_ev)
+        ,'protocol_id': rs.integers(1, 3, n_ev)
+    })
+    de.loc[rs.random(n_ev)<.03, 'location_id'] = None
+    base = {e: list(rs.choice(['AMRO','NOCA','BLJA','CARW','AMRO'], rs.integers(1, 5))) for e in de.event_id}
+    first = de.groupby(['location_id','Date','protocol_id'], dropna=False)['event_id'].transform('first')
+    rows = []
+    for e, f in zip(de.event_id, first):
+        r = rs.random()
+        if r < .3:
+            continue
+        rows += [(e, s) for s in (base[f] if r < .7 else base[e])]
+    bdt = pd.DataFrame(rows, columns=['Event_ID','AOU_Code']).sample(frac=1, random_state=seed).reset_index(drop=True)
+
+    return bd.Birds({'ncrn':{'DetectionEvent':bd.BirdsTable({'source':de}), 'BirdDetection':bd.BirdsTable({'source':bdt})}})
+
+def _normalize(outcomes:dict) -> dict:
+    return {
+        'delete': [int(x) for x in outcomes['delete']]
+        ,'review': [(k, v['counter'], [int(x) for x in v['DetectionEventID']]) for k,v in outcomes['review'].items()]
+    }
+
+@pytest.fixture(autouse=True)
+def _research(monkeypatch):
+    monkeypatch.setattr(tx.assets, 'BIRDS_RESEARCH', 'research.xlsx', raising=False)
+    monkeypatch.setattr(tx.pd, 'read_excel', lambda *args, **kwargs: RESEARCH.copy())
+
+@pytest.mark.parametrize('seed', range(20))
+def test_find_dupe_site_visits_matches_loop(seed):
+    birds = _make(300, seed)
+    expected = _find_dupe_site_visits_loop(birds)
+    assert _normalize(tx._find_dupe_site_visits(birds)) == _normalize(expected)
+
+def test_find_dupe_site_visits_keeps_visit_with_birds():
+    de = pd.DataFrame({'event_id':[1, 2, 3], 'location_id':['L1']*3, 'Date':['2020-01-01']*3, 'protocol_id':[1]*3})
+    bdt = pd.DataFrame({'Event_ID':[2, 2], 'AOU_Code':['AMRO','NOCA']})
+    birds = bd.Birds({'ncrn':{'DetectionEvent':bd.BirdsTable({'source':de}), 'BirdDetection':bd.BirdsTable({'source':bdt})}})
+    outcomes = tx._find_dupe_site_visits(birds)
+    assert _normalize(outcomes) == _normalize(_find_dupe_site_visits_loop(birds))
+    assert [int(x) for x in outcomes['delete']][:2] == [1, 3]
@@ -0,0 +1,80 @@
+"""`incremental._merge()` of a previous snapshot and a delta against a full extraction of the same data"""
+import numpy as np
+import pandas as pd
+import pytest
+import src.incremental as inc
+
+def _field_data() -> pd.DataFrame:
+    """`get_tbl_field_data` in `Data_ID` order, as a full extraction returns it"""
+    return pd.DataFrame({
+        'Data_ID': [1, 2, 3, 4, 5, 6]
+        ,'Event_ID': ['A', 'A', 'B', 'B', 'C', 'C']
+        ,'AOU_Code': ['AMRO', 'NOCA', 'BLJA', 'CARW', 'AMRO', 'AMRO']
+    })
+
+def _delta(full:pd.DataFrame, events:list) -> pd.DataFrame:
+    """What `_read_delta()` reads: every current row of the events the delta predicate matches"""
+    return full[full['Event_ID'].isin(events)].reset_index(drop=True)
+
+def _check(previous:pd.DataFrame, full:pd.DataFrame, events:list, logged_keys:set=None, logged_rows:set=None) -> None:
+    merged = inc._merge(previous, _delta(full, events), key='Event_ID', row_key='Data_ID', logged_keys=logged_keys, logged_rows=logged_rows)
+    pd.testing.assert_frame_equal(merged, full.reset_index(drop=True))
+
+def test_merge_changed_rows():
+    previous = _field_data()
+    full = previous.copy()
+    full.loc[full['Data_ID']==3, 'AOU_Code'] = 'TUTI'
+    _check(previous, full, ['B'])
+
+def test_merge_new_rows_and_events():
+    previous = _field_data()
+    full = pd.concat([previous, pd.DataFrame({'Data_ID':[7, 8, 9], 'Event_ID':['A', 'D', 'D'], 'AOU_Code':['EAPH', 'AMRO', 'BLJA']})])
+    _check(previous, full, ['A', 'D'])
+
+def test_merge_deleted_child_row_of_changed_event():
+    previous = _field_data()
+    full = previous[previous['Data_ID']!=2]
+    _check(previous, full, ['A'])
+
+def test_merge_logged_deletes():
+    previous = _field_data()
+    full = previous[(previous['Data_ID']!=4) & (previous['Event_ID']!='C')] # row 4 and all of event C are gone, so neither is in the delta
+    _check(previous, full, [], logged_keys={'C'}, logged_rows={'4'})
+
+def test_merge_without_logged_deletes_keeps_stale_rows():
+    previous = _field_data()
+    full = previous[previous['Data_ID']!=4]
+    merged = inc._merge(previous, _delta(full, []), key='Event_ID', row_key='Data_ID')
+    assert list(merged['Data_ID']) == [1, 2, 3, 4, 5, 6] # what the module docstring's limitation is about
+
+def test_merge_numeric_keys_against_logged_strings():
+    previous = pd.DataFrame({'event_id':[10, 11, 12], 'location_id':['L1', 'L2', 'L3']})
+    full = previous[previous['event_id']!=11]
+    merged = inc._merge(previous, full.iloc[0:0], key='event_id', row_key='event_id', logged_keys={'11'})
+    pd.testing.assert_frame_equal(merged, full.reset_index(drop=True))
+
+@pytest.mark.parametrize('seed', range(30))
+def test_merge_matches_full_extract_random(seed):
+    rs = np.random.default_rng(seed)
+    n = 60
+    previous = pd.DataFrame({
+        'Data_ID': np.arange(1, n+1)
+        ,'Event_ID': np.sort(rs.integers(0, 15, n)).astype(str)
+        ,'Count': rs.integers(1, 5, n)
+    })
+    full = previous.copy()
+    # edits, logged by `Data_ID`
+    edited = rs.choice(full['Data_ID'], 5, replace=False)
+    full.loc[full['Data_ID'].isin(edited), 'Count'] += 10
+    # deleted rows, logged by `Data_ID`, and deleted events, logged by `Event_ID`
+    deleted_rows = set(rs.choice(full['Data_ID'], 4, replace=False).tolist())
+    deleted_events = set(rs.choice(full['Event_ID'].unique(), 2, replace=False).tolist())
+    full = full[(full['Data_ID'].isin(deleted_rows)==False) & (full['Event_ID'].isin(deleted_events)==False)]
+    # new rows for old and new events; a new event's Entered_Date is after the high-water mark
+    new_events = ['15', '16']
+    new = pd.DataFrame({'Data_ID': np.arange(n+1, n+9), 'Event_ID': rs.choice(full['Event_ID'].unique().tolist()+new_events, 8), 'Count': 1})
+    new = new.sort_values('Data_ID')
+    full = pd.concat([full, new]).reset_index(drop=True)
+    logged_rows = set(edited.tolist()) | deleted_rows | set(new['Data_ID'].tolist())
+    events = set(new_events) | set(full.loc[full['Data_ID'].isin(logged_rows), 'Event_ID']) # `_FIELD_DATA_WHERE`: an event with a logged row that still exists
+    _check(previous, full, sorted(events), logged_keys=deleted_events, logged_rows={str(x) for x in logged_rows})
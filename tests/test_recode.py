@@ -0,0 +1,70 @@
+"""`tbl_xwalks._recode()` against the one-mask-per-rule loop it replaced"""
+import numpy as np
+import pandas as pd
+import pytest
+import src.tbl_xwalks as tx
+
+def _recode_loop(df:pd.DataFrame, col:str, mapping:dict, scope:tuple=None, into:str=None) -> None:
+    """The reference implementation: one `np.where()` per rule, in order"""
+    into = col if into is None else into
+    for k,v in mapping.items():
+        mask = (df[col]==k)
+        if scope is not None:
+            mask = mask & df[scope[0]].isin(scope[1])
+        df[into] = np.where(mask.to_numpy(dtype=bool, na_value=False), v, df[into]) # a nullable column compares <NA> to <NA>, not False
+
+CASES = {
+    'scoped Sex_ID fix': (pd.DataFrame({'a':[0,1,2,2,1,0,3]*3, 'e':list(range(21))}), 'a', {2:3, 1:2, 0:1}, ('e', [1,2,3,4,5,10]), None)
+    ,'chained rules': (pd.DataFrame({'a':[0,1,2,2,1,0,3]*3}), 'a', {0:1, 1:2, 2:3}, None, None)
+    ,'floats with NaN': (pd.DataFrame({'a':[3.0,4.0,5.0,np.nan,1.0]}), 'a', {3:2, 4:3, 5:4}, None, None)
+    ,'strings with missing values': (pd.DataFrame({'a':['x','y',None,np.nan,'z','x']}), 'a', {'x':'a@b', 'y':'c@d', 'nope':'q'}, None, None)
+    ,'ints to strings': (pd.DataFrame({'a':[1,2,3,1]}), 'a', {1:'C', 2:'S', 3:'V'}, None, None)
+    ,'into another column': (pd.DataFrame({'a':['Crew Leader','None','nan','Top Dog'], 'b':np.nan}), 'a', {'Crew Leader':3, 'None':1, 'Top Dog':3}, None, 'b')
+    ,'cycle': (pd.DataFrame({'a':['A','B','A','C']}), 'a', {'A':'B', 'B':'C', 'C':'A'}, None, None)
+    ,'empty mapping': (pd.DataFrame({'a':[1,2]}), 'a', {}, None, None)
+}
+
+@pytest.mark.parametrize('case', CASES.keys())
+def test_recode_matches_loop(case):
+    df, col, mapping, scope, into = CASES[case]
+    expected = df.copy()
+    _recode_loop(expected, col, mapping, scope, into)
+    result = df.copy()
+    tx._recode(result, col, mapping, scope=scope, into=into, name='test')
+    pd.testing.assert_frame_equal(result, expected)
+
+def test_recode_keeps_nullable_dtype():
+    df = pd.DataFrame({'Sex_ID': pd.array([0, 1, 2, None, 2], dtype='Int8')})
+    expected = df.copy()
+    _recode_loop(expected, 'Sex_ID', {2:3, 1:2, 0:1})
+    tx._recode(df, 'Sex_ID', {2:3, 1:2, 0:1})
+    assert df['Sex_ID'].dtype == 'Int8'
+    pd.testing.assert_series_equal(df['Sex_ID'], expected['Sex_ID'].astype('Int8'))
+
+def test_recode_audit_counts_every_rule_a_row_passes():
+    df = pd.DataFrame({'a':[0, 1, 2, 0]})
+    audit = tx._recode(df, 'a', {0:1, 1:2}, name='test')
+    assert list(audit['rows']) == [2, 3] # both 0s become 1, then those and the original 1 become 2
+
+@pytest.mark.parametrize('trial', range(60))
+def test_recode_matches_loop_random(trial):
+    rs = np.random.default_rng(trial)
+    n = 200
+    kind = trial % 3
+    if kind == 0:
+        vals = rs.integers(0, 6, n).astype(float)
+        vals[rs.random(n) < .1] = np.nan
+    elif kind == 1:
+        vals = rs.integers(0, 6, n)
+    else:
+        vals = np.array(rs.choice(list('abcdef'), n), dtype=object)
+        vals[rs.random(n) < .1] = None
+    pool = list(range(6)) if kind < 2 else list('abcdef')
+    keys = [pool[int(i)] for i in rs.permutation(len(pool))[:rs.integers(1, 6)]]
+    mapping = {k: pool[int(rs.integers(0, 6))] for k in keys}
+    df = pd.DataFrame({'a':vals, 'e':rs.integers(0, 20, n)})
+    scope = ('e', list(range(10))) if trial % 2 else None
+    expected = df.copy()
+    _recode_loop(expected, 'a', mapping, scope)
+    tx._recode(df, 'a', mapping, scope=scope)
+    pd.testing.assert_frame_equal(df, expected)
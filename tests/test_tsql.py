@@ -0,0 +1,66 @@
+"""`make_templates._tsql_text()` against the row-by-row formatting it replaced"""
+import decimal
+import numpy as np
+import pandas as pd
+import pytest
+import src.make_templates as mt
+
+def _tsql_text_iterrows(df:pd.DataFrame, schema:str, tbl:str) -> str:
+    """The reference implementation: one `str(tuple(row.values))` per row"""
+    prefix = mt._tsql_prefix(df, schema, tbl)
+    sql_texts = []
+    for index, row in df.iterrows():
+        line = prefix + str(tuple(row.values))
+        for k,v in mt.TSQL_NONSENSE.items():
+            line = line.replace(k,v)
+        sql_texts.append(line)
+
+    return '\n'.join(sql_texts)
+
+def _mixed() -> tuple:
+    df = pd.DataFrame({
+        'ID': pd.Series([1, 2, 3, 4, 5], dtype=object)
+        ,'Name': ["o'x", 'back\\slash', 'café', 'NULL', None]
+        ,'Group': ['a', 'b', 'nan', 'd', '"quoted"']
+        ,'Val': pd.Series([1.25, np.nan, 3.0, None, 5.5], dtype=object)
+        ,'Flag': pd.Series([True, False, None, True, False], dtype=object)
+        ,'Visited': ['2020-01-01 00:00:00', '2021-06-30 12:30:00', None, '2022-12-31 23:59:59', 'NULL']
+    })
+    fieldtypes = {'ID':'INT', 'Name':'VARCHAR', 'Group':'VARCHAR', 'Val':'FLOAT', 'Flag':'BIT', 'Visited':'DATETIME'}
+
+    return df, fieldtypes
+
+def _numeric() -> tuple:
+    df = pd.DataFrame({'ID': np.arange(1, 6), 'Order': np.arange(5, 0, -1)})
+
+    return df, {'ID':'INT', 'Order':'INT'}
+
+def _floats() -> tuple:
+    df = pd.DataFrame({'Lat': [38.9, np.nan, 39.123456789, -77.0, 0.1]})
+
+    return df, {'Lat':'FLOAT'}
+
+def _unformatted() -> tuple:
+    df = pd.DataFrame({
+        'ID': pd.Series([1, 2, 3], dtype=object)
+        ,'Temperature': [decimal.Decimal('12.50'), None, decimal.Decimal('-3.25')]
+        ,'Entered': [pd.Timestamp('2020-01-01 08:00'), pd.NaT, pd.Timestamp('2021-02-03')]
+        ,'Count': pd.array([1, None, 3], dtype='Int64')
+    })
+
+    return df, {'ID':'INT', 'Temperature':'DECIMAL', 'Entered':'DATETIME2'}
+
+@pytest.mark.parametrize('make', [_mixed, _numeric, _floats, _unformatted])
+@pytest.mark.parametrize('typed', [True, False])
+def test_tsql_text_matches_iterrows(make, typed):
+    df, fieldtypes = make()
+    expected = _tsql_text_iterrows(df, 'ncrn', 'BirdDetection')
+    assert mt._tsql_text(df, 'ncrn', 'BirdDetection', fieldtypes if typed else None) == expected
+
+def test_tsql_text_one_column():
+    df = pd.DataFrame({'Code': ['A', "B'"]})
+    assert mt._tsql_text(df, 'lu', 'Sex', {'Code':'VARCHAR'}) == _tsql_text_iterrows(df, 'lu', 'Sex')
+
+def test_tsql_text_empty():
+    df = pd.DataFrame(columns=['ID', 'Code'])
+    assert mt._tsql_text(df, 'lu', 'Sex') == _tsql_text_iterrows(df, 'lu', 'Sex') == ''